@@ -0,0 +1,202 @@
+import sys
+from array import array
+
+# predefined symbols of the Hack assembly language
+PREDEFINED_SYMBOLS = {"SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4, "SCREEN": 16384, "KBD": 24576}
+for _register in range(16):
+    PREDEFINED_SYMBOLS["R" + str(_register)] = _register
+
+# a bit and the six c bits of every computation. D+M etc. are also accepted as M+D since the
+# Codewriter templates write them that way
+COMP = {
+    "0": 0b0101010, "1": 0b0111111, "-1": 0b0111010, "D": 0b0001100, "A": 0b0110000, "!D": 0b0001101,
+    "!A": 0b0110001, "-D": 0b0001111, "-A": 0b0110011, "D+1": 0b0011111, "A+1": 0b0110111, "D-1": 0b0001110,
+    "A-1": 0b0110010, "D+A": 0b0000010, "D-A": 0b0010011, "A-D": 0b0000111, "D&A": 0b0000000, "D|A": 0b0010101,
+}
+for _comp, _bits in list(COMP.items()):
+    if "A" in _comp:
+        COMP[_comp.replace("A", "M")] = _bits | 0b1000000
+for _operator in "+&|":
+    for _register in "AM":
+        COMP[_register + _operator + "D"] = COMP["D" + _operator + _register]
+
+DEST_BITS = {"A": 0b100, "D": 0b010, "M": 0b001}
+JUMP = {"": 0, "JGT": 1, "JEQ": 2, "JGE": 3, "JLT": 4, "JNE": 5, "JLE": 6, "JMP": 7}
+
+# first RAM address of the variables
+VARIABLE_BASE = 16
+
+
+class AssemblyError(ValueError):
+    """
+    Raised for an instruction that is not valid Hack assembly
+    """
+
+
+def split_instructions(lines):
+    """
+    Labels and instructions of lines of asm code, without comments and whitespace
+
+    Args:
+        lines (iterable): lines of asm code, a line may contain several lines separated by newlines
+
+    Returns:
+        list: the labels, e.g. (LOOP), and instructions in order
+    """
+    # one split of the joined text and list comprehensions instead of a loop over the lines. Most lines are
+    # instructions without whitespace or comments, e.g. the generated code, and only need the first character
+    # checked; the others are cleaned up one by one
+    pieces = [piece for piece in "\n".join(lines).split("\n") if piece and piece[0] != "/"]
+    text = "\n".join(pieces)
+    if "/" not in text and " " not in text and "\t" not in text:
+        return pieces
+    cleaned = []
+    for piece in pieces:
+        comment = piece.find("//")
+        if comment >= 0:
+            piece = piece[:comment]
+        piece = piece.replace(" ", "").replace("\t", "")
+        if piece:
+            cleaned.append(piece)
+    return cleaned
+
+
+def encode_c_instruction(instruction):
+    """
+    16-bit word of a C instruction, e.g. AM=M-1 or D;JNE
+
+    Raises:
+        AssemblyError: when the instruction is not valid
+    """
+    dest, _, rest = instruction.rpartition("=")
+    comp, _, jump = rest.partition(";")
+    dest_bits = 0
+    for register in dest:
+        if register not in DEST_BITS:
+            raise AssemblyError("Invalid destination in instruction: " + instruction)
+        dest_bits |= DEST_BITS[register]
+    if comp not in COMP or jump not in JUMP:
+        raise AssemblyError("Invalid instruction: " + instruction)
+    return 0b1110000000000000 | COMP[comp] << 6 | dest_bits << 3 | JUMP[jump]
+
+
+class Assembler:
+    """
+    Two-pass assembler from Hack assembly to 16-bit machine words.
+
+    The first pass gives every label the ROM address of the instruction that follows it, the second pass
+    encodes the instructions and gives every other symbol a RAM address from 16 onward, in order of first use.
+
+    The first pass can be fed piece by piece with write_lines and write, so an Assembler can stand in for the
+    output file of the Codewriter and the Linker and the translator never writes the asm text, see words.
+    """
+
+    def __init__(self):
+        self.symbols = dict(PREDEFINED_SYMBOLS)
+        # asm text of the instruction at every ROM address
+        self.instructions = []
+        self._labels = set()
+
+    def write_lines(self, lines):
+        """
+        First pass over more lines of asm code: records the labels and the instructions
+
+        Args:
+            lines (iterable): lines of asm code, a line may contain several lines separated by newlines
+
+        Raises:
+            AssemblyError: for an invalid label or a label defined twice
+        """
+        pieces = split_instructions(lines)
+        address = len(self.instructions)
+        labels = [i for i, piece in enumerate(pieces) if piece[0] == "("]
+        for k, i in enumerate(labels):
+            piece = pieces[i]
+            label = piece[1:-1]
+            if not piece.endswith(")") or not label:
+                raise AssemblyError("Invalid label: " + piece)
+            if label in self._labels:
+                raise AssemblyError("Label defined twice: " + label)
+            self._labels.add(label)
+            # the instructions before it, the k labels before it take no ROM
+            self.symbols[label] = address + i - k
+        self.instructions.extend([piece for piece in pieces if piece[0] != "("] if labels else pieces)
+
+    def write(self, text):
+        """
+        Same as write_lines for a block of text, so an Assembler can be used as a file opened for writing
+        """
+        self.write_lines((text,))
+
+    def words(self):
+        """
+        Second pass over the instructions written so far
+
+        Returns:
+            list: the 16-bit machine word of every instruction, as an int
+
+        Raises:
+            AssemblyError: for an invalid instruction
+        """
+        next_variable = VARIABLE_BASE
+        # word of every distinct instruction, in order of first use so the variables get their addresses in
+        # that order. The labels are all known after the first pass, so an instruction always has the same word
+        cache = {}
+        for instruction in dict.fromkeys(self.instructions):
+            if instruction[0] == "@":
+                value = instruction[1:]
+                if not value:
+                    raise AssemblyError("Missing address: " + instruction)
+                if value.isdigit():
+                    word = int(value)
+                    if word > 0x7FFF:
+                        raise AssemblyError("Constant out of range: " + instruction)
+                else:
+                    word = self.symbols.get(value)
+                    if word is None:
+                        word = self.symbols[value] = next_variable
+                        next_variable += 1
+            else:
+                word = encode_c_instruction(instruction)
+            cache[instruction] = word
+        return [cache[instruction] for instruction in self.instructions]
+
+    def assemble(self, lines):
+        """
+        Args:
+            lines (iterable): lines of asm code, a line may contain several lines separated by newlines
+
+        Returns:
+            list: the 16-bit machine word of every instruction, as an int
+
+        Raises:
+            AssemblyError: for an invalid instruction or a label defined twice
+        """
+        self.symbols = dict(PREDEFINED_SYMBOLS)
+        self.instructions = []
+        self._labels = set()
+        self.write_lines(lines)
+        return self.words()
+
+
+def save_hack(words, path, binary=False):
+    """
+    Writes machine words to a .hack file: one line of 16 "0"/"1" characters per word, the format of the
+    nand2tetris CPU emulator, or with binary two big-endian bytes per word
+
+    Args:
+        words (list): 16-bit machine words, e.g. from Assembler.words
+        path (str): the file to write
+        binary (bool): write raw words instead of text
+    """
+    if binary:
+        rom = array("H", words)
+        if sys.byteorder == "little":
+            rom.byteswap()
+        with open(path, "wb") as hack_file:
+            hack_file.write(rom.tobytes())
+    else:
+        # programs use few distinct words, each is formatted once
+        texts = {word: format(word, "016b") for word in set(words)}
+        with open(path, "w") as hack_file:
+            hack_file.write("\n".join([texts[word] for word in words]) + "\n")
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import tempfile
+
+
+class TranslationCache:
+    """
+    On-disk cache of the asm fragments of translated .vm files.
+
+    A fragment is stored under a key made from the content of the .vm file, its name, the translator version and
+    the translation options, so it is reused only when translating the file again would give the same asm code.
+    When the files in the cache directory grow over max_bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str): folder that stores the fragments, created when missing
+            max_bytes (int): size limit of the cache directory
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(cache_dir)
+                        if entry.name.endswith(".asm"))
+
+    @staticmethod
+    def make_key(file_name, source, version, options):
+        """
+        Returns the cache key of a file
+
+        Args:
+            file_name (str): name of the .vm file, static variables and labels are named after it
+            source (bytes): content of the .vm file
+            version (str): translator version
+            options (dict): translation options that change the generated code
+        """
+        digest = hashlib.sha256()
+        for part in (version, repr(sorted(options.items())), file_name):
+            digest.update(part.encode() + b"\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".asm")
+
+    def get(self, key):
+        """
+        Returns the cached fragment of the key or None when it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r") as asm_file:
+                fragment = asm_file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # the modification time records the last use for the eviction
+        os.utime(path)
+        self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        """
+        Stores a fragment. The file is written under a temporary name and renamed, so concurrent builds
+        never read a partial fragment
+        """
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(fragment)
+        if os.path.exists(path):
+            self.size -= os.path.getsize(path)
+        os.replace(tmp_path, path)
+        self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used fragments until the cache fits in max_bytes
+        """
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".asm")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.size -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                # already evicted by a concurrent build
+                pass
@@ -1,35 +1,282 @@
-from queue import Queue
+from Emitter import Emitter
+from Expressions import JUMPS, MAX_WALK, match_branch, match_expression
+from IR import ARITHMETIC, OP_NAMES, OPCODES, SEGMENTS, Command, Op, Segment, format_command
+from SourceMap import format_marker
+from Templates import (CALL, COMPARE, OPERATIONS, POP_D, PUSH_D, RETURN_CODE, REVERSED_OPERATIONS, TOS_BINARY,
+                       TOS_COMPARE, address, expand, fill, load_d)
 
 
 class Codewriter:
 
-    # Dictionary which stores initial pointer for different variables
-    _segment_asm = {
-            "local"     : "LCL",
-            "argument"  : "ARG",
-            "this"      : "THIS",
-            "that"      : "THAT",
-            "pointer"   :   3,
-            "temp"      :   5
-        }
-
-    def __init__(self):
-        self.code_writer_queue = Queue()
+    # Shared routines of compact mode, see write_shared_routines
+    CALL_ROUTINE = "$CALL"
+    RETURN_ROUTINE = "$RETURN"
+    COMPARE_ROUTINES = {"eq": "$EQ", "gt": "$GT", "lt": "$LT"}
+    # source map name of the jump of a tail call, see write_commands and Profiler.trace
+    TAIL_CALL = "$TAIL"
+
+    def __init__(self, sink=None, verbose=True, label_namespace="", compact=False, source_map=False,
+                 expressions=False, branches=False, tos=False, tail_calls=False, stats=None):
+        """
+        Args:
+            sink (file): optional output file. When given, finished chunks of asm code are written to it
+                         while translating instead of being kept until the end
+            verbose (bool): print the name of every file when its translation begins
+            label_namespace (str): prefix of the generated labelTrue/labelFalse/RA$ labels. Code translated
+                                   by different Codewriters with different namespaces can be merged without clashes
+            compact (bool): compact mode. call, return, eq, gt and lt jump to one shared routine each instead of
+                            inlining the whole sequence, which makes the program much smaller but a bit slower
+            source_map (bool): write a marker comment with the .vm file, line and function before the code of
+                               every command, see SourceMap
+            expressions (bool): write_commands computes the expressions of push and arithmetic commands in the
+                                D register instead of going through the stack, see Expressions.match_expression
+            branches (bool): write_commands translates eq|gt|lt [not] if-goto into one conditional jump on x - y
+                             instead of making a -1/0 boolean and testing it, see Expressions.match_branch
+            tos (bool): top of stack mode. The value on top of the VM stack stays in the D register between
+                        push, pop, arithmetic and if-goto commands and is only written to the stack before labels,
+                        jumps, calls, returns and at the end of a file, see flush_stack
+            tail_calls (bool): write_commands translates a recursive call directly followed by return into a jump
+                               that reuses the frame of the current function, see _write_tail_call
+            stats (TranslationStats): count the asm instructions written for every VM opcode into stats
+        """
+        self.code_writer_queue = Emitter(sink=sink)
+        self.verbose = verbose
         self.index = 0
         self.return_address = 0
         self.file_name = ""
+        self._file_stem = ""
+        # function being translated, labels are scoped to it
+        self._function_name = ""
+        self.label_namespace = label_namespace
+
+        # symbols defined and referenced by the translated code, checked by the Linker
+        self.functions = []
+        self.calls = set()
+        self.statics = set()
+
+        self.compact = compact
+        self.expressions = expressions
+        self.branches = branches
+        self.tos = tos
+        self.tail_calls = tail_calls
+        # tos mode: the top of the VM stack is in D and not in RAM, SP points to the value below it
+        self._d_cached = False
+        # number of call sites of every shared routine used in compact mode
+        self.routine_calls = {}
+
+        # dispatch table indexed by IR opcode. Most commands expand to one cached block of asm lines, see Templates
+        self._command_writers = [None] * len(Op)
+        self._command_writers[Op.PUSH] = lambda cmd: self._push(cmd.arg, cmd.n)
+        self._command_writers[Op.POP] = lambda cmd: self._pop(cmd.arg, cmd.n)
+        for op in (Op.ADD, Op.SUB, Op.AND, Op.OR, Op.NEG, Op.NOT):
+            self._command_writers[op] = lambda cmd, op=op: self.code_writer_queue.extend(expand(op))
+        self._command_writers[Op.EQ] = lambda cmd: self._eq_gt_lt_template("eq", "JEQ")
+        self._command_writers[Op.GT] = lambda cmd: self._eq_gt_lt_template("gt", "JGT")
+        self._command_writers[Op.LT] = lambda cmd: self._eq_gt_lt_template("lt", "JLT")
+        self._command_writers[Op.LABEL] = lambda cmd: self.write_label_name(cmd.arg)
+        self._command_writers[Op.GOTO] = lambda cmd: self.write_goto(cmd.arg)
+        self._command_writers[Op.IF_GOTO] = lambda cmd: self.write_if_goto(cmd.arg)
+        self._command_writers[Op.FUNCTION] = lambda cmd: self.write_function(cmd.arg, cmd.n)
+        self._command_writers[Op.CALL] = lambda cmd: self.write_call(cmd.arg, cmd.n)
+        self._command_writers[Op.RETURN] = lambda cmd: self.write_return()
+
+        if tos:
+            self._use_tos_writers()
+        if stats is not None:
+            self._use_stats_writers(stats)
+
+        self.source_map = source_map
+        if source_map:
+            # chosen once here so that translating without source maps pays nothing for them
+            self.write_command = self._write_command_with_marker
 
     def set_file_name(self, file_name):
         """
         Acknowledgement: I received this idea from: https://github.com/BradenCradock/nand2tetris/blob/master/projects/08/VMTranslator/CodeWriter.py
 
         """
+        self.flush_stack()
         self.file_name = file_name
-        print("Begun translating file: " + file_name)
+        self._file_stem = file_name.rsplit(".", 1)[0]
+        if self.verbose:
+            print("Begun translating file: " + file_name)
     
+    def _unique_label(self, name, number):
+        """
+        Name of a generated label, e.g. labelTrue3 or Main$labelTrue3 when a label namespace is set
+        """
+        if self.label_namespace:
+            return self.label_namespace + "$" + name + str(number)
+        return name + str(number)
+
+    def _scoped_label(self, label_name):
+        """
+        Assembly symbol of a VM label, e.g. Main.loop$WHILE for label WHILE in function Main.loop,
+        so two functions can use the same label name
+        """
+        if self._function_name:
+            return self._function_name + "$" + label_name
+        return label_name
+
+    def _static_symbol(self, offset):
+        """
+        Assembly symbol of static i in the current file, e.g. Foo.3 in Foo.vm
+        """
+        symbol = self._file_stem + "." + str(offset)
+        self.statics.add(symbol)
+        return symbol
+
+    def write_command(self, cmd):
+        """
+        Writes the asm code of one IR Command, dispatching on its opcode
+
+        Args:
+            cmd (Command): a command parsed by Parser.commands
+        """
+        self._command_writers[cmd.op](cmd)
+
+    def write_commands(self, commands):
+        """
+        Writes the asm code of a list of IR Commands. With expressions on, an expression (e.g. push local 0 /
+        push constant 1 / add) is computed in D and stored straight into the segment of the pop that follows it,
+        or pushed once when there is none, so its operands never go through the stack. With branches on,
+        a comparison followed by [not] if-goto computes x - y in D and jumps on it. With tail_calls on, a function
+        that calls itself and returns the result right away jumps back to its start instead
+
+        Args:
+            commands (list): the commands of a file, e.g. Module.commands
+        """
+        if not self.expressions and not self.branches and not self.tail_calls:
+            for cmd in commands:
+                self.write_command(cmd)
+            return
+        i = 0
+        while i < len(commands):
+            if (self.tail_calls and commands[i].op == Op.CALL and commands[i].arg == self._function_name
+                    and i + 1 < len(commands) and commands[i + 1].op == Op.RETURN):
+                self._write_tail_call(commands[i:i + 2])
+                i += 2
+                continue
+            match = match_expression(commands, i, branches=self.branches) if self.expressions else None
+            if match is not None:
+                length, tree = match
+                end = i + length
+                self.flush_stack()
+                if tree[0] in JUMPS:
+                    # x - y of the comparison, then the jump of the branch
+                    branch_length, jump, label = match_branch(commands, end - 1)
+                    end += branch_length - 1
+                    code = self._expression_code((Op.SUB, tree[1], tree[2])) + self._jump_code(jump, label)
+                else:
+                    store = self._store_d_code(commands[end]) if end < len(commands) else None
+                    if store is not None:
+                        end += 1
+                        code = self._expression_code(tree) + store
+                    elif self.tos:
+                        code = self._expression_code(tree)
+                        self._d_cached = True
+                    else:
+                        code = self._expression_code(tree) + PUSH_D
+                self._write_fused(commands[i:end], code)
+                i = end
+                continue
+            branch = match_branch(commands, i) if self.branches else None
+            if branch is not None:
+                # both operands are on the stack, or y in D in tos mode
+                length, jump, label = branch
+                pop_y = () if self._d_cached else POP_D
+                self._d_cached = False
+                self._write_fused(commands[i:i + length],
+                                  pop_y + ("@SP", "AM=M-1", "D=M-D") + self._jump_code(jump, label))
+                i += length
+                continue
+            self.write_command(commands[i])
+            i += 1
+
+    def _write_tail_call(self, commands):
+        """
+        call f n / return in f itself: the n new arguments are popped over the current ones and the function starts
+        again in the same frame, so the recursion runs in constant stack space. The saved frame of the caller stays
+        where it is since both calls have n arguments, and f returns straight to it. SP = LCL at the entry of f,
+        as after a call
+        """
+        call = commands[0]
+        self.calls.add(call.arg)
+        code = ()
+        for k in reversed(range(call.n)):
+            # in tos mode the last argument is stored from D
+            store = self._store_d_code(Command(Op.POP, Segment.ARGUMENT, k)) if self._d_cached else None
+            if store is None:
+                code += (PUSH_D if self._d_cached else ()) + expand(Op.POP, Segment.ARGUMENT, k)
+            else:
+                code += ("// pop argument " + str(k),) + store
+            self._d_cached = False
+        # whatever else the function had on its stack is dropped
+        self._d_cached = False
+        if self.source_map:
+            code += (format_marker("", 0, self.TAIL_CALL),)
+        self._write_fused(commands, code + ("// SP=LCL, goto " + call.arg, "@LCL", "D=M", "@SP", "M=D",
+                                            "@" + call.arg, "0;JMP\n"))
+
+    def _write_fused(self, commands, code):
+        """
+        Writes the code of several commands translated together, after a comment that lists them
+        """
+        if self.source_map:
+            self.code_writer_queue.put(format_marker(self.file_name, commands[0].line, self._function_name))
+        self.code_writer_queue.put("// " + " / ".join(format_command(cmd) for cmd in commands))
+        self.code_writer_queue.extend(code)
+
+    def _jump_code(self, jump, label):
+        return ("@" + self._scoped_label(label), "D;" + jump + "\n")
+
+    def _expression_code(self, tree):
+        """
+        asm lines that compute the tree of an expression into D
+        """
+        if isinstance(tree, Command):
+            return load_d(tree.arg, tree.n, self._leaf_symbol(tree))
+        op, left, right = tree
+        if right is None:
+            return self._expression_code(left) + ("D=-D" if op == Op.NEG else "D=!D",)
+        if isinstance(right, Command):
+            return self._expression_code(left) + self._operand_code(OPERATIONS[op], right)
+        return self._expression_code(right) + self._operand_code(REVERSED_OPERATIONS[op], left)
+
+    def _operand_code(self, operation, leaf):
+        if leaf.arg == Segment.CONSTANT:
+            if leaf.n == 1 and operation in (OPERATIONS[Op.ADD], OPERATIONS[Op.SUB]):
+                return (operation.format("1"),)
+            return ("@" + str(leaf.n), operation.format("A"))
+        return address(leaf.arg, leaf.n, self._leaf_symbol(leaf)) + (operation.format("M"),)
+
+    def _store_d_code(self, cmd):
+        """
+        asm lines that store D into the segment of a pop command, None when cmd is not a pop D can be stored by
+        """
+        if (cmd.op != Op.POP or cmd.arg == Segment.CONSTANT
+                or (cmd.arg in (Segment.LOCAL, Segment.ARGUMENT, Segment.THIS, Segment.THAT) and cmd.n > MAX_WALK)):
+            return None
+        return address(cmd.arg, cmd.n, self._leaf_symbol(cmd)) + ("M=D\n",)
+
+    def _leaf_symbol(self, cmd):
+        return self._static_symbol(cmd.n) if cmd.arg == Segment.STATIC else ""
+
+    def _write_command_with_marker(self, cmd):
+        function_name = cmd.arg if cmd.op == Op.FUNCTION else self._function_name
+        self.code_writer_queue.put(format_marker(self.file_name, cmd.line, function_name))
+        self._command_writers[cmd.op](cmd)
+
+    def _write_generated_marker(self, name):
+        """
+        Marker of code that does not come from a .vm file, e.g. the bootstrap code
+        """
+        if self.source_map:
+            self.code_writer_queue.put(format_marker("", 0, name))
+
     def get_queue(self):
         """
-        A Queue stores the translated assembly code
+        An Emitter stores the translated assembly code. It supports the same put/get/empty calls as a Queue
         """
         return self.code_writer_queue
 
@@ -37,6 +284,7 @@ class Codewriter:
         """
         Initializes the stack pointer to store value of 256. Stack memory starts from RAM[256] and onward.
         """
+        self._write_generated_marker("<bootstrap>")
         self.code_writer_queue.put("// VM initialization (bootstrap code)")
         self.code_writer_queue.put("@256")
         self.code_writer_queue.put("D=A")
@@ -51,29 +299,20 @@ class Codewriter:
         create label for the jump 
         """
 
-        self.code_writer_queue.put("// label " + label_name)
-        self.code_writer_queue.put("(" + label_name + ")\n")
+        self.code_writer_queue.extend(expand(Op.LABEL, symbol=self._scoped_label(label_name)))
     
     def write_goto(self, label_name):
         """
         jump to the label unconditionally
         """
-        self.code_writer_queue.put("// goto " + label_name)
-        self.code_writer_queue.put("@" + label_name)
-        self.code_writer_queue.put("0;JMP\n")
+        self.code_writer_queue.extend(expand(Op.GOTO, symbol=self._scoped_label(label_name)))
 
     def write_if_goto(self, label_name):
         """
         jump to the label if condition satisfied
         """
-        self.code_writer_queue.put("// if-goto " + label_name)
-
         # go to the label created if condition is not true
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("D=M")
-        self.code_writer_queue.put("@" + label_name)
-        self.code_writer_queue.put("D;JNE\n")
+        self.code_writer_queue.extend(expand(Op.IF_GOTO, symbol=self._scoped_label(label_name)))
 
     def write_call(self, function_name, n_args):
         """
@@ -94,59 +333,30 @@ class Codewriter:
         """
 
         self.code_writer_queue.put("//  call " + function_name + str(n_args) +"\n")
+        self.calls.add(function_name)
 
-        #push returnAddress: generate a label and push it to the stack
-        #use same label for the return function
-        self.code_writer_queue.put("//  push returnAddress")
-        self.code_writer_queue.put("@RA$" + str(self.return_address))
-        self.code_writer_queue.put("D=A")
-        self._write_push_template()
-
-        #push LCL: saves LCL of the caller
-        self.code_writer_queue.put("//  push LCL")
-        self.code_writer_queue.put("@LCL")
-        self.code_writer_queue.put("D=M")
-        self._write_push_template()
-
-        #push ARG: saves ARG of the caller
-        self.code_writer_queue.put("//  push ARG")
-        self.code_writer_queue.put("@ARG")
-        self.code_writer_queue.put("D=M")
-        self._write_push_template()
-
-        #push THIS: saves THIS of the caller
-        self.code_writer_queue.put("//  push THIS")
-        self.code_writer_queue.put("@THIS")
-        self.code_writer_queue.put("D=M")
-        self._write_push_template()       
-    
-        #push THAT: saves THIS of the caller
-        self.code_writer_queue.put("//  push THAT")
-        self.code_writer_queue.put("@THAT")
-        self.code_writer_queue.put("D=M")
-        self._write_push_template()  
-
-        #repositions ARG --> ARG should point at the begining of the function args
-        self.code_writer_queue.put("//  ARG = SP-5-nArgs")
-        self.code_writer_queue.put("@" + str(5 + int(n_args)))
-        self.code_writer_queue.put("D=A")
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("D=M-D")
-        self.code_writer_queue.put("@ARG")
-        self.code_writer_queue.put("M=D\n")
-
-        #repositions LCL --> set LCL = SP to start pushing the local variables
-        self.code_writer_queue.put("//  LCL=SP")
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("D=M")
-        self.code_writer_queue.put("@LCL")
-        self.code_writer_queue.put("M=D\n")
-
-        #transfer control to the callee
-        self.write_goto(function_name)
-
-        #injects the return address label into the code (return after everything has been called in the function)
-        self.write_label_name("RA$" + str(self.return_address))
+        if self.compact:
+            # R13 = callee, R15 = returnAddress, D = nArgs, then the shared routine saves the frame
+            return_label = self._unique_label("RA$", self.return_address)
+            self.code_writer_queue.put("@" + function_name)
+            self.code_writer_queue.put("D=A")
+            self.code_writer_queue.put("@R13")
+            self.code_writer_queue.put("M=D")
+            self.code_writer_queue.put("@" + return_label)
+            self.code_writer_queue.put("D=A")
+            self.code_writer_queue.put("@R15")
+            self.code_writer_queue.put("M=D")
+            self.code_writer_queue.put("@" + str(n_args))
+            self.code_writer_queue.put("D=A")
+            self._jump_to_routine(self.CALL_ROUTINE)
+            self.code_writer_queue.put("(" + return_label + ")\n")
+            self.return_address += 1
+            return
+
+        #push returnAddress, LCL, ARG, THIS, THAT, repositions ARG and LCL, goto callee
+        #then injects the return address label into the code
+        self.code_writer_queue.extend(fill(CALL, symbol=function_name, n5=5 + int(n_args),
+                                           label=self._unique_label("RA$", self.return_address)))
         self.return_address += 1
         
     def write_function(self, function_name, local_vars):
@@ -155,99 +365,39 @@ class Codewriter:
         push number of local variables into stack and initialize them to be 0s
         
         """
-        self.code_writer_queue.put("//  function {0} {1}".format(function_name, local_vars))
-        self.write_label_name(function_name)
+        self.functions.append(function_name)
+        self._function_name = function_name
 
-        #push local variables onto stack initialize them to 0
-        for _ in range(int(local_vars)):
-            self.code_writer_queue.put("@0")
-            self.code_writer_queue.put("D=A")
-            self._write_push_template()
+        #label, then push local variables onto stack initialize them to 0
+        self.code_writer_queue.extend(expand(Op.FUNCTION, None, int(local_vars), function_name))
        
     def write_return(self):
         """
         funtion return and restore the frame
         """
-        #frame=LCL ---- frame is a temporary variable
-        self.code_writer_queue.put("// return")
-        self.code_writer_queue.put("// frame=LCL\n")
-        self.code_writer_queue.put("@LCL")
-        self.code_writer_queue.put("D=M")
-        self.code_writer_queue.put("@R14")
-        self.code_writer_queue.put("M=D\n")
-
-        #retAddr = *(frame-5)---- puts the return address in a temporary variable
-        self.code_writer_queue.put("// retAddr = *(frame-5)")
-        self.code_writer_queue.put("@5")
-        self.code_writer_queue.put("A=D-A")
-        self.code_writer_queue.put("D=M")
-        self.code_writer_queue.put("@R15")
-        self.code_writer_queue.put("M=D\n")
-
-        #*ARG=pop() ---- repositions the return value for the caller
-        self.code_writer_queue.put("// *ARG=pop()")
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("D=M\n")
-        self.code_writer_queue.put("@ARG")
-        self.code_writer_queue.put("A=M")
-        self.code_writer_queue.put("M=D")  
-        self.code_writer_queue.put("D=A")
-
-        #SP=ARG+1 ---- repositions SP for the caller
-        self.code_writer_queue.put("// SP=ARG+1") 
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("M=D+1\n")
-
-        #THAT=*(frame-1) ---- restores THAT for the caller
-        self.code_writer_queue.put("// THAT=*(frame-1)")
-        self._return_template("THAT")
-
-        #THIS=*(frame-2) ---- restores THIS for the caller
-        self.code_writer_queue.put("// THIS=*(frame-2)")
-        self._return_template("THIS")
-
-        #ARG=*(frame-3) ---- restores THIS for the caller
-        self.code_writer_queue.put("// ARG=*(frame-3)")
-        self._return_template("ARG")
+        if self.compact:
+            self.code_writer_queue.put("// return")
+            self._jump_to_routine(self.RETURN_ROUTINE)
+        else:
+            self.code_writer_queue.extend(expand(Op.RETURN))
 
-        #LCL=*(frame-4) ---- restores LCL for the caller
-        self.code_writer_queue.put("// LCL=*(frame-4)")
-        self._return_template("LCL")
+    def _write_return_code(self):
+        """
+        restores the frame of the caller and jumps to the return address
+        """
+        self.code_writer_queue.extend(RETURN_CODE)
 
-        #goto retAddr ---- go to the return address
-        self.code_writer_queue.put("// goto retAddr")
-        self.code_writer_queue.put("@R15")
-        self.code_writer_queue.put("A=M")
-        self.code_writer_queue.put("0;JMP\n")
+#Arithmetic operation
 
-#Arithmetic operation 
-    
     def write_arithmetic(self, operation):
         """
         operates when comand type is a C_ARITHMETIC
 
         """
-        if operation == "add":
-            self._add_sub_or_and_template("add", "-")
-        elif operation == "neg":
-            self._neg_not_template("neg", "-")
-        elif operation == "sub":
-            self._add_sub_or_and_template("sub", "-")
-        elif operation == "eq":
-            self._eq_gt_lt_template("eq", "JEQ")
-        elif operation == "gt":
-            self._eq_gt_lt_template("gt", "JGT")
-        elif operation == "lt":
-            self._eq_gt_lt_template("lt", "JLT")
-        elif operation == "and":
-            self._add_sub_or_and_template("and", "&")
-        elif operation == "or":
-            self._add_sub_or_and_template("or", "|")
-        elif operation == "not":
-            self._neg_not_template("not", "!")
-        else:
+        op = OPCODES.get(operation)
+        if op not in ARITHMETIC:
             raise ValueError("Invalid arithmetic command!")
+        self._command_writers[op](None)
 
 
 #Push and Pop operation
@@ -273,47 +423,15 @@ class Codewriter:
 
         """
 
-        if segment == "constant":
-            self.code_writer_queue.put("// push " + segment + " " + str(offset))
-
-            #store the constant value into D and push to stack
-            self.code_writer_queue.put("@" + str(offset))
-            self.code_writer_queue.put("D=A")
-            self._write_push_template()
-            
-        elif segment == "static":
-            self.code_writer_queue.put("// push " + segment + " " + str(offset))
-
-            #store value of static variables into D register
-            self.code_writer_queue.put("@" + self.file_name.split(".")[0] + "." + str(offset))
-            self.code_writer_queue.put("D=M")
-            self._write_push_template()
-
-        elif segment in ["local", "argument", "this", "that"]:
-            self.code_writer_queue.put("// push " + segment + " " + str(offset))
-
-            #addr = segment + offset, *SP = *addr, SP++
-            #store value in D and push onto stack
-            self.code_writer_queue.put("@" + self._segment_asm[segment])
-            self.code_writer_queue.put("D=M")
-            self.code_writer_queue.put("@" + str(offset))
-            self.code_writer_queue.put("A=D+A")
-            self.code_writer_queue.put("D=M")   
-            self._write_push_template() 
-
-        elif segment in ["pointer", "temp"]:
-            self.code_writer_queue.put("// push " + segment + " " + str(offset))
+        segment_id = SEGMENTS.get(segment)
+        if segment_id is None:
+            raise ValueError("Invalid Hack assembly code detected!")
+        self._command_writers[Op.PUSH](Command(Op.PUSH, segment_id, offset))
 
-            #store value in D and push onto stack
-            self.code_writer_queue.put("@R" + str(offset + self._segment_asm[segment]))
-            self.code_writer_queue.put("D=M")
-            self._write_push_template()
+    def _push(self, segment, offset):
+        symbol = self._static_symbol(offset) if segment == Segment.STATIC else ""
+        self.code_writer_queue.extend(expand(Op.PUSH, segment, offset, symbol))
 
-        else:
-            raise ValueError("Invalid Hack assembly code detected!")
-        
-        # Same asm code block
-        
     def pop_operation(self, segment, offset):
         """
         pop template for static, local, argument, this, that, pointer, temp:
@@ -339,55 +457,200 @@ class Codewriter:
 
         """
 
-        if segment == "static":
-            self.code_writer_queue.put("// pop " + segment + " " + str(offset))
+        segment_id = SEGMENTS.get(segment)
+        if segment_id is None:
+            raise ValueError("Invalid Hack assembly code detected!")
+        self._command_writers[Op.POP](Command(Op.POP, segment_id, offset))
 
-            #decrement the pointer and select the topmost value on stack and set it equal to D
-            self.code_writer_queue.put("@SP")
-            self.code_writer_queue.put("AM=M-1")
-            self.code_writer_queue.put("D=M")
+    def _pop(self, segment, offset):
+        if segment == Segment.CONSTANT:
+            # constant is a virtual segment, there is nothing to pop into
+            raise ValueError("Invalid Hack assembly code detected!")
+        symbol = self._static_symbol(offset) if segment == Segment.STATIC else ""
+        self.code_writer_queue.extend(expand(Op.POP, segment, offset, symbol))
+
+ # Top of stack mode
+
+    def _use_tos_writers(self):
+        """
+        Replaces the command writers by their tos mode versions. The commands that need the whole VM stack in RAM
+        write the top of the stack back first
+        """
+        writers = self._command_writers
+        for op in Op:
+            writers[op] = self._spilling(writers[op])
+        writers[Op.PUSH] = self._tos_push
+        writers[Op.POP] = self._tos_pop
+        for op, operation in TOS_BINARY.items():
+            writers[op] = lambda cmd, op=op, operation=operation: self._tos_operation(
+                OP_NAMES[op], ("@SP", "AM=M-1", operation))
+        writers[Op.NEG] = lambda cmd: self._tos_operation("neg", ("D=-D",))
+        writers[Op.NOT] = lambda cmd: self._tos_operation("not", ("D=!D",))
+        if not self.compact:
+            # compact mode keeps its shared comparison routines, which take their operands on the stack
+            writers[Op.EQ] = lambda cmd: self._tos_compare("eq", "JEQ")
+            writers[Op.GT] = lambda cmd: self._tos_compare("gt", "JGT")
+            writers[Op.LT] = lambda cmd: self._tos_compare("lt", "JLT")
+        writers[Op.IF_GOTO] = self._tos_if_goto
+
+    def _use_stats_writers(self, stats):
+        """
+        Replaces the emitter by one that counts the instructions written, and wraps every command writer so that
+        they are counted under its opcode. Like the other modes it is chosen once here and costs nothing when off
+        """
+        emitter = self.code_writer_queue = stats.emitter(self.code_writer_queue.sink)
+        writers = self._command_writers
+        for op in Op:
+            writers[op] = emitter.counting(OP_NAMES[op], writers[op])
+        self._write_fused = emitter.counting("fused", self._write_fused)
+        self.write_init = emitter.counting("generated", self.write_init)
+        self.write_shared_routines = emitter.counting("generated", self.write_shared_routines)
+
+    def _spilling(self, write):
+        def flush_and_write(cmd):
+            self.flush_stack()
+            write(cmd)
+        return flush_and_write
+
+    def flush_stack(self):
+        """
+        tos mode: writes the top of the stack kept in D back to the stack, so the VM stack is complete in RAM.
+        Labels, jumps, calls and returns flush it, the end of a file must too
+        """
+        if self._d_cached:
+            self.code_writer_queue.extend(PUSH_D)
+            self._d_cached = False
+
+    def _tos_push(self, cmd):
+        self.flush_stack()
+        self.code_writer_queue.put("// " + format_command(cmd))
+        self.code_writer_queue.extend(load_d(cmd.arg, cmd.n, self._leaf_symbol(cmd)))
+        self._d_cached = True
+
+    def _tos_pop(self, cmd):
+        store = self._store_d_code(cmd) if self._d_cached else None
+        if store is None:
+            self.flush_stack()
+            self._pop(cmd.arg, cmd.n)
+            return
+        self.code_writer_queue.put("// " + format_command(cmd))
+        self.code_writer_queue.extend(store)
+        self._d_cached = False
+
+    def _tos_operation(self, cmd, code):
+        """
+        Operation on y, the top of the stack, which is loaded in D first. The result stays in D
+        """
+        self.code_writer_queue.put("//" + cmd)
+        if not self._d_cached:
+            self.code_writer_queue.extend(POP_D)
+        self.code_writer_queue.extend(code)
+        self._d_cached = True
+
+    def _tos_compare(self, cmd, jmp):
+        if not self._d_cached:
+            self.code_writer_queue.extend(POP_D)
+        self.code_writer_queue.extend(fill(TOS_COMPARE, cmd=cmd, jump=jmp,
+                                           true=self._unique_label("labelTrue", self.index),
+                                           false=self._unique_label("labelFalse", self.index)))
+        self.index += 1
+        self._d_cached = True
 
-            #pop the value from RAM to static stack
-            self.code_writer_queue.put("@" + self.file_name.split(".")[0] + "." + str(offset))
-            self.code_writer_queue.put("M=D\n")
-            
-        elif segment in ["local", "argument", "this", "that"]:
-            self.code_writer_queue.put("// pop " + segment + " " + str(offset))
+    def _tos_if_goto(self, cmd):
+        self.code_writer_queue.put("// if-goto " + cmd.arg)
+        if not self._d_cached:
+            self.code_writer_queue.extend(POP_D)
+        self.code_writer_queue.extend(self._jump_code("JNE", cmd.arg))
+        self._d_cached = False
 
-            #addr = segment + offset. store the address in D 
-            #e.g  pop local 2. LCL has base addess of 1015. D register stores address 1017 (1015 + 2)
-            self.code_writer_queue.put("@" + self._segment_asm[segment])
-            self.code_writer_queue.put("D=M")
-            self.code_writer_queue.put("@" + str(offset))
-            self.code_writer_queue.put("D=D+A")
+ # Shared routines of compact mode
 
-            #*addr=*SP and SP--
-            #R13 stores the address 1017
-            self.code_writer_queue.put("@R13")
-            self.code_writer_queue.put("M=D")
+    def _jump_to_routine(self, routine):
+        self.routine_calls[routine] = self.routine_calls.get(routine, 0) + 1
+        self.code_writer_queue.put("@" + routine)
+        self.code_writer_queue.put("0;JMP\n")
+
+    def write_shared_routines(self, routines, halt):
+        """
+        Writes the shared routines used by the code translated in compact mode. They are written once
+        per program, after the code of every file.
 
-            #SP is pointing at 258, we decrease to 257 so that it points at the topmost value
+        Args:
+            routines (iterable): names of the routines to write, e.g. the keys of routine_calls
+            halt (bool): write an infinite loop first, so a program that has no bootstrap code and runs
+                         past its last command stops there instead of running into the routines
+        """
+        self.flush_stack()
+        routines = set(routines)
+        if not routines:
+            return
+        if halt:
+            self._write_generated_marker("$HALT")
+            self.code_writer_queue.put("// halt")
+            self.code_writer_queue.put("($HALT)")
+            self.code_writer_queue.put("@$HALT")
+            self.code_writer_queue.put("0;JMP\n")
+
+        if self.CALL_ROUTINE in routines:
+            # R13 = callee, R15 = returnAddress, D = nArgs
+            self._write_generated_marker(self.CALL_ROUTINE)
+            self.code_writer_queue.put("// shared call routine")
+            self.code_writer_queue.put("(" + self.CALL_ROUTINE + ")")
+            self.code_writer_queue.put("@5")
+            self.code_writer_queue.put("D=D+A")
+            self.code_writer_queue.put("@R14")
+            self.code_writer_queue.put("M=D")
+            for register in ["R15", "LCL", "ARG", "THIS", "THAT"]:
+                self.code_writer_queue.put("@" + register)
+                self.code_writer_queue.put("D=M")
+                self._write_push_template()
+            #ARG = SP-5-nArgs
+            self.code_writer_queue.put("@R14")
+            self.code_writer_queue.put("D=M")
+            self.code_writer_queue.put("@SP")
+            self.code_writer_queue.put("D=M-D")
+            self.code_writer_queue.put("@ARG")
+            self.code_writer_queue.put("M=D")
+            #LCL = SP
             self.code_writer_queue.put("@SP")
-            self.code_writer_queue.put("AM=M-1")
             self.code_writer_queue.put("D=M")
-
-            #put the valu einto the address that R13 is pointing to. RAM[1017] = D
+            self.code_writer_queue.put("@LCL")
+            self.code_writer_queue.put("M=D")
             self.code_writer_queue.put("@R13")
             self.code_writer_queue.put("A=M")
-            self.code_writer_queue.put("M=D\n")
-
-        elif segment in ["pointer", "temp"]:
-            self.code_writer_queue.put("// pop " + segment + " " + str(offset))
-
-            #temp mapped to RAM locations 5 to 12
-            #pointer mapped to RAM locations 3 to 4
+            self.code_writer_queue.put("0;JMP\n")
+
+        if self.RETURN_ROUTINE in routines:
+            self._write_generated_marker(self.RETURN_ROUTINE)
+            self.code_writer_queue.put("// shared return routine")
+            self.code_writer_queue.put("(" + self.RETURN_ROUTINE + ")")
+            self._write_return_code()
+
+        for cmd, jmp in [("eq", "JEQ"), ("gt", "JGT"), ("lt", "JLT")]:
+            routine = self.COMPARE_ROUTINES[cmd]
+            if routine not in routines:
+                continue
+            # D = returnAddress. x is replaced by -1 (true) or 0 (false) and y is popped
+            self._write_generated_marker(routine)
+            self.code_writer_queue.put("// shared " + cmd + " routine")
+            self.code_writer_queue.put("(" + routine + ")")
+            self.code_writer_queue.put("@R15")
+            self.code_writer_queue.put("M=D")
             self.code_writer_queue.put("@SP")
             self.code_writer_queue.put("AM=M-1")
             self.code_writer_queue.put("D=M")
-            self.code_writer_queue.put("@R" + str(offset + self._segment_asm[segment]))
-            self.code_writer_queue.put("M=D\n")
-        else:
-            raise ValueError("Invalid Hack assembly code detected!")
+            self.code_writer_queue.put("A=A-1")
+            self.code_writer_queue.put("D=M-D")
+            self.code_writer_queue.put("M=-1")
+            self.code_writer_queue.put("@" + routine + "$TRUE")
+            self.code_writer_queue.put("D;" + jmp)
+            self.code_writer_queue.put("@SP")
+            self.code_writer_queue.put("A=M-1")
+            self.code_writer_queue.put("M=0")
+            self.code_writer_queue.put("(" + routine + "$TRUE)")
+            self.code_writer_queue.put("@R15")
+            self.code_writer_queue.put("A=M")
+            self.code_writer_queue.put("0;JMP\n")
 
  # Templates       
     def _write_push_template(self):
@@ -403,23 +666,7 @@ class Codewriter:
 
         """
 
-        #select e.g. RAM[256] and set it to D (value from somewhere else)
-        self.code_writer_queue.put("@SP")           
-        self.code_writer_queue.put("A=M")           
-        self.code_writer_queue.put("M=D")
-
-        #increment sp pointer           
-        self.code_writer_queue.put("@SP")           
-        self.code_writer_queue.put("M=M+1\n")
- 
-    def _return_template(self, segment):
-
-        self.code_writer_queue.put("@R14")
-        self.code_writer_queue.put("M=M-1")
-        self.code_writer_queue.put("A=M")
-        self.code_writer_queue.put("D=M")
-        self.code_writer_queue.put("@" + segment)
-        self.code_writer_queue.put("M=D\n")
+        self.code_writer_queue.extend(PUSH_D)
 
     def _eq_gt_lt_template(self, cmd, jmp):
         """
@@ -430,89 +677,19 @@ class Codewriter:
             jmp (string): "JEQ", "JGT", "JLT"
 
         """
-        self.code_writer_queue.put("//" + cmd)
-
-        #decrement the pointer and select the topmost value on stack and set it equal to D
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("D=M")
-
-        #decrement the pointer and do operation store value to D register again
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("D=M-D")
-
-        #create labelTrue, if true execute and Jump
-        self.code_writer_queue.put("@labelTrue" + str(self.index))
-        self.code_writer_queue.put("D;" + jmp)
-
-        #create labelFalse, if false execute and Jump
-        self.code_writer_queue.put("D=0")
-        self.code_writer_queue.put("@labelFalse" + str(self.index))
-        self.code_writer_queue.put("0;JMP")
-
-        #jump destination for labelTrue
-        self.code_writer_queue.put("(labelTrue" + str(self.index) + ")")
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("D=-1")
-
-        #jump destination for labelFalse
-        self.code_writer_queue.put("(labelFalse" + str(self.index) + ")")
-
-        #set value in RAM where SP points at to D (0 or -1)
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("A=M")
-        self.code_writer_queue.put("M=D")
-
-        #increment the stack pointer
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("M=M+1\n")
+        if self.compact:
+            # D = returnAddress, the shared routine compares and pushes the result
+            self.code_writer_queue.put("//" + cmd)
+            return_label = self._unique_label("RA$", self.return_address)
+            self.code_writer_queue.put("@" + return_label)
+            self.code_writer_queue.put("D=A")
+            self._jump_to_routine(self.COMPARE_ROUTINES[cmd])
+            self.code_writer_queue.put("(" + return_label + ")\n")
+            self.return_address += 1
+            return
+
+        #pop y and x, jump to labelTrue when x cmp y, push -1 (true) or 0 (false)
+        self.code_writer_queue.extend(fill(COMPARE, cmd=cmd, jump=jmp,
+                                           true=self._unique_label("labelTrue", self.index),
+                                           false=self._unique_label("labelFalse", self.index)))
         self.index += 1
-        
-    def _neg_not_template(self, cmd, operation):
-        """
-        Template that works for neg and not command
-        
-        Args:
-            cmd (string): "neg", "not"
-            operation (string): "-", "|"
-
-        """
-        self.code_writer_queue.put("//" + cmd)
-
-        #decrement the pointer and select the topmost value on stack and set it equal to D
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-
-        #do operation and put the value on the stack
-        self.code_writer_queue.put("M=" + operation + "M")
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("M=M+1\n")
- 
-    def _add_sub_or_and_template(self, cmd, operation):
-        """
-        Template that works for add, sub, or, and commands
-
-        Args:
-            cmd (string): "add", "sub", "or", "and"
-            operation (string): "+", "-", "|", "&"
-        """
-        self.code_writer_queue.put("//" + cmd)
-        
-        #decrement the pointer and select the topmost value on stack and set it equal to D
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("D=M")
-
-        #decrement the pointer and select the value again and do operation with D and put the value on the stack
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("AM=M-1")
-        self.code_writer_queue.put("M=M" + operation + "D")
-
-        #increment stack pointer
-        self.code_writer_queue.put("@SP")
-        self.code_writer_queue.put("M=M+1\n")
-
-    
-
-
@@ -0,0 +1,77 @@
+from Codewriter import Codewriter
+from IR import Module, Op, split_functions
+from Linker import count_instructions
+
+
+class DeadFunctionEliminator:
+    """
+    Whole program pass that drops the functions the program can never call.
+
+    The call graph is built from the call commands of every function. Starting from Sys.init, which the bootstrap
+    code calls, and from the functions called by code outside any function, every function that is not reached
+    is removed before code generation. Programs that have no bootstrap code are left unchanged, since any of
+    their functions may be the entry point.
+    """
+
+    def __init__(self, verbose=True, compact=False):
+        """
+        Args:
+            verbose (bool): print the removed functions and the ROM they took
+            compact (bool): the program is translated in compact mode, used to measure the ROM saved
+        """
+        self.verbose = verbose
+        self.compact = compact
+        self.removed = []
+        self.rom_saved = 0
+
+    def run(self, modules, bootstrap):
+        """
+        Args:
+            modules (list): Module of every file of the program
+            bootstrap (bool): the program starts with the bootstrap code that calls Sys.init
+
+        Returns:
+            list: the modules without their unreachable functions
+        """
+        self.removed = []
+        self.rom_saved = 0
+        if not bootstrap:
+            return modules
+
+        callees = {}
+        roots = ["Sys.init"]
+        for module in modules:
+            for function_name, commands in split_functions(module.commands):
+                called = [cmd.arg for cmd in commands if cmd.op == Op.CALL]
+                if function_name is None:
+                    roots.extend(called)
+                else:
+                    callees[function_name] = called
+        reachable = set()
+        todo = list(roots)
+        while todo:
+            function_name = todo.pop()
+            if function_name not in reachable:
+                reachable.add(function_name)
+                todo.extend(callees.get(function_name, ()))
+
+        result = []
+        dead_code = Codewriter(verbose=False, compact=self.compact)
+        for module in modules:
+            commands = []
+            for function_name, function_commands in split_functions(module.commands):
+                if function_name is None or function_name in reachable:
+                    commands.extend(function_commands)
+                else:
+                    self.removed.append(function_name)
+                    dead_code.set_file_name(module.name + ".vm")
+                    for cmd in function_commands:
+                        dead_code.write_command(cmd)
+            result.append(Module(module.name, commands))
+        self.rom_saved = count_instructions(dead_code.get_queue().lines())
+
+        if self.verbose and self.removed:
+            print("Removed {0} function(s) unreachable from Sys.init, {1} ROM instructions saved:".format(
+                len(self.removed), self.rom_saved))
+            print("    " + ", ".join(self.removed))
+        return result
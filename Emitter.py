@@ -0,0 +1,102 @@
+class Emitter:
+    """
+    Buffer for the translated assembly code.
+
+    Lines are appended to plain lists that are split into fixed size chunks, so emitting a line costs one
+    list append instead of the lock and condition variable a queue.Queue takes on every put/get.
+    put/get/empty/qsize keep the Queue interface that existing callers of Codewriter.get_queue() rely on.
+
+    When a sink file is given every full chunk is written to it right away and dropped, so memory stays
+    bounded by chunk_size no matter how much code is translated.
+    """
+
+    def __init__(self, chunk_size=4096, sink=None):
+        self.chunk_size = chunk_size
+        self.sink = sink
+        self._chunks = [[]]
+        self._read_chunk = 0
+        self._read_line = 0
+        # lines put and not read yet, kept up to date so qsize and empty do not walk the chunks
+        self._pending = 0
+
+    def put(self, line):
+        """
+        Append one line of assembly code
+        """
+        chunk = self._chunks[-1]
+        chunk.append(line)
+        self._pending += 1
+        if len(chunk) >= self.chunk_size:
+            if self.sink is not None:
+                self.flush(self.sink)
+            else:
+                self._chunks.append([])
+
+    def extend(self, lines):
+        """
+        Append a block of lines of assembly code, e.g. an expanded template, with one list extend
+        """
+        chunk = self._chunks[-1]
+        size = len(chunk)
+        chunk.extend(lines)
+        self._pending += len(chunk) - size
+        if len(chunk) >= self.chunk_size:
+            if self.sink is not None:
+                self.flush(self.sink)
+            else:
+                self._chunks.append([])
+
+    def get(self):
+        """
+        Remove and return the oldest line that has not been read yet, like Queue.get()
+        """
+        while self._read_line >= len(self._chunks[self._read_chunk]):
+            if self._read_chunk == len(self._chunks) - 1:
+                raise IndexError("get from an empty Emitter")
+            self._chunks[self._read_chunk] = []
+            self._read_chunk += 1
+            self._read_line = 0
+        line = self._chunks[self._read_chunk][self._read_line]
+        self._read_line += 1
+        self._pending -= 1
+        return line
+
+    def empty(self):
+        """
+        return true if every line has been read otherwise false
+        """
+        return self._pending == 0
+
+    def qsize(self):
+        """
+        number of lines that have not been read yet
+        """
+        return self._pending
+
+    def lines(self):
+        """
+        Return the unread lines as a list without consuming them
+        """
+        pending = [line for chunk in self._chunks[self._read_chunk:] for line in chunk]
+        return pending[self._read_line:]
+
+    def flush(self, out_file):
+        """
+        Write every unread line to out_file, one join and one write per chunk, and empty the buffer.
+
+        Args:
+            out_file (file): a file object opened for writing text, or an object with a write_lines method such as
+                             Assembler, which gets the lines without joining them
+        """
+        chunks = self._chunks[self._read_chunk:]
+        chunks[0] = chunks[0][self._read_line:]
+        write_lines = getattr(out_file, "write_lines", None)
+        for chunk in chunks:
+            if chunk and write_lines is not None:
+                write_lines(chunk)
+            elif chunk:
+                out_file.write("\n".join(chunk) + "\n")
+        self._chunks = [[]]
+        self._read_chunk = 0
+        self._read_line = 0
+        self._pending = 0
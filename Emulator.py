@@ -0,0 +1,187 @@
+import sys
+import time
+from array import array
+
+from Assembler import COMP, Assembler
+
+RAM_SIZE = 32768
+
+# Python expression of every computation, by a bit and c bits. Results of + and - are wrapped to 16 bits,
+# the other computations always stay in the signed 16-bit range
+_COMP_CODE = {}
+for _mnemonic, _bits in COMP.items():
+    if _bits not in _COMP_CODE:
+        _expression = _mnemonic.replace("D", "d").replace("A", "a").replace("M", "m").replace("!", "~")
+        _wrap = _mnemonic not in ("-1", "1") and ("+" in _mnemonic or "-" in _mnemonic)
+        _COMP_CODE[_bits] = (_expression, _wrap)
+
+_JUMP_CONDITION = {1: "v > 0", 2: "v == 0", 3: "v >= 0", 4: "v < 0", 5: "v != 0", 6: "v <= 0"}
+
+# marks the block of an infinite loop on itself, the way Hack programs stop
+_HALT = object()
+
+
+class Emulator:
+    """
+    Hack CPU emulator that runs the machine code of a whole program in this process.
+
+    RAM and ROM are arrays of 16-bit words. Instead of decoding one instruction at a time, the emulator compiles
+    every basic block it enters (the instructions from a jump target up to the next jump) into a Python function
+    once, so running a program costs one call per block. An infinite loop made of @self 0;JMP stops the run.
+
+    After run: cycles is the number of instructions executed, stack_high_water the highest value SP (RAM[0])
+    took and wall_time the seconds spent running.
+    """
+
+    def __init__(self, rom):
+        """
+        Args:
+            rom (list): 16-bit machine words of the program, e.g. from Assembler.assemble
+        """
+        self.rom = array("H", rom)
+        self.ram = array("h", bytes(2 * RAM_SIZE))
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.stack_high_water = 0
+        self.wall_time = 0.0
+        self.halted = False
+        self._blocks = [None] * len(self.rom)
+
+    @classmethod
+    def from_asm(cls, lines):
+        """
+        Emulator of a program in Hack assembly
+
+        Args:
+            lines (iterable): lines of asm code, e.g. an open .asm file
+        """
+        return cls(Assembler().assemble(lines))
+
+    def run(self, max_cycles=None, trace=None):
+        """
+        Runs the program until it halts, runs past the end of the ROM or has executed max_cycles instructions.
+        The run stops at the end of the block during which max_cycles is reached.
+
+        Args:
+            max_cycles (int): limit of instructions to execute, None for no limit
+            trace (callable): called with the ROM address and the number of instructions of every block run
+
+        Returns:
+            int: number of instructions executed
+        """
+        limit = float("inf") if max_cycles is None else max_cycles
+        blocks = self._blocks
+        ram = self.ram
+        rom_size = len(self.rom)
+        a, d, pc, cycles = self.a, self.d, self.pc, self.cycles
+        high_water = max(self.stack_high_water, ram[0])
+        start = time.perf_counter()
+        while pc < rom_size and cycles < limit:
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = self._compile(pc)
+            if block is _HALT:
+                self.halted = True
+                break
+            function, size = block
+            if trace is not None:
+                trace(pc, size)
+            pc, a, d, high_water = function(ram, a, d, high_water)
+            cycles += size
+        else:
+            self.halted = pc >= rom_size
+        self.wall_time += time.perf_counter() - start
+        self.a, self.d, self.pc, self.cycles = a, d, pc, cycles
+        self.stack_high_water = high_water
+        return cycles
+
+    def _compile(self, pc):
+        """
+        Compiles the block that starts at ROM address pc into a function of (ram, a, d, high_water) that returns
+        the next pc and the new a, d and high_water
+        """
+        rom = self.rom
+        if (pc + 1 < len(rom) and rom[pc] == pc and rom[pc + 1] & 0x8000
+                and rom[pc + 1] & 0b111 == 7 and rom[pc + 1] >> 3 & 0b111 == 0):
+            return _HALT
+
+        code = ["def block(ram, a, d, high_water):"]
+        # value of a when it is known at compile time, i.e. it was last set by an A instruction of the block
+        known_a = None
+        address = pc
+        while address < len(rom):
+            word = rom[address]
+            address += 1
+            if not word & 0x8000:
+                code.append("    a = {0}".format(word))
+                known_a = word
+                continue
+            comp = _COMP_CODE.get(word >> 6 & 0b1111111)
+            if comp is None or word & 0x6000 != 0x6000:
+                raise ValueError("Invalid instruction {0:016b} at ROM[{1}]".format(word, address - 1))
+            expression, wrap = comp
+            memory = "ram[{0}]".format(known_a if known_a is not None else "a & 32767")
+            expression = expression.replace("m", memory)
+            if wrap:
+                expression = "(({0}) + 32768 & 65535) - 32768".format(expression)
+            dest = word >> 3 & 0b111
+            jump = word & 0b111
+            target = str(known_a)
+            if jump and known_a is None:
+                code.append("    target = a & 32767")
+                target = "target"
+            if dest or jump:
+                code.append("    v = " + expression)
+            if dest & 0b001:
+                code.append("    {0} = v".format(memory))
+                if known_a is None:
+                    code.append("    if (a & 32767) == 0 and v > high_water: high_water = v")
+                elif known_a == 0:
+                    code.append("    if v > high_water: high_water = v")
+            if dest & 0b010:
+                code.append("    d = v")
+            if dest & 0b100:
+                code.append("    a = v")
+                known_a = None
+            if jump == 7:
+                code.append("    return {0}, a, d, high_water".format(target))
+                break
+            if jump:
+                code.append("    if {0}: return {1}, a, d, high_water".format(_JUMP_CONDITION[jump], target))
+                break
+        code.append("    return {0}, a, d, high_water".format(address))
+        namespace = {}
+        exec("\n".join(code), namespace)
+        return namespace["block"], address - pc
+
+
+def run(argv=None):
+    """
+    Command line of the emulator: runs a .asm program and prints its statistics
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="Emulator", description="Run a Hack .asm program.")
+    parser.add_argument("asm_file", help="the .asm file to run")
+    parser.add_argument("--max-cycles", type=int, default=100 * 1000 * 1000,
+                        help="stop after this many instructions (default 100M)")
+    parser.add_argument("--sp", type=int, default=None,
+                        help="initial value of SP, for programs translated without the bootstrap code")
+    args = parser.parse_args(argv)
+
+    with open(args.asm_file) as asm_file:
+        emulator = Emulator.from_asm(asm_file)
+    if args.sp is not None:
+        emulator.ram[0] = args.sp
+    emulator.run(args.max_cycles)
+    print("instructions      {0:>14,}".format(emulator.cycles))
+    print("stack high water  {0:>14}".format(emulator.stack_high_water))
+    print("wall time         {0:>14.3f}s".format(emulator.wall_time))
+    print("halted            {0:>14}".format(str(emulator.halted)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
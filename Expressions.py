@@ -0,0 +1,167 @@
+from IR import Command, Op, Segment
+
+# largest offset of local/argument/this/that reached by walking A up from the segment base (A=M+1, A=A+1, ...),
+# so that D keeps its value. Same limit as the peephole optimizer
+MAX_WALK = 10
+
+_INDEXED = frozenset([Segment.LOCAL, Segment.ARGUMENT, Segment.THIS, Segment.THAT])
+_UNARY = frozenset([Op.NEG, Op.NOT])
+_BINARY = frozenset([Op.ADD, Op.SUB, Op.AND, Op.OR])
+
+# jump on D = x - y of eq, gt and lt, and of their negation for eq|gt|lt not if-goto
+JUMPS = {Op.EQ: ("JEQ", "JNE"), Op.GT: ("JGT", "JLE"), Op.LT: ("JLT", "JGE")}
+
+
+def _wrap(value):
+    """
+    value as a signed 16-bit word, the way the Hack ALU computes it
+    """
+    return (value + 32768 & 65535) - 32768
+
+
+# value of every command on constant operands. The comparisons jump on x - y computed by the ALU, so they are
+# folded on the wrapped difference too, e.g. 20000 gt -20000 is false
+_FOLD = {
+    Op.ADD: lambda x, y: _wrap(x + y),
+    Op.SUB: lambda x, y: _wrap(x - y),
+    Op.AND: lambda x, y: x & y,
+    Op.OR: lambda x, y: x | y,
+    Op.EQ: lambda x, y: -(_wrap(x - y) == 0),
+    Op.GT: lambda x, y: -(_wrap(x - y) > 0),
+    Op.LT: lambda x, y: -(_wrap(x - y) < 0),
+    Op.NEG: lambda x: _wrap(-x),
+    Op.NOT: lambda x: ~x,
+}
+
+
+def _push_constant(value, line):
+    """
+    Commands that push a 16-bit value, push constant only takes 0 ... 32767
+    """
+    if value >= 0:
+        return [Command(Op.PUSH, Segment.CONSTANT, value, line)]
+    if value == -32768:
+        return [Command(Op.PUSH, Segment.CONSTANT, 32767, line), Command(Op.NOT, None, 0, line)]
+    return [Command(Op.PUSH, Segment.CONSTANT, -value, line), Command(Op.NEG, None, 0, line)]
+
+
+def fold_constants(commands):
+    """
+    Computes the arithmetic on constants at translation time, e.g. push constant 2 / push constant 3 / add
+    becomes push constant 5. Negative results are pushed as push constant x / neg.
+
+    Args:
+        commands (list): Commands of a file
+
+    Returns:
+        list: the commands with the constant expressions folded
+    """
+    # a folded constant is kept as (value, line) until a command that is not foldable uses it
+    result = []
+    for cmd in commands:
+        if cmd.op == Op.PUSH and cmd.arg == Segment.CONSTANT:
+            result.append((cmd.n, cmd.line))
+            continue
+        fold = _FOLD.get(cmd.op)
+        if fold is not None:
+            if cmd.op in _UNARY and result and isinstance(result[-1], tuple):
+                result[-1] = (fold(result[-1][0]), result[-1][1])
+                continue
+            if (cmd.op not in _UNARY and len(result) >= 2 and isinstance(result[-1], tuple)
+                    and isinstance(result[-2], tuple)):
+                y, _ = result.pop()
+                result[-1] = (fold(result[-1][0], y), result[-1][1])
+                continue
+        result.append(cmd)
+
+    folded = []
+    for item in result:
+        if isinstance(item, tuple):
+            folded.extend(_push_constant(*item))
+        else:
+            folded.append(item)
+    return folded
+
+
+def _is_leaf(cmd):
+    """
+    true for a push the Codewriter can read while D holds an intermediate result
+    """
+    return cmd.op == Op.PUSH and (cmd.arg not in _INDEXED or cmd.n <= MAX_WALK)
+
+
+def match_branch(commands, start):
+    """
+    Finds a comparison whose result is only used by the if-goto that follows it: eq|gt|lt [not] if-goto
+
+    Args:
+        commands (list): Commands of a file
+        start (int): index of the comparison
+
+    Returns:
+        tuple: (number of commands, jump mnemonic on x - y, label), None if there is no such branch
+    """
+    jumps = JUMPS.get(commands[start].op)
+    if jumps is None or start + 1 >= len(commands):
+        return None
+    negated = commands[start + 1].op == Op.NOT
+    end = start + 1 + negated
+    if end >= len(commands) or commands[end].op != Op.IF_GOTO:
+        return None
+    return end + 1 - start, jumps[negated], commands[end].arg
+
+
+def match_expression(commands, start, max_length=32, branches=False):
+    """
+    Finds the longest expression that starts at commands[start] and can be computed in the D register alone.
+
+    An expression is a sequence of pushes, add, sub, and, or, neg and not that leaves one value on the stack and
+    never needs two intermediate results at once: every binary operation has a push among its operands.
+    push local 0 / push constant 1 / add is one, push local 0 / push local 1 / add / push local 2 / push local 3 /
+    add / sub is not. The tree of the expression is a pushing Command for a leaf, (op, operand, None) for neg and
+    not and (op, left, right) for the binary operations.
+
+    With branches, the two operands of a comparison that match_branch accepts are an expression too: the tree is
+    (eq|gt|lt, left, right) and the comparison is its last command.
+
+    Args:
+        commands (list): Commands of a file
+        start (int): index of the first command
+        branches (bool): also match the operands of the comparisons of branches
+
+    Returns:
+        tuple: (number of commands, tree) of the longest expression with at least one operation, None if there is none
+    """
+    stack = []
+    has_tree = False
+    best = None
+    for end in range(start, min(len(commands), start + max_length)):
+        cmd = commands[end]
+        if cmd.op == Op.PUSH and _is_leaf(cmd):
+            stack.append(cmd)
+        elif cmd.op in _UNARY and stack:
+            operand = stack.pop()
+            if not isinstance(operand, tuple):
+                if has_tree:
+                    break
+                has_tree = True
+            stack.append((cmd.op, operand, None))
+        elif cmd.op in _BINARY and len(stack) >= 2:
+            right = stack.pop()
+            left = stack.pop()
+            trees = isinstance(left, tuple) + isinstance(right, tuple)
+            if trees == 2 or (trees == 0 and has_tree):
+                break
+            has_tree = True
+            stack.append((cmd.op, left, right))
+        elif branches and cmd.op in JUMPS and len(stack) == 2 and match_branch(commands, end) is not None:
+            left, right = stack
+            trees = isinstance(left, tuple) + isinstance(right, tuple)
+            if trees < 2:
+                return end + 1 - start, (cmd.op, left, right)
+            break
+        else:
+            break
+        if len(stack) == 1 and has_tree:
+            best = (end + 1 - start, stack[0])
+    return best
@@ -0,0 +1,169 @@
+import sys
+from enum import IntEnum
+
+
+class Op(IntEnum):
+    """
+    Opcodes of the VM commands. Later stages index their dispatch tables with them
+    """
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+
+
+class Segment(IntEnum):
+    CONSTANT = 0
+    LOCAL = 1
+    ARGUMENT = 2
+    THIS = 3
+    THAT = 4
+    POINTER = 5
+    TEMP = 6
+    STATIC = 7
+
+
+OPCODES = {
+    "push": Op.PUSH, "pop": Op.POP,
+    "add": Op.ADD, "sub": Op.SUB, "neg": Op.NEG, "eq": Op.EQ, "gt": Op.GT, "lt": Op.LT,
+    "and": Op.AND, "or": Op.OR, "not": Op.NOT,
+    "label": Op.LABEL, "goto": Op.GOTO, "if-goto": Op.IF_GOTO,
+    "function": Op.FUNCTION, "call": Op.CALL, "return": Op.RETURN,
+}
+OP_NAMES = [None] * len(Op)
+for _name, _op in OPCODES.items():
+    OP_NAMES[_op] = _name
+
+SEGMENTS = {
+    "constant": Segment.CONSTANT, "local": Segment.LOCAL, "argument": Segment.ARGUMENT, "this": Segment.THIS,
+    "that": Segment.THAT, "pointer": Segment.POINTER, "temp": Segment.TEMP, "static": Segment.STATIC,
+}
+SEGMENT_NAMES = [None] * len(Segment)
+for _name, _segment in SEGMENTS.items():
+    SEGMENT_NAMES[_segment] = _name
+
+ARITHMETIC = frozenset([Op.ADD, Op.SUB, Op.NEG, Op.EQ, Op.GT, Op.LT, Op.AND, Op.OR, Op.NOT])
+
+# commands that take a symbol (label or function name) as first argument
+_SYMBOL_OPS = frozenset([Op.LABEL, Op.GOTO, Op.IF_GOTO, Op.FUNCTION, Op.CALL])
+# commands that take an int as second argument
+_INT_OPS = frozenset([Op.PUSH, Op.POP, Op.FUNCTION, Op.CALL])
+
+
+class Command:
+    """
+    One parsed VM command.
+
+    op is an Op, arg is a Segment for push/pop and an interned label or function name for the branching
+    and function commands, n is the offset of push/pop, the number of locals of function and the number of
+    arguments of call. line is the line of the command in its .vm file.
+    """
+    __slots__ = ("op", "arg", "n", "line")
+
+    def __init__(self, op, arg=None, n=0, line=0):
+        self.op = op
+        self.arg = arg
+        self.n = n
+        self.line = line
+
+    def __eq__(self, other):
+        return (isinstance(other, Command) and self.op == other.op and self.arg == other.arg
+                and self.n == other.n)
+
+    def __hash__(self):
+        return hash((self.op, self.arg, self.n))
+
+    def __repr__(self):
+        return "Command({0!r})".format(format_command(self))
+
+
+class Module:
+    """
+    Parsed .vm file: the name of the file without extension, static variables are named after it,
+    and its list of Commands
+    """
+    __slots__ = ("name", "commands")
+
+    def __init__(self, name, commands):
+        self.name = name
+        self.commands = commands
+
+
+def parse_command(text, line=0):
+    """
+    Parses one cleaned line of VM code into a Command
+
+    Args:
+        text (str): a line with no comment, e.g. "push local 2"
+        line (int): line number of the command in its file
+
+    Raises:
+        ValueError: when the command is not valid
+    """
+    words = text.split()
+    if len(words) > 3:
+        raise ValueError("Invalid number of commands!")
+    op = OPCODES.get(words[0])
+    if op is None:
+        raise ValueError("Invalid Command Type Detected!")
+    try:
+        if op in _SYMBOL_OPS:
+            arg = sys.intern(words[1])
+        elif op == Op.PUSH or op == Op.POP:
+            arg = SEGMENTS[words[1]]
+        else:
+            arg = None
+        n = int(words[2]) if op in _INT_OPS else 0
+    except (IndexError, KeyError, ValueError):
+        raise ValueError("Invalid command at line {0}: {1}".format(line, text))
+    return Command(op, arg, n, line)
+
+
+def format_command(cmd):
+    """
+    VM code of a Command, the inverse of parse_command
+    """
+    name = OP_NAMES[cmd.op]
+    if cmd.op == Op.PUSH or cmd.op == Op.POP:
+        return "{0} {1} {2}".format(name, SEGMENT_NAMES[cmd.arg], cmd.n)
+    if cmd.op == Op.FUNCTION or cmd.op == Op.CALL:
+        return "{0} {1} {2}".format(name, cmd.arg, cmd.n)
+    if cmd.op in _SYMBOL_OPS:
+        return name + " " + cmd.arg
+    return name
+
+
+def split_functions(commands):
+    """
+    Splits the commands of a module at its function commands
+
+    Returns:
+        list: (function name, commands) pairs in order, the function command included. Commands before the first
+              function, if any, come first with None as name
+    """
+    parts = []
+    for cmd in commands:
+        if cmd.op == Op.FUNCTION or not parts:
+            parts.append((cmd.arg if cmd.op == Op.FUNCTION else None, []))
+        parts[-1][1].append(cmd)
+    return parts
+
+
+def module_text(module):
+    """
+    VM code of a Module with the line number of every command, e.g. to hash it
+    """
+    return "\n".join("{0} {1}".format(cmd.line, format_command(cmd)) for cmd in module.commands)
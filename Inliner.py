@@ -0,0 +1,210 @@
+from Codewriter import Codewriter
+from IR import Command, Module, Op, Segment, split_functions
+from Linker import count_instructions
+
+# change of the stack depth made by every command, return is checked separately
+_STACK_EFFECT = {Op.PUSH: 1, Op.POP: -1, Op.ADD: -1, Op.SUB: -1, Op.AND: -1, Op.OR: -1, Op.EQ: -1, Op.GT: -1,
+                 Op.LT: -1, Op.NEG: 0, Op.NOT: 0, Op.LABEL: 0, Op.GOTO: 0, Op.IF_GOTO: -1}
+
+
+def _returns_one_value(body):
+    """
+    true when the stack of the function holds exactly its return value at every return, so the body can run on
+    the stack of the caller. Every label must be reached with the same stack depth
+    """
+    depth = 0
+    label_depths = {}
+    for cmd in body:
+        if cmd.op == Op.LABEL:
+            if depth is None:
+                depth = label_depths.get(cmd.arg)
+                if depth is None:
+                    return False
+            elif label_depths.setdefault(cmd.arg, depth) != depth:
+                return False
+            continue
+        if depth is None:
+            # unreachable command
+            continue
+        if cmd.op == Op.RETURN:
+            if depth != 1:
+                return False
+            depth = None
+            continue
+        depth += _STACK_EFFECT[cmd.op]
+        if depth < 0:
+            return False
+        if cmd.op == Op.GOTO or cmd.op == Op.IF_GOTO:
+            if label_depths.setdefault(cmd.arg, depth) != depth:
+                return False
+            if cmd.op == Op.GOTO:
+                depth = None
+    return depth is None
+
+
+class _Callee:
+    """
+    A function that can be inlined: its number of locals, body without the function command, the pointer
+    entries it writes and whether it uses static variables
+    """
+
+    def __init__(self, module_name, n_locals, body):
+        self.module_name = module_name
+        self.n_locals = n_locals
+        self.body = body
+        self.pointers = sorted({cmd.n for cmd in body if cmd.op == Op.POP and cmd.arg == Segment.POINTER})
+        self.uses_statics = any(cmd.arg == Segment.STATIC for cmd in body if cmd.op in (Op.PUSH, Op.POP))
+
+
+class Inliner:
+    """
+    Whole program pass that replaces calls of small leaf functions with the body of the function.
+
+    A leaf function (it calls nothing) of at most budget commands is inlined when it returns exactly one value
+    from a clean stack. Its arguments, locals and the pointer entries it changes (a call would restore THIS and
+    THAT) move to extra local variables of the caller, its labels get a suffix unique to the call site and a
+    return that is not the last command jumps to the end of the inlined body. Functions that use static variables
+    are only inlined in their own file.
+
+    A site is inlined when the cycles of call, function entry and return (measured on the Codewriter templates)
+    are more than the cycles of moving the arguments and locals and of zeroing the extra locals of the caller. Functions no longer called are then removed by
+    the DeadFunctionEliminator.
+    """
+
+    def __init__(self, budget=10, verbose=True, compact=False):
+        """
+        Args:
+            budget (int): largest number of commands of an inlined function, not counting the function command.
+                          A larger budget inlines more functions: faster code, usually more ROM. 0 inlines nothing
+            verbose (bool): print the inlined functions with their number of sites and the estimated gain
+            compact (bool): the program is translated in compact mode, used to measure the costs
+        """
+        self.budget = budget
+        self.verbose = verbose
+        self.compact = compact
+        # function -> [sites, cycles saved by one call at every site, ROM change of all sites]
+        self.report = {}
+        self._costs = {}
+
+    def _cost(self, *commands, executed=True):
+        """
+        Instructions of commands in the Codewriter templates. They have no loop, so the instructions executed are
+        the ROM instructions plus, in compact mode, the shared routines they jump to
+
+        Args:
+            executed (bool): count the shared routines, False counts the ROM instructions of the commands only
+        """
+        key = (tuple((cmd.op, cmd.arg, cmd.n) for cmd in commands), executed)
+        if key not in self._costs:
+            cw = Codewriter(verbose=False, compact=self.compact)
+            cw.set_file_name("Inliner.vm")
+            for cmd in commands:
+                cw.write_command(cmd)
+            if executed:
+                cw.write_shared_routines(cw.routine_calls, halt=False)
+            self._costs[key] = count_instructions(cw.get_queue().lines())
+        return self._costs[key]
+
+    def run(self, modules):
+        """
+        Args:
+            modules (list): Module of every file of the program
+
+        Returns:
+            list: the modules with the small leaf functions inlined
+        """
+        self.report = {}
+        if self.budget <= 0:
+            return modules
+        callees = {}
+        for module in modules:
+            for function_name, commands in split_functions(module.commands):
+                body = commands[1:]
+                if (function_name is not None and function_name != "Sys.init" and len(body) <= self.budget
+                        and not any(cmd.op == Op.CALL for cmd in body) and _returns_one_value(body)):
+                    callees[function_name] = _Callee(module.name, commands[0].n, body)
+
+        result = []
+        for module in modules:
+            commands = []
+            for function_name, function_commands in split_functions(module.commands):
+                if function_name is None:
+                    commands.extend(function_commands)
+                else:
+                    commands.extend(self._inline_function(module.name, function_commands, callees))
+            result.append(Module(module.name, commands))
+
+        if self.verbose and self.report:
+            print("Inlined {0} call site(s) of {1} function(s):".format(
+                sum(sites for sites, _, _ in self.report.values()), len(self.report)))
+            for function_name in sorted(self.report):
+                sites, cycles, rom = self.report[function_name]
+                print("    {0:32} {1:5} site(s), ~{2} cycles saved per call, {3:+} ROM instructions".format(
+                    function_name, sites, cycles // sites, rom))
+        return result
+
+    def _inline_function(self, module_name, function_commands, callees):
+        header = function_commands[0]
+        base = header.n
+        extra_locals = 0
+        body = []
+        site = 0
+        for cmd in function_commands[1:]:
+            callee = callees.get(cmd.arg) if cmd.op == Op.CALL else None
+            if callee is None or (callee.uses_statics and callee.module_name != module_name):
+                body.append(cmd)
+                continue
+            n_slots = cmd.n + callee.n_locals + len(callee.pointers)
+            inlined = self._expand(cmd, callee, base, "$inline{0}".format(site))
+            saved = (self._cost(cmd, Command(Op.FUNCTION, cmd.arg, callee.n_locals), Command(Op.RETURN))
+                     - self._cost(*inlined[:cmd.n + 2 * (callee.n_locals + len(callee.pointers))])
+                     - self._cost(*[Command(Op.PUSH, Segment.CONSTANT, 0)] * max(n_slots - extra_locals, 0)))
+            if saved <= 0:
+                body.append(cmd)
+                continue
+            body.extend(inlined)
+            extra_locals = max(extra_locals, n_slots)
+            site += 1
+            entry = self.report.setdefault(cmd.arg, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += saved
+            entry[2] += self._cost(*inlined, executed=False) - self._cost(cmd, executed=False)
+        return [Command(Op.FUNCTION, header.arg, base + extra_locals, header.line)] + body
+
+    def _expand(self, call, callee, base, suffix):
+        """
+        Commands that replace call: move the arguments from the stack to the caller locals base ..., zero the locals
+        of the callee, save the pointer entries, then the body and the restore of the pointer entries
+        """
+        line = call.line
+        n_args = call.n
+        saved_pointers = {pointer: base + n_args + callee.n_locals + i for i, pointer in enumerate(callee.pointers)}
+        code = [Command(Op.POP, Segment.LOCAL, base + i, line) for i in reversed(range(n_args))]
+        for i in range(callee.n_locals):
+            code.append(Command(Op.PUSH, Segment.CONSTANT, 0, line))
+            code.append(Command(Op.POP, Segment.LOCAL, base + n_args + i, line))
+        for pointer, slot in saved_pointers.items():
+            code.append(Command(Op.PUSH, Segment.POINTER, pointer, line))
+            code.append(Command(Op.POP, Segment.LOCAL, slot, line))
+
+        end_label = "END" + suffix
+        needs_end = False
+        for i, cmd in enumerate(callee.body):
+            if cmd.op in (Op.PUSH, Op.POP) and cmd.arg == Segment.ARGUMENT:
+                code.append(Command(cmd.op, Segment.LOCAL, base + cmd.n, line))
+            elif cmd.op in (Op.PUSH, Op.POP) and cmd.arg == Segment.LOCAL:
+                code.append(Command(cmd.op, Segment.LOCAL, base + n_args + cmd.n, line))
+            elif cmd.op in (Op.LABEL, Op.GOTO, Op.IF_GOTO):
+                code.append(Command(cmd.op, cmd.arg + suffix, 0, line))
+            elif cmd.op == Op.RETURN:
+                if i != len(callee.body) - 1:
+                    code.append(Command(Op.GOTO, end_label, 0, line))
+                    needs_end = True
+            else:
+                code.append(Command(cmd.op, cmd.arg, cmd.n, line))
+        if needs_end:
+            code.append(Command(Op.LABEL, end_label, 0, line))
+        for pointer, slot in saved_pointers.items():
+            code.append(Command(Op.PUSH, Segment.LOCAL, slot, line))
+            code.append(Command(Op.POP, Segment.POINTER, pointer, line))
+        return code
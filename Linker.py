@@ -0,0 +1,282 @@
+import json
+import re
+
+from Codewriter import Codewriter
+
+
+# Hack maps static variables on RAM[16 ... 255]
+MAX_STATICS = 240
+
+# a line that starts with whitespace, see count_instructions
+_INDENTED_LINE = re.compile(r"^[^\S\n]", re.MULTILINE)
+
+
+class LinkError(ValueError):
+    """
+    Raised when the objects of a program do not fit together
+    """
+
+
+def count_instructions(lines):
+    """
+    Number of Hack instructions in lines of asm code: comments, labels and empty lines take no ROM
+
+    Args:
+        lines (iterable): lines of asm code, a line may contain several lines separated by newlines
+    """
+    text = "\n".join(lines)
+    if _INDENTED_LINE.search(text):
+        # indented lines, only those need to be stripped
+        pieces = [piece.strip() if piece[:1].isspace() else piece for piece in text.split("\n")]
+    else:
+        # the generated code is never indented: one split and a check of the first character of every line
+        pieces = text.split("\n")
+    return len([piece for piece in pieces if piece and piece[0] != "/" and piece[0] != "("])
+
+
+class ObjectFile:
+    """
+    Translation of one .vm file: its asm code and the symbols it defines and references.
+
+    Object files are produced independently (in worker processes, or read back from the cache)
+    and the Linker assembles them into the final program.
+    """
+
+    def __init__(self, name, code, functions, calls, statics, routine_calls=None):
+        """
+        Args:
+            name (str): name of the .vm file without extension
+            code (str): asm code of the file
+            functions (list): functions defined by the file
+            calls (list): functions called by the file
+            statics (list): static symbols used by the file, e.g. Foo.3
+            routine_calls (dict): number of call sites of every shared routine of compact mode
+        """
+        self.name = name
+        self.code = code
+        self.functions = list(functions)
+        self.calls = sorted(calls)
+        self.statics = sorted(statics)
+        self.routine_calls = dict(routine_calls or {})
+        # size of the code before the optimizer ran, None when it was not optimized
+        self.unoptimized_size = None
+        # TranslationStats of the translation of the file when it was asked for, not serialized
+        self.stats = None
+        # code counted by instruction_count and its number of instructions
+        self._counted_code = None
+        self._instruction_count = 0
+
+    @classmethod
+    def from_codewriter(cls, name, cw):
+        """
+        Object file of the code translated by a Codewriter
+        """
+        code = "\n".join(cw.get_queue().lines()) + "\n"
+        return cls(name, code, cw.functions, cw.calls, cw.statics, cw.routine_calls)
+
+    @classmethod
+    def join(cls, parts):
+        """
+        Object file of a .vm file translated in several parts, e.g. the chunks of a large file, in order
+        """
+        first = parts[0]
+        obj = cls(first.name, "".join(part.code if part.code.endswith("\n") else part.code + "\n" for part in parts),
+                  [name for part in parts for name in part.functions],
+                  set().union(*(part.calls for part in parts)), set().union(*(part.statics for part in parts)))
+        for part in parts:
+            for routine, sites in part.routine_calls.items():
+                obj.routine_calls[routine] = obj.routine_calls.get(routine, 0) + sites
+        if first.unoptimized_size is not None:
+            obj.unoptimized_size = sum(part.unoptimized_size for part in parts)
+        if first.stats is not None:
+            obj.stats = first.stats
+            for part in parts[1:]:
+                obj.stats.merge(part.stats)
+        return obj
+
+    def instruction_count(self):
+        """
+        Number of ROM instructions of the code, counted again only when the code was replaced, e.g. by the
+        optimizer. Watch mode links the same objects after every change
+        """
+        if self._counted_code is not self.code:
+            self._instruction_count = count_instructions([self.code])
+            self._counted_code = self.code
+        return self._instruction_count
+
+    def to_text(self):
+        """
+        Serializes the object file, see from_text
+        """
+        return json.dumps({"name": self.name, "code": self.code, "functions": self.functions,
+                           "calls": self.calls, "statics": self.statics,
+                           "routine_calls": self.routine_calls, "unoptimized_size": self.unoptimized_size})
+
+    @classmethod
+    def from_text(cls, text):
+        data = json.loads(text)
+        obj = cls(data["name"], data["code"], data["functions"], data["calls"], data["statics"],
+                  data["routine_calls"])
+        obj.unoptimized_size = data["unoptimized_size"]
+        return obj
+
+
+class Linker:
+    """
+    Whole program phase of the translation: emits the bootstrap code once, checks the references between
+    the object files and writes them into one .asm file
+    """
+
+    def __init__(self, verbose=True, source_map=False):
+        """
+        Args:
+            verbose (bool): print the ROM size of the program and what the link phase saved
+            source_map (bool): write source map markers in the bootstrap code and the shared routines
+        """
+        self.verbose = verbose
+        self.source_map = source_map
+
+    def check(self, objects, bootstrap):
+        """
+        Checks that every called function is defined exactly once and that the statics fit in RAM[16 ... 255].
+        The sequential and streaming modes check the symbols of their files the same way, see
+        VMTranslator.take_symbols
+
+        Args:
+            objects (list): ObjectFile of every file of the program
+            bootstrap (bool): the program starts with the bootstrap code, which calls Sys.init
+
+        Raises:
+            LinkError: with one line per problem found
+        """
+        errors = []
+        defined = {}
+        for obj in objects:
+            for function_name in obj.functions:
+                if function_name in defined:
+                    errors.append("function {0} is defined in {1}.vm and {2}.vm".format(
+                        function_name, defined[function_name], obj.name))
+                else:
+                    defined[function_name] = obj.name
+        if bootstrap and "Sys.init" not in defined:
+            errors.append("function Sys.init called by the bootstrap code is not defined")
+        for obj in objects:
+            for function_name in obj.calls:
+                if function_name not in defined:
+                    errors.append("function {0} called in {1}.vm is not defined".format(function_name, obj.name))
+
+        statics = set()
+        for obj in objects:
+            for symbol in obj.statics:
+                if symbol.rsplit(".", 1)[0] != obj.name:
+                    errors.append("static {0} used in {1}.vm belongs to another file".format(symbol, obj.name))
+                if symbol in defined:
+                    errors.append("static {0} has the same name as a function".format(symbol))
+            statics.update(obj.statics)
+        if len(statics) > MAX_STATICS:
+            errors.append("the program uses {0} static variables, RAM[16 ... 255] holds {1}".format(
+                len(statics), MAX_STATICS))
+
+        if errors:
+            raise LinkError("\n".join(errors))
+
+    def link(self, objects, asm_file, bootstrap):
+        """
+        Writes the program made of the object files to asm_file
+
+        Args:
+            objects (list): ObjectFile of every file of the program, in output order
+            asm_file (file): file opened for writing text
+            bootstrap (bool): emit the bootstrap code (SP=256, call Sys.init) at the start of the program
+
+        Returns:
+            int: number of ROM instructions in the program
+        """
+        self.check(objects, bootstrap)
+        rom_size = 0
+        if bootstrap:
+            cw = Codewriter(verbose=False, source_map=self.source_map)
+            cw.write_init()
+            bootstrap_code = cw.get_queue().lines()
+            rom_size += count_instructions(bootstrap_code)
+            asm_file.write("\n".join(bootstrap_code) + "\n")
+        routine_calls = {}
+        for obj in objects:
+            rom_size += obj.instruction_count()
+            asm_file.write(obj.code)
+            for routine, sites in obj.routine_calls.items():
+                routine_calls[routine] = routine_calls.get(routine, 0) + sites
+        if routine_calls:
+            cw = Codewriter(verbose=False, source_map=self.source_map)
+            cw.write_shared_routines(routine_calls, halt=not bootstrap)
+            routines_code = cw.get_queue().lines()
+            rom_size += count_instructions(routines_code)
+            asm_file.write("\n".join(routines_code) + "\n")
+
+        if self.verbose:
+            # before the link phase every file started with its own copy of the bootstrap code
+            saved = bootstrap_size() * (len(objects) - 1 if bootstrap else len(objects))
+            print("Linked {0} file(s): {1} ROM instructions, {2} saved by emitting the bootstrap code once".format(
+                len(objects), rom_size, saved))
+            if routine_calls:
+                print_compact_tradeoff(routine_calls)
+        return rom_size
+
+
+def bootstrap_size():
+    """
+    Number of ROM instructions of the bootstrap code
+    """
+    cw = Codewriter(verbose=False)
+    cw.write_init()
+    return count_instructions(cw.get_queue().lines())
+
+
+def _sizes(write):
+    """
+    Number of ROM instructions written by write(cw) in normal and in compact mode
+    """
+    sizes = []
+    for compact in (False, True):
+        cw = Codewriter(verbose=False, compact=compact)
+        write(cw)
+        sizes.append(count_instructions(cw.get_queue().lines()))
+    return sizes
+
+
+def compact_tradeoff(routine_calls):
+    """
+    Size and speed of compact mode compared with inlining every call, return and comparison
+
+    Args:
+        routine_calls (dict): number of call sites of every shared routine
+
+    Returns:
+        list: (routine, sites, inline size, call site size, routine size, extra cycles per use) tuples.
+              The extra cycles count the instructions executed on the longest path of the routine
+    """
+    writers = {Codewriter.CALL_ROUTINE: lambda cw: cw.write_call("f", 0),
+               Codewriter.RETURN_ROUTINE: lambda cw: cw.write_return()}
+    for cmd, routine in Codewriter.COMPARE_ROUTINES.items():
+        writers[routine] = lambda cw, cmd=cmd: cw.write_arithmetic(cmd)
+    rows = []
+    for routine in sorted(routine_calls):
+        inline_size, site_size = _sizes(writers[routine])
+        cw = Codewriter(verbose=False)
+        cw.write_shared_routines([routine], halt=False)
+        routine_size = count_instructions(cw.get_queue().lines())
+        rows.append((routine, routine_calls[routine], inline_size, site_size, routine_size,
+                     site_size + routine_size - inline_size))
+    return rows
+
+
+def print_compact_tradeoff(routine_calls):
+    rows = compact_tradeoff(routine_calls)
+    saved = 0
+    print("Compact mode:  routine    sites  inline  site  routine  ROM saved  extra cycles/use")
+    for routine, sites, inline_size, site_size, routine_size, extra_cycles in rows:
+        routine_saved = sites * (inline_size - site_size) - routine_size
+        saved += routine_saved
+        print("               {0:9} {1:6} {2:7} {3:5} {4:8} {5:10} {6:17}".format(
+            routine, sites, inline_size, site_size, routine_size, routine_saved, extra_cycles))
+    print("               total ROM saved: {0}".format(saved))
@@ -1,17 +1,155 @@
-from queue import Queue
+import mmap
+import os
+import re
+from collections import deque
+
+from IR import Module, parse_command
+
+# a function command at the start of a line, where find_chunks splits a file
+_FUNCTION_LINE = re.compile(rb"^[ \t]*function[ \t]", re.MULTILINE)
+
+
+def clean_lines(lines, first_line=1):
+    """
+    Yields the numbered lines of code of lines of VM code, with empty lines and comments removed
+
+    Args:
+        lines (iterable): lines of VM code
+        first_line (int): line number of the first line
+
+    Yields:
+        tuple: line number and the next cleaned line of code
+    """
+    for line_number, line in enumerate(lines, first_line):
+        newline = line.split('//')[0].strip()
+        if newline:
+            yield line_number, newline
+
+
+class Chunk:
+    """
+    Byte range of a .vm file that starts at a function command (or at the start of the file), see find_chunks
+    """
+    __slots__ = ("file_path", "index", "start", "end", "first_line")
+
+    def __init__(self, file_path, index, start, end, first_line):
+        """
+        Args:
+            file_path (str): the .vm file
+            index (int): position of the chunk in the file, from 0
+            start (int): offset of its first byte
+            end (int): offset after its last byte
+            first_line (int): line number of its first line
+        """
+        self.file_path = file_path
+        self.index = index
+        self.start = start
+        self.end = end
+        self.first_line = first_line
+
+
+def find_chunks(file_path, chunk_size):
+    """
+    Splits a .vm file into chunks of about chunk_size bytes that start at function commands, so that every
+    chunk can be parsed and translated on its own. The file is memory-mapped and searched for the first function
+    command after every chunk_size bytes, the lines are not read one by one
+
+    Args:
+        file_path (str): the .vm file
+        chunk_size (int): smallest size of a chunk in bytes, the last one excepted. A file smaller than that is
+                          one chunk
+
+    Returns:
+        list: the Chunks of the file, in order
+    """
+    with open(file_path, "rb") as vm_file:
+        size = os.fstat(vm_file.fileno()).st_size
+        if size <= chunk_size:
+            return [Chunk(file_path, 0, 0, size, 1)]
+        with mmap.mmap(vm_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            starts = [0]
+            while True:
+                match = _FUNCTION_LINE.search(data, starts[-1] + chunk_size)
+                if match is None:
+                    break
+                starts.append(match.start())
+            chunks = []
+            line = 1
+            for index, start in enumerate(starts):
+                end = starts[index + 1] if index + 1 < len(starts) else size
+                chunks.append(Chunk(file_path, index, start, end, line))
+                line += data[start:end].count(b"\n")
+    return chunks
+
+
+def parse_chunk(chunk):
+    """
+    Parses a chunk of a .vm file, read from a memory map of the file, into a Module named after the file.
+    The commands keep their line numbers in the file
+    """
+    text = ""
+    if chunk.end > chunk.start:
+        with open(chunk.file_path, "rb") as vm_file:
+            with mmap.mmap(vm_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                text = data[chunk.start:chunk.end].decode()
+    name = os.path.splitext(os.path.basename(chunk.file_path))[0]
+    return Module(name, [parse_command(line, line_number)
+                         for line_number, line in clean_lines(text.split("\n"), chunk.first_line)])
+
+
+def parse_source(name, source):
+    """
+    Parses VM code held in memory into a Module, as if it were read from the file name.vm
+
+    Args:
+        name (str): name of the module, static variables are named after it
+        source (str or bytes): the VM code, bytes are decoded as UTF-8
+
+    Returns:
+        Module: the parsed commands, with their line numbers in source
+    """
+    if not isinstance(source, str):
+        source = bytes(source).decode()
+    return Module(name, [parse_command(line, line_number) for line_number, line in clean_lines(source.split("\n"))])
 
 
 class Parser:
 
     arithCmds = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
-    cmd_type = None
-    arg0 = None
-    arg1 = None
-    arg2 = None
 
-    def __init__(self, file_path):
-        self.rq = self.pre_process(file_path)
+    def __init__(self, file_path, stream=False):
+        """
+        Args:
+            file_path (str): Path to the .vm file.
+            stream (bool): read the file lazily, one command at a time, instead of loading it into a queue first
+        """
+        self.file_path = file_path
+        # state of the current command, per instance so that several parsers can be used at the same time
+        self.cmd_type = None
+        self.arg0 = None
+        self.arg1 = None
+        self.arg2 = None
+        self.line_number = 0
+        self.stream = stream
+        if stream:
+            self.rq = None
+            self._lines = self.clean_lines(file_path)
+            self._next_line = next(self._lines, None)
+        else:
+            self.rq = self.pre_process(file_path)
+
+    def clean_lines(self, file_path):
+        """
+        Generator that yields the lines of the file with empty lines and comments removed.
 
+        Args:
+            file_path (str): Path to the .vm file.
+
+        Yields:
+            tuple: line number and the next cleaned line of code
+        """
+        with open(file_path, 'r') as vm_file:
+            yield from clean_lines(vm_file)
 
     def pre_process(self, file_path):
         """
@@ -21,21 +159,17 @@ class Parser:
             file_path (str): Path to the .vm file.
 
         Returns:
-            Queue: Queue containing the cleaned lines of code.
+            deque: queue containing the line numbers and the cleaned lines of code.
         """
-        cleaned_queue = Queue()
-        with open(file_path, 'r') as vm_file:
-            for line in vm_file:
-                newline = line.split('//')[0].strip()
-                if newline:
-                    cleaned_queue.put(newline)
-        return cleaned_queue
+        return deque(self.clean_lines(file_path))
     
     def has_more_lines(self):
         """
         return true if queue is not empty otherwise false
         """
-        return not self.rq.empty()
+        if self.stream:
+            return self._next_line is not None
+        return len(self.rq) > 0
     
     def advance(self):
         """
@@ -48,8 +182,36 @@ class Parser:
             string: top most line of comments in the queue on the queue
 
         """
-        if self.has_more_lines():
-            return self.rq.get()
+        if self.stream:
+            numbered_line = self._next_line
+            self._next_line = next(self._lines, None)
+        elif self.has_more_lines():
+            numbered_line = self.rq.popleft()
+        else:
+            return None
+        self.line_number, line = numbered_line
+        return line
+
+    def __iter__(self):
+        """
+        Yields the remaining lines of commands one by one
+        """
+        while self.has_more_lines():
+            yield self.advance()
+
+    def commands(self):
+        """
+        Yields the remaining commands parsed into IR Commands, see IR.parse_command
+        """
+        for line in self:
+            yield parse_command(line, self.line_number)
+
+    def module(self):
+        """
+        Parses the whole file into an IR Module named after the file
+        """
+        name = os.path.splitext(os.path.basename(self.file_path))[0]
+        return Module(name, list(self.commands()))
 
     def command_type(self, cmd_line):
         """
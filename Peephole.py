@@ -0,0 +1,123 @@
+import re
+
+
+def _pattern(*instructions, **groups):
+    """
+    Compiles the instructions of a window. {name} matches a symbol or number and captures it as name,
+    groups gives a different regex for some names
+    """
+    compiled = []
+    for instruction in instructions:
+        regex = re.escape(instruction).replace(r"\{", "{").replace(r"\}", "}")
+        regex = re.sub(r"{(\w+)}",
+                       lambda match: "(?P<{0}>{1})".format(match.group(1), groups.get(match.group(1), r"[\w.$:]+")),
+                       regex)
+        compiled.append(re.compile(regex + "$"))
+    return compiled
+
+
+def _store_d(segment, offset, scratch):
+    """
+    Instructions that store D into segment[offset] without going through the stack
+    """
+    offset = int(offset)
+    if offset <= 10:
+        # walk the address up from the base, cheaper than computing it for small offsets
+        if offset == 0:
+            return ["@" + segment, "A=M", "M=D"]
+        return ["@" + segment, "A=M+1"] + ["A=A+1"] * (offset - 1) + ["M=D"]
+    return ["@" + scratch, "M=D", "@" + segment, "D=M", "@" + str(offset), "D=D+A",
+            "@R13", "M=D", "@" + scratch, "D=M", "@R13", "A=M", "M=D"]
+
+
+_PUSH_D = ("@SP", "A=M", "M=D", "@SP", "M=M+1")
+
+# (window, replacement) pairs. A window is a list of consecutive instructions with no label in between,
+# the replacement is a function of the captured symbols that returns the equivalent shorter instructions
+_RULES = [
+    # push D then pop into D: the value is already in D
+    (_pattern(*_PUSH_D, "@SP", "AM=M-1", "D=M"),
+     lambda captured: []),
+    # push D then pop segment i: store D directly, e.g. push constant 5 / pop local 0
+    (_pattern(*_PUSH_D, "@{segment}", "D=M", "@{offset}", "D=D+A", "@SP", "AM=M-1", "D=D+M", "A=D-M", "M=D-A",
+              segment="LCL|ARG|THIS|THAT", offset=r"\d+"),
+     lambda captured: _store_d(captured["segment"], captured["offset"], "R14")),
+    # SP++ then SP--
+    (_pattern("@SP", "M=M+1", "@SP", "AM=M-1"),
+     lambda captured: ["@SP", "A=M"]),
+    # what remains of push D then pop into D once SP++ then SP-- was rewritten
+    (_pattern("@SP", "A=M", "M=D", "@SP", "A=M", "D=M"),
+     lambda captured: []),
+    # binary operation: pop one operand and update the other in place instead of popping and pushing it
+    (_pattern("@SP", "AM=M-1", "M=M{op}D", "@SP", "M=M+1", op="[-+&|]"),
+     lambda captured: ["@SP", "A=M-1", "M=M" + captured["op"] + "D"]),
+    # tos mode: binary operation on x and y in D written back to the stack, update x in place instead.
+    # D is never read after a push, so it does not need the result
+    (_pattern("@SP", "AM=M-1", "D={operation}", *_PUSH_D, operation=r"D\+M|M-D|D&M|D\|M"),
+     lambda captured: ["@SP", "A=M-1", "M=" + captured["operation"]]),
+    # neg, not: update the top of the stack in place
+    (_pattern("@SP", "AM=M-1", "M={op}M", "@SP", "M=M+1", op="[-!]"),
+     lambda captured: ["@SP", "A=M-1", "M=" + captured["op"] + "M"]),
+]
+
+
+def is_instruction(piece):
+    """
+    true for a Hack instruction, false for comments, labels and empty lines
+    """
+    piece = piece.strip()
+    return bool(piece) and not piece.startswith("//") and not piece.startswith("(")
+
+
+class PeepholeOptimizer:
+    """
+    Rewrites windows of consecutive Hack instructions emitted by the Codewriter templates into shorter
+    equivalent code, e.g. a push immediately followed by a pop.
+
+    Windows never span a label, since a jump to the label could enter the window in the middle.
+    Comments inside a rewritten window are kept and placed before the new instructions.
+    """
+
+    def optimize(self, lines):
+        """
+        Args:
+            lines (list): lines of asm code, a line may contain several lines separated by newlines
+
+        Returns:
+            list: the optimized lines of asm code
+        """
+        self._out = []
+        # positions in self._out of the instructions since the last label
+        self._instructions = []
+        for line in lines:
+            for piece in line.split("\n"):
+                if is_instruction(piece):
+                    self._append(piece.strip())
+                else:
+                    if piece.strip().startswith("("):
+                        self._instructions = []
+                    self._out.append(piece)
+        return self._out
+
+    def _append(self, instruction):
+        self._instructions.append(len(self._out))
+        self._out.append(instruction)
+        for window, replacement in _RULES:
+            size = len(window)
+            if len(self._instructions) < size:
+                continue
+            positions = self._instructions[-size:]
+            captured = {}
+            for regex, position in zip(window, positions):
+                match = regex.match(self._out[position])
+                if match is None:
+                    break
+                captured.update(match.groupdict())
+            else:
+                # drop the instructions of the window, keep the comments in between
+                for position in reversed(positions):
+                    del self._out[position]
+                del self._instructions[-size:]
+                for new_instruction in replacement(captured):
+                    self._append(new_instruction)
+                return
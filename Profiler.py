@@ -0,0 +1,261 @@
+import os
+import sys
+
+from Codewriter import Codewriter
+from Emulator import Emulator
+from SourceMap import SourceMap
+
+
+class _Frame:
+    __slots__ = ("function_name", "return_address", "caller_lcl", "call_line", "start", "stack_key")
+
+    def __init__(self, function_name, return_address, caller_lcl, call_line, start, stack_key):
+        self.function_name = function_name
+        self.return_address = return_address
+        self.caller_lcl = caller_lcl
+        self.call_line = call_line
+        self.start = start
+        self.stack_key = stack_key
+
+
+class Profiler:
+    """
+    Cycle profile of a program running on the Emulator, by VM function and by .vm line.
+
+    The profiler follows the calls with a shadow stack. A call is recognized from the block that jumps: the call
+    sequence saves the address that follows its jump as the return address of the new frame, at LCL - 5. A block
+    that starts at the entry of a function, with LCL == SP as the calling convention leaves them, is a call only
+    when the block that ran before it ends right before that saved return address. A goto back to a label at the
+    entry of a function without locals lands there with LCL == SP too, but from a block inside the function. The
+    call returns to the instruction that follows the jump of the caller, and reaching that instruction again with
+    the LCL of the caller restored is the return. The checks of the frame matter because the return address of
+    the last call of a file and the first function of the next file can share a ROM address.
+
+    Exclusive cycles are the instructions executed in a function or line itself, inclusive cycles add
+    the functions it called. A recursive function is counted once in the inclusive cycles of its outermost call.
+
+    A tail call (see Codewriter._write_tail_call) jumps to the entry of a function with LCL == SP too, from a block
+    that ends with the code marked TAIL_CALL. The function it leaves never returns: its frame is replaced by the
+    new one, which returns to the same address.
+
+    Generated code (bootstrap, the shared routines of compact mode) has a function name that starts with < or $.
+    The shared routines run on behalf of the VM function on top of the stack and are charged to it.
+    """
+
+    def __init__(self, source_map, ram):
+        """
+        Args:
+            source_map (SourceMap): the source map of the program
+            ram (array): RAM of the Emulator that runs the program
+        """
+        self.source_map = source_map
+        self.ram = ram
+        self.cycles = 0
+        self.function_cycles = {}
+        self.function_inclusive = {}
+        self.function_calls = {}
+        # keyed by the (file, line, function) entries of the source map
+        self.line_cycles = {}
+        self.line_callee_cycles = {}
+        # exclusive cycles by call stack, e.g. "Sys.init;Main.run;Point.plus"
+        self.stack_cycles = {}
+        self._stack = []
+        self._active_functions = {}
+        self._active_lines = {}
+        self._return_addresses = {}
+        self._block_lines = {}
+        self._caller_end = 0
+        self._caller_line = None
+        self._tail_call = False
+
+    def trace(self, pc, size):
+        """
+        Called by Emulator.run for every block it runs
+        """
+        entries = self.source_map.entries
+        stack = self._stack
+        function_name = self.source_map.function_entries.get(pc)
+        if function_name is not None and self._tail_call and stack:
+            frame = stack.pop()
+            self._finish(frame)
+            self._caller_end, self._caller_line = frame.return_address, frame.call_line
+            self._push(function_name)
+        elif function_name is not None and self._called():
+            self._push(function_name)
+        elif pc in self._return_addresses and self._returned(pc):
+            while True:
+                frame = stack.pop()
+                self._finish(frame)
+                if frame.return_address == pc:
+                    break
+
+        lines = self._block_lines.get(pc)
+        if lines is None:
+            lines = self._block_lines[pc] = self._count_lines(pc, size)
+        for line, count in lines:
+            self.line_cycles[line] = self.line_cycles.get(line, 0) + count
+        if stack:
+            top = stack[-1].function_name
+            stack_key = stack[-1].stack_key
+        else:
+            top = stack_key = entries[pc][2] if pc < len(entries) else ""
+        self.function_cycles[top] = self.function_cycles.get(top, 0) + size
+        self.stack_cycles[stack_key] = self.stack_cycles.get(stack_key, 0) + size
+        self.cycles += size
+
+        last = pc + size - 1
+        self._tail_call = last < len(entries) and entries[last][2] == Codewriter.TAIL_CALL
+        if last < len(entries) and not entries[last][2].startswith("$"):
+            # a call made by this block returns right after it
+            self._caller_end = last + 1
+            self._caller_line = entries[last]
+
+    def _called(self):
+        """
+        True when the block that ran last is the jump of a call, see the class docstring
+        """
+        lcl = self.ram[1]
+        return self.ram[0] == lcl and lcl >= 5 and self.ram[lcl - 5] == self._caller_end
+
+    def _returned(self, pc):
+        """
+        True when the program is back at the return address pc of a running call, in the frame of its caller
+        """
+        for frame in reversed(self._stack):
+            if frame.return_address == pc:
+                return self.ram[1] == frame.caller_lcl
+        return False
+
+    def _count_lines(self, pc, size):
+        counts = {}
+        for entry in self.source_map.entries[pc:pc + size]:
+            counts[entry] = counts.get(entry, 0) + 1
+        return list(counts.items())
+
+    def _push(self, function_name):
+        parent = self._stack[-1].stack_key + ";" if self._stack else ""
+        # the LCL of the caller, saved by the call sequence below the LCL of the new frame
+        caller_lcl = self.ram[self.ram[1] - 4]
+        frame = _Frame(function_name, self._caller_end, caller_lcl, self._caller_line, self.cycles,
+                       parent + function_name)
+        self._stack.append(frame)
+        self.function_calls[function_name] = self.function_calls.get(function_name, 0) + 1
+        self._active_functions[function_name] = self._active_functions.get(function_name, 0) + 1
+        self._active_lines[frame.call_line] = self._active_lines.get(frame.call_line, 0) + 1
+        self._return_addresses[frame.return_address] = self._return_addresses.get(frame.return_address, 0) + 1
+
+    def _finish(self, frame):
+        cycles = self.cycles - frame.start
+        self._active_functions[frame.function_name] -= 1
+        if not self._active_functions[frame.function_name]:
+            self.function_inclusive[frame.function_name] = (self.function_inclusive.get(frame.function_name, 0)
+                                                            + cycles)
+        self._active_lines[frame.call_line] -= 1
+        if not self._active_lines[frame.call_line]:
+            self.line_callee_cycles[frame.call_line] = self.line_callee_cycles.get(frame.call_line, 0) + cycles
+        self._return_addresses[frame.return_address] -= 1
+        if not self._return_addresses[frame.return_address]:
+            del self._return_addresses[frame.return_address]
+
+    def finish(self):
+        """
+        Ends the functions still running when the program stopped, e.g. Sys.init
+        """
+        while self._stack:
+            self._finish(self._stack.pop())
+
+    def function_table(self):
+        """
+        Returns:
+            list: (function, calls, inclusive cycles, exclusive cycles) tuples, most expensive first
+        """
+        names = set(self.function_cycles) | set(self.function_inclusive)
+        rows = [(name, self.function_calls.get(name, 0),
+                 self.function_inclusive.get(name, self.function_cycles.get(name, 0)),
+                 self.function_cycles.get(name, 0)) for name in names]
+        return sorted(rows, key=lambda row: (-row[2], -row[3], row[0]))
+
+    def line_table(self):
+        """
+        Returns:
+            list: (file, line, function, inclusive cycles, exclusive cycles) tuples, most expensive first
+        """
+        rows = [(entry[0], entry[1], entry[2], cycles + self.line_callee_cycles.get(entry, 0), cycles)
+                for entry, cycles in self.line_cycles.items()]
+        return sorted(rows, key=lambda row: (-row[4], -row[3], row[0], row[1]))
+
+    def collapsed_stacks(self):
+        """
+        Lines of the collapsed stack format read by flamegraph.pl and speedscope, e.g. "Sys.init;Main.run 1234"
+        """
+        return ["{0} {1}".format(stack_key or "(unknown)", cycles)
+                for stack_key, cycles in sorted(self.stack_cycles.items())]
+
+    def print_report(self, top=20):
+        total = max(self.cycles, 1)
+        print("{0:,} instructions".format(self.cycles))
+        print()
+        print("{0:32} {1:>8} {2:>14} {3:>7} {4:>14} {5:>7}".format(
+            "function", "calls", "inclusive", "%", "exclusive", "%"))
+        for name, calls, inclusive, exclusive in self.function_table()[:top]:
+            print("{0:32} {1:8,} {2:14,} {3:6.1f}% {4:14,} {5:6.1f}%".format(
+                name or "(unknown)", calls, inclusive, 100.0 * inclusive / total, exclusive,
+                100.0 * exclusive / total))
+        print()
+        print("{0:24} {1:32} {2:>14} {3:>14} {4:>7}".format("line", "function", "inclusive", "exclusive", "%"))
+        for file_name, line, name, inclusive, exclusive in self.line_table()[:top]:
+            location = "{0}:{1}".format(file_name, line) if file_name else "(generated)"
+            print("{0:24} {1:32} {2:14,} {3:14,} {4:6.1f}%".format(
+                location, name or "(unknown)", inclusive, exclusive, 100.0 * exclusive / total))
+
+
+def profile(asm_path, map_path=None, max_cycles=None):
+    """
+    Runs a program translated with source maps on the emulator under the profiler
+
+    Args:
+        asm_path (str): the .asm file
+        map_path (str): its source map, read from the markers of the .asm file when None
+
+    Returns:
+        Profiler: the finished profile
+    """
+    with open(asm_path) as asm_file:
+        asm_lines = asm_file.readlines()
+    source_map = SourceMap.load(map_path) if map_path else SourceMap.from_asm(asm_lines)
+    emulator = Emulator.from_asm(asm_lines)
+    profiler = Profiler(source_map, emulator.ram)
+    emulator.run(max_cycles, trace=profiler.trace)
+    profiler.finish()
+    return profiler
+
+
+def run(argv=None):
+    """
+    Command line of the profiler: prints the flat profile and optionally writes the collapsed stacks
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="Profiler", description="Profile a Hack .asm program by VM function "
+                                                                  "and line. Translate it with --source-map first.")
+    parser.add_argument("asm_file", help="the .asm file to run")
+    parser.add_argument("--map", help="the source map (default: the .map file next to the .asm file if any)")
+    parser.add_argument("--collapsed", help="write the collapsed stacks for flamegraph.pl to this file")
+    parser.add_argument("--top", type=int, default=20, help="number of rows of each table (default 20)")
+    parser.add_argument("--max-cycles", type=int, default=100 * 1000 * 1000,
+                        help="stop after this many instructions (default 100M)")
+    args = parser.parse_args(argv)
+
+    map_path = args.map
+    if map_path is None and os.path.exists(os.path.splitext(args.asm_file)[0] + ".map"):
+        map_path = os.path.splitext(args.asm_file)[0] + ".map"
+    profiler = profile(args.asm_file, map_path, args.max_cycles)
+    profiler.print_report(args.top)
+    if args.collapsed:
+        with open(args.collapsed, "w") as collapsed_file:
+            collapsed_file.write("\n".join(profiler.collapsed_stacks()) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,109 @@
+import json
+
+# the Codewriter writes a marker comment before the code of every VM command when source maps are on:
+# //@ Main.vm:12 Main.fib
+MARKER = "//@ "
+
+
+def format_marker(file_name, line, function_name):
+    """
+    Marker comment of the code that follows it, see SourceMap.from_asm
+
+    Args:
+        file_name (str): .vm file of the command, "" for generated code (bootstrap, shared routines)
+        line (int): line of the command in the file
+        function_name (str): function that contains the command, or the name of the generated code
+    """
+    return "{0}{1}:{2} {3}".format(MARKER, file_name, line, function_name)
+
+
+class SourceMap:
+    """
+    .vm file, line and enclosing function of every instruction of a translated program, indexed by ROM address.
+
+    function_entries maps the ROM address of the first instruction of every VM function to its name. Generated
+    code is named <bootstrap> or after its shared routine, e.g. $CALL, and has no entry.
+    """
+
+    def __init__(self, entries, function_entries):
+        """
+        Args:
+            entries (list): a (file, line, function) tuple per ROM address
+            function_entries (dict): ROM address -> function name
+        """
+        self.entries = entries
+        self.function_entries = function_entries
+
+    @classmethod
+    def from_asm(cls, lines):
+        """
+        Source map of asm code translated with source maps on, read from its marker comments.
+        Instructions before the first marker get ("", 0, "")
+
+        Args:
+            lines (iterable): lines of asm code, a line may contain several lines separated by newlines
+        """
+        entries = []
+        labels = {}
+        functions = set()
+        current = ("", 0, "")
+        for line in lines:
+            for piece in line.split("\n"):
+                piece = piece.strip()
+                if piece.startswith(MARKER):
+                    location, _, function_name = piece[len(MARKER):].partition(" ")
+                    file_name, _, number = location.rpartition(":")
+                    current = (file_name, int(number), function_name)
+                    functions.add(function_name)
+                elif piece.startswith("("):
+                    labels[piece[1:-1]] = len(entries)
+                elif piece and not piece.startswith("//"):
+                    entries.append(current)
+        function_entries = {labels[name]: name for name in functions if name in labels and name[0] not in "$<"}
+        return cls(entries, function_entries)
+
+    def to_text(self):
+        """
+        JSON form of the map. Runs of instructions with the same location are stored once as
+        [first ROM address, file index, line, function index]
+        """
+        files = []
+        functions = []
+        file_indexes = {}
+        function_indexes = {}
+        ranges = []
+        previous = None
+        for address, (file_name, line, function_name) in enumerate(self.entries):
+            if (file_name, line, function_name) == previous:
+                continue
+            previous = (file_name, line, function_name)
+            if file_name not in file_indexes:
+                file_indexes[file_name] = len(files)
+                files.append(file_name)
+            if function_name not in function_indexes:
+                function_indexes[function_name] = len(functions)
+                functions.append(function_name)
+            ranges.append([address, file_indexes[file_name], line, function_indexes[function_name]])
+        return json.dumps({"version": 1, "size": len(self.entries), "files": files, "functions": functions,
+                           "ranges": ranges,
+                           "function_entries": sorted([address, name] for address, name in
+                                                      self.function_entries.items())})
+
+    @classmethod
+    def from_text(cls, text):
+        data = json.loads(text)
+        entries = []
+        ranges = data["ranges"] + [[data["size"]]]
+        for start, end in zip(ranges, ranges[1:]):
+            location = (data["files"][start[1]], start[2], data["functions"][start[3]])
+            entries.extend([location] * (end[0] - start[0]))
+        return cls(entries, {address: name for address, name in data["function_entries"]})
+
+    def save(self, map_path):
+        with open(map_path, "w") as map_file:
+            map_file.write(self.to_text())
+
+    @classmethod
+    def load(cls, map_path):
+        with open(map_path) as map_file:
+            return cls.from_text(map_file.read())
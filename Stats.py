@@ -0,0 +1,118 @@
+import json
+import time
+
+from Emitter import Emitter
+from IR import OP_NAMES, SEGMENT_NAMES, Op
+from Linker import count_instructions
+
+
+class TranslationStats:
+    """
+    Instrumentation of a translation, written as JSON by --stats: the wall time of every stage in total and per
+    file, the number of VM commands of every command and segment, and the number of asm instructions emitted
+    for every VM opcode.
+
+    The stages are parse (reading and parsing the .vm files), codegen (the Codewriter), optimize (the peephole
+    optimizer of -O1), whole_program (the passes of -O2), link and output. The file times of parallel mode are
+    measured in the worker processes, so the stage totals add up the time of every worker.
+    Instructions are counted as the Codewriter emits them, before the peephole optimizer. The commands that
+    write_commands translates together (expressions, fused branches, tail calls) are counted as "fused", the
+    bootstrap code and the shared routines of compact mode as "generated". The commands counted at -O2 are those of the
+    files rewritten by the whole program passes.
+
+    A translation without stats never creates one: the Codewriter and the translate functions only swap in
+    their measuring versions when they are given a TranslationStats.
+    """
+
+    def __init__(self):
+        # stage -> seconds
+        self.stages = {}
+        # file name -> {stage -> seconds}
+        self.files = {}
+        # files whose object was reused from the cache
+        self.cached_files = []
+        # "push local", "add", ... -> number of commands
+        self.commands = {}
+        # "push", "add", ..., "fused" -> number of asm instructions
+        self.instructions = {}
+        self._start = time.perf_counter()
+
+    def add_time(self, stage, seconds, file_name=None):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if file_name is not None:
+            file_stages = self.files.setdefault(file_name, {})
+            file_stages[stage] = file_stages.get(stage, 0.0) + seconds
+
+    def count_command(self, cmd):
+        key = OP_NAMES[cmd.op] + " " + SEGMENT_NAMES[cmd.arg] if cmd.op in (Op.PUSH, Op.POP) else OP_NAMES[cmd.op]
+        self.commands[key] = self.commands.get(key, 0) + 1
+
+    def emitter(self, sink=None):
+        """
+        Emitter for a Codewriter that counts the instructions written into self.instructions, see
+        Codewriter._use_stats_writers
+        """
+        return _CountingEmitter(self.instructions, sink=sink)
+
+    def merge(self, other):
+        """
+        Adds the measures of other, e.g. the stats of a file translated in a worker process
+        """
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        for file_name, file_stages in other.files.items():
+            target = self.files.setdefault(file_name, {})
+            for stage, seconds in file_stages.items():
+                target[stage] = target.get(stage, 0.0) + seconds
+        self.cached_files.extend(other.cached_files)
+        for counts, other_counts in ((self.commands, other.commands), (self.instructions, other.instructions)):
+            for key, count in other_counts.items():
+                counts[key] = counts.get(key, 0) + count
+
+    def report(self):
+        """
+        Returns:
+            dict: the report, see save
+        """
+        return {"total_seconds": time.perf_counter() - self._start, "stages": self.stages, "files": self.files,
+                "cached_files": sorted(self.cached_files), "commands": dict(sorted(self.commands.items())),
+                "instructions": dict(sorted(self.instructions.items()))}
+
+    def save(self, path):
+        """
+        Writes the report as JSON to path, "-" prints it
+        """
+        text = json.dumps(self.report(), indent=2)
+        if path == "-":
+            print(text)
+        else:
+            with open(path, "w") as stats_file:
+                stats_file.write(text + "\n")
+
+
+class _CountingEmitter(Emitter):
+    """
+    Emitter that adds the instructions put into it to counts[key], key being the VM opcode being written
+    """
+
+    def __init__(self, counts, sink=None):
+        super().__init__(sink=sink)
+        self.counts = counts
+        self.key = "generated"
+
+    def counting(self, key, write):
+        """
+        write, with the instructions it emits counted under key
+        """
+        def write_counted(*args, **kwargs):
+            self.key = key
+            write(*args, **kwargs)
+        return write_counted
+
+    def put(self, line):
+        self.counts[self.key] = self.counts.get(self.key, 0) + count_instructions((line,))
+        super().put(line)
+
+    def extend(self, lines):
+        self.counts[self.key] = self.counts.get(self.key, 0) + count_instructions(lines)
+        super().extend(lines)
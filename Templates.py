@@ -0,0 +1,253 @@
+from functools import lru_cache
+
+from IR import SEGMENT_NAMES, Op, Segment
+
+# Precompiled asm templates of the Codewriter. Every template is an immutable tuple of lines;
+# {segment} {i} {base} {register} {symbol} {n} placeholders are filled by expand, the templates with a unique
+# label ({label} {true} {false}) by fill.
+
+# *SP = D, SP++
+PUSH_D = ("@SP", "A=M", "M=D", "@SP", "M=M+1\n")
+
+# SP--, D = *SP
+POP_D = ("@SP", "AM=M-1", "D=M")
+
+_BASES = {Segment.LOCAL: "LCL", Segment.ARGUMENT: "ARG", Segment.THIS: "THIS", Segment.THAT: "THAT"}
+_FIXED = {Segment.POINTER: 3, Segment.TEMP: 5}
+# number of registers of the fixed segments, a larger offset would reach R13-R15 or the static variables
+_FIXED_SIZES = {Segment.POINTER: 2, Segment.TEMP: 8}
+
+RETURN_CODE = (
+    #frame=LCL ---- frame is a temporary variable
+    "// frame=LCL\n", "@LCL", "D=M", "@R14", "M=D\n",
+    #retAddr = *(frame-5)---- puts the return address in a temporary variable
+    "// retAddr = *(frame-5)", "@5", "A=D-A", "D=M", "@R15", "M=D\n",
+    #*ARG=pop() ---- repositions the return value for the caller
+    "// *ARG=pop()", "@SP", "AM=M-1", "D=M\n", "@ARG", "A=M", "M=D", "D=A",
+    #SP=ARG+1 ---- repositions SP for the caller
+    "// SP=ARG+1", "@SP", "M=D+1\n",
+    #THAT, THIS, ARG, LCL = *(frame-1), *(frame-2), *(frame-3), *(frame-4) ---- restores the caller segments
+    "// THAT=*(frame-1)", "@R14", "M=M-1", "A=M", "D=M", "@THAT", "M=D\n",
+    "// THIS=*(frame-2)", "@R14", "M=M-1", "A=M", "D=M", "@THIS", "M=D\n",
+    "// ARG=*(frame-3)", "@R14", "M=M-1", "A=M", "D=M", "@ARG", "M=D\n",
+    "// LCL=*(frame-4)", "@R14", "M=M-1", "A=M", "D=M", "@LCL", "M=D\n",
+    #goto retAddr ---- go to the return address
+    "// goto retAddr", "@R15", "A=M", "0;JMP\n",
+)
+
+
+def _binary(cmd, operation):
+    # pop y into D, then replace x by x op y
+    return ("//" + cmd,) + POP_D + ("@SP", "AM=M-1", "M=M" + operation + "D", "@SP", "M=M+1\n")
+
+
+def _unary(cmd, operation):
+    return ("//" + cmd, "@SP", "AM=M-1", "M=" + operation + "M", "@SP", "M=M+1\n")
+
+
+# templates keyed by (opcode, segment), segment is None for the commands that have none
+TEMPLATES = {
+    (Op.PUSH, Segment.STATIC): ("// push static {i}", "@{symbol}", "D=M") + PUSH_D,
+    (Op.PUSH, Segment.POINTER): ("// push {segment} {i}", "@{register}", "D=M") + PUSH_D,
+    (Op.PUSH, Segment.TEMP): ("// push {segment} {i}", "@{register}", "D=M") + PUSH_D,
+    (Op.POP, Segment.STATIC): ("// pop static {i}",) + POP_D + ("@{symbol}", "M=D\n"),
+    (Op.POP, Segment.POINTER): ("// pop {segment} {i}",) + POP_D + ("@{register}", "M=D\n"),
+    (Op.POP, Segment.TEMP): ("// pop {segment} {i}",) + POP_D + ("@{register}", "M=D\n"),
+
+    (Op.ADD, None): _binary("add", "+"),
+    (Op.SUB, None): _binary("sub", "-"),
+    (Op.AND, None): _binary("and", "&"),
+    (Op.OR, None): _binary("or", "|"),
+    (Op.NEG, None): _unary("neg", "-"),
+    (Op.NOT, None): _unary("not", "!"),
+
+    (Op.LABEL, None): ("// label {symbol}", "({symbol})\n"),
+    (Op.GOTO, None): ("// goto {symbol}", "@{symbol}", "0;JMP\n"),
+    (Op.IF_GOTO, None): ("// if-goto {symbol}",) + POP_D + ("@{symbol}", "D;JNE\n"),
+    (Op.FUNCTION, None): ("//  function {symbol} {n}", "// label {symbol}", "({symbol})\n"),
+    (Op.RETURN, None): ("// return",) + RETURN_CODE,
+}
+
+# push returnAddress, LCL, ARG, THIS, THAT, reposition ARG and LCL, goto callee, then the return address label.
+# The call comment is written by the Codewriter since compact mode shares it
+CALL = (("//  push returnAddress", "@{label}", "D=A") + PUSH_D
+        + ("//  push LCL", "@LCL", "D=M") + PUSH_D
+        + ("//  push ARG", "@ARG", "D=M") + PUSH_D
+        + ("//  push THIS", "@THIS", "D=M") + PUSH_D
+        + ("//  push THAT", "@THAT", "D=M") + PUSH_D
+        + ("//  ARG = SP-5-nArgs", "@{n5}", "D=A", "@SP", "D=M-D", "@ARG", "M=D\n",
+           "//  LCL=SP", "@SP", "D=M", "@LCL", "M=D\n",
+           "// goto {symbol}", "@{symbol}", "0;JMP\n",
+           "// label {label}", "({label})\n"))
+
+# pop y, pop x, push -1 when x cmp y else 0
+COMPARE = ("//{cmd}",) + POP_D + ("@SP", "AM=M-1", "D=M-D", "@{true}", "D;{jump}", "D=0", "@{false}", "0;JMP",
+                                    "({true})", "@SP", "D=-1", "({false})", "@SP", "A=M", "M=D", "@SP", "M=M+1\n")
+
+# every local variable of a function is pushed as 0
+_PUSH_ZERO = ("@0", "D=A") + PUSH_D
+
+
+# D = D op operand, the operand is A (a constant) or M (a variable), see Codewriter.write_commands.
+# REVERSED_OPERATIONS compute operand op D for the expressions whose intermediate result is the right operand
+OPERATIONS = {Op.ADD: "D=D+{0}", Op.SUB: "D=D-{0}", Op.AND: "D=D&{0}", Op.OR: "D=D|{0}"}
+REVERSED_OPERATIONS = {Op.ADD: "D=D+{0}", Op.SUB: "D={0}-D", Op.AND: "D=D&{0}", Op.OR: "D=D|{0}"}
+
+
+# tos mode of the Codewriter, the top of the stack y is in D and x on the stack: D = x op y
+TOS_BINARY = {Op.ADD: "D=D+M", Op.SUB: "D=M-D", Op.AND: "D=D&M", Op.OR: "D=D|M"}
+
+# D = -1 when x cmp y else 0
+TOS_COMPARE = ("//{cmd}", "@SP", "AM=M-1", "D=M-D", "@{true}", "D;{jump}", "D=0", "@{false}", "0;JMP", "({true})",
+               "D=-1", "({false})\n")
+
+
+def _walk(segment, i):
+    # A = segment base + i, one instruction per offset, D is not changed
+    if i == 0:
+        return ("@" + _BASES[segment], "A=M")
+    return ("@" + _BASES[segment], "A=M+1") + ("A=A+1",) * (i - 1)
+
+
+def _pop_sum(segment, i):
+    # D = address + value, then A = D - value = address and M = D - address = value: no R13 needed
+    address_code = ("@" + _BASES[segment], "D=M") + (("@" + str(i), "D=D+A") if i else ())
+    return address_code + ("@SP", "AM=M-1", "D=D+M", "A=D-M", "M=D-A")
+
+
+# Instruction selection: the variants of the code of push (D = segment i) and pop (segment i = pop()) of the
+# segments whose cost depends on the offset. select picks the one with the fewest instructions for an offset,
+# a variant that returns None does not apply. Variants are instructions only, so their cost is their length
+_INDEXED_VARIANTS = {
+    Op.PUSH: [
+        ("walk", lambda segment, i: _walk(segment, i) + ("D=M",)),
+        ("offset", lambda segment, i: ("@" + _BASES[segment], "D=M", "@" + str(i), "A=D+A", "D=M")),
+    ],
+    Op.POP: [
+        ("walk", lambda segment, i: POP_D + _walk(segment, i) + ("M=D",)),
+        ("sum", _pop_sum),
+        ("r13", lambda segment, i: ("@" + _BASES[segment], "D=M", "@" + str(i), "D=D+A", "@R13", "M=D")
+                                   + POP_D + ("@R13", "A=M", "M=D")),
+    ],
+}
+VARIANTS = {(op, segment): variants for op, variants in _INDEXED_VARIANTS.items() for segment in _BASES}
+VARIANTS[(Op.PUSH, Segment.CONSTANT)] = [
+    # the ALU computes 0 and 1 without loading A
+    ("literal", lambda segment, i: ("D=" + str(i),) if i in (0, 1) else None),
+    ("immediate", lambda segment, i: ("@" + str(i), "D=A")),
+]
+
+
+@lru_cache(maxsize=8192)
+def select(op, segment, i):
+    """
+    Cheapest variant of push or pop of segment i
+
+    Returns:
+        tuple: (variant name, instructions), None when the command has a single template
+    """
+    best = None
+    for name, variant in VARIANTS.get((op, segment), ()):
+        code = variant(segment, i)
+        if code is not None and (best is None or len(code) < len(best[1])):
+            best = (name, code)
+    return best
+
+
+def variant_counts(commands):
+    """
+    Number of push and pop commands that use every variant of select
+
+    Args:
+        commands (iterable): Commands of a program
+
+    Returns:
+        dict: (op, segment, variant name) -> number of commands
+    """
+    counts = {}
+    for cmd in commands:
+        if cmd.op == Op.PUSH or cmd.op == Op.POP:
+            selected = select(cmd.op, cmd.arg, cmd.n)
+            if selected is not None:
+                key = (cmd.op, cmd.arg, selected[0])
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def fill(template, **fields):
+    """
+    Fills the placeholders of a template that cannot be cached because it contains a unique label
+    """
+    return tuple(line.format(**fields) if "{" in line else line for line in template)
+
+
+@lru_cache(maxsize=8192)
+def expand(op, segment=None, i=0, symbol=""):
+    """
+    Fully expanded block of asm lines of a command, cached so that emitting a common command is a single append
+
+    Args:
+        op (Op): opcode of the command
+        segment (Segment): segment of push/pop, None otherwise
+        i (int): offset of push/pop, number of locals of function
+        symbol (str): static symbol of push/pop static, label or function name of the other commands
+
+    Returns:
+        tuple: the lines of asm code
+
+    Raises:
+        ValueError: for an offset outside of pointer or temp
+    """
+    _check_offset(segment, i)
+    selected = select(op, segment, i) if segment is not None else None
+    if selected is not None:
+        code = selected[1]
+        if op == Op.PUSH:
+            return ("// push {0} {1}".format(SEGMENT_NAMES[segment], i),) + code + PUSH_D
+        return ("// pop {0} {1}".format(SEGMENT_NAMES[segment], i),) + code[:-1] + (code[-1] + "\n",)
+    template = TEMPLATES[(op, segment)]
+    fields = {"i": i, "n": i, "symbol": symbol}
+    if segment is not None:
+        fields["segment"] = SEGMENT_NAMES[segment]
+        fields["base"] = _BASES.get(segment)
+        if segment in _FIXED:
+            fields["register"] = "R" + str(i + _FIXED[segment])
+    block = fill(template, **fields)
+    if op == Op.FUNCTION:
+        block += _PUSH_ZERO * i
+    return block
+
+
+@lru_cache(maxsize=8192)
+def address(segment, i=0, symbol=""):
+    """
+    Instructions that set A to the address of segment i without changing D. local, argument, this and that
+    walk A up from the base of the segment, one instruction per offset
+
+    Args:
+        segment (Segment): any segment but constant
+        i (int): offset
+        symbol (str): static symbol of static i
+    """
+    _check_offset(segment, i)
+    if segment == Segment.STATIC:
+        return ("@" + symbol,)
+    if segment in _FIXED:
+        return ("@R" + str(i + _FIXED[segment]),)
+    return _walk(segment, i)
+
+
+def _check_offset(segment, i):
+    if segment in _FIXED_SIZES and not 0 <= i < _FIXED_SIZES[segment]:
+        raise ValueError("Invalid offset of segment {0}: {1}".format(SEGMENT_NAMES[segment], i))
+
+
+@lru_cache(maxsize=8192)
+def load_d(segment, i=0, symbol=""):
+    """
+    Instructions that set D to segment i, the code of push without the push of D, see select
+    """
+    selected = select(Op.PUSH, segment, i)
+    if selected is not None:
+        return selected[1]
+    return address(segment, i, symbol) + ("D=M",)
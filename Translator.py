@@ -0,0 +1,165 @@
+import io
+
+from Assembler import Assembler
+from Codewriter import Codewriter
+from IR import parse_command
+from Linker import Linker
+from Parser import clean_lines, parse_source
+from VMTranslator import DEFAULT_INLINE_BUDGET, optimize_program, translate_module
+
+
+class TranslationError(ValueError):
+    """
+    Raised for a module whose VM code is not valid, the message names the module and the line
+    """
+
+    def __init__(self, module, line, message):
+        """
+        Args:
+            module (str): name of the module
+            line (int): line of the invalid command in the module, None when it is not known
+            message (str): what is wrong with the command
+        """
+        location = module + ".vm" if line is None else "{0}.vm:{1}".format(module, line)
+        super().__init__("{0}: {1}".format(location, message))
+        self.module = module
+        self.line = line
+        self.message = message
+
+
+class Translator:
+    """
+    Library interface of the translator for programs held in memory, e.g. by a build server: the modules are
+    given as strings or bytes and the asm code, its fragments or the machine words are returned, nothing is read
+    from or written to disk.
+
+    A Translator only holds its options, which never change. Every call parses and translates with its own
+    Codewriters and Linker, so one Translator can be shared by any number of threads, or the executor of an
+    asyncio loop, and used for one request after another. The code of a module does not depend on the other
+    modules below -O2, it is translated like in parallel mode (-j): the generated labels are prefixed with the
+    module name.
+    """
+
+    def __init__(self, optimize=0, compact=False, tos=False, source_map=False, inline_budget=DEFAULT_INLINE_BUDGET):
+        """
+        Args:
+            optimize (int): optimization level, see VMTranslator.translate
+            compact (bool): compact mode, see Codewriter
+            tos (bool): keep the top of the stack in D, see Codewriter
+            source_map (bool): write the marker comments of the source map into the asm code, see SourceMap
+            inline_budget (int): largest function inlined at -O2, see Inliner
+        """
+        self.options = {"optimize": optimize, "compact": compact, "source_map": source_map,
+                        "inline_budget": inline_budget, "tos": tos}
+
+    def parse(self, modules):
+        """
+        Args:
+            modules (dict or iterable): module name -> VM code as str or bytes, or (name, code) pairs, in
+                                        output order. Sys is the module of Sys.init
+
+        Returns:
+            list: the parsed Modules
+
+        Raises:
+            TranslationError: for an invalid command, or bytes that are not valid UTF-8
+        """
+        parsed = []
+        for name, source in (modules.items() if hasattr(modules, "items") else modules):
+            try:
+                parsed.append(parse_source(name, source))
+            except ValueError as error:
+                raise TranslationError(name, _parse_error_line(source), str(error)) from None
+        return parsed
+
+    def objects(self, modules):
+        """
+        Translates the modules into ObjectFiles, without linking them
+
+        Returns:
+            tuple: the ObjectFile of every module and whether the program needs the bootstrap code
+
+        Raises:
+            TranslationError: for an invalid command, e.g. pop constant 0 or push temp 8
+        """
+        parsed = self.parse(modules)
+        bootstrap = any(module.name == "Sys" for module in parsed)
+        if self.options["optimize"] >= 2:
+            try:
+                parsed = optimize_program(parsed, bootstrap, self.options, verbose=False)
+            except ValueError as error:
+                # the inliner translates the functions it weighs
+                raise _codegen_error(parsed, error) from None
+        objects = []
+        for module in parsed:
+            try:
+                objects.append(translate_module(module, self.options))
+            except ValueError as error:
+                raise _codegen_error([module], error) from None
+        return objects, bootstrap
+
+    def fragments(self, modules):
+        """
+        Returns:
+            dict: module name -> asm code of the module, without the bootstrap code and the shared routines
+        """
+        return {obj.name: obj.code for obj in self.objects(modules)[0]}
+
+    def translate(self, modules):
+        """
+        Returns:
+            str: the asm code of the program
+
+        Raises:
+            TranslationError: for an invalid command
+            LinkError: for a function called but not defined, or defined twice, or too many static variables
+        """
+        objects, bootstrap = self.objects(modules)
+        asm_file = io.StringIO()
+        Linker(False, self.options["source_map"]).link(objects, asm_file, bootstrap)
+        return asm_file.getvalue()
+
+    def assemble(self, modules):
+        """
+        Returns:
+            list: the 16-bit machine word of every instruction of the program, see Assembler.words
+        """
+        objects, bootstrap = self.objects(modules)
+        assembler = Assembler()
+        Linker(False, self.options["source_map"]).link(objects, assembler, bootstrap)
+        return assembler.words()
+
+
+def _parse_error_line(source):
+    """
+    Line of the first command of source that does not parse, or of the first byte that is not valid UTF-8, only
+    looked for once parsing failed
+    """
+    if not isinstance(source, str):
+        source = bytes(source)
+        try:
+            source = source.decode()
+        except UnicodeDecodeError as error:
+            return source[:error.start].count(b"\n") + 1
+    for line_number, line in clean_lines(source.split("\n")):
+        try:
+            parse_command(line, line_number)
+        except ValueError:
+            return line_number
+    return None
+
+
+def _codegen_error(modules, error):
+    """
+    TranslationError for the error raised while translating modules, at the first command that has no
+    translation. Every command is translated on its own, which rejects the same commands as the optimized modes.
+    error itself when it names no command of several modules
+    """
+    for module in modules:
+        cw = Codewriter(verbose=False)
+        for cmd in module.commands:
+            try:
+                cw.write_command(cmd)
+            except ValueError:
+                return TranslationError(module.name, cmd.line, str(error))
+    return TranslationError(modules[0].name, None, str(error)) if len(modules) == 1 else error
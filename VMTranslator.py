@@ -1,82 +1,594 @@
+from Assembler import Assembler, save_hack
+from Cache import TranslationCache
 from Codewriter import Codewriter
-from Parser import Parser
+from DeadCode import DeadFunctionEliminator
+from Expressions import fold_constants
+from IR import OP_NAMES, SEGMENT_NAMES, module_text
+from Inliner import Inliner
+from Linker import Linker, ObjectFile, count_instructions, print_compact_tradeoff
+from Parser import Parser, find_chunks, parse_chunk
+from Peephole import PeepholeOptimizer
+from SourceMap import SourceMap
+from Stats import TranslationStats
+from Templates import variant_counts
+from contextlib import nullcontext
+import hashlib
 import os
-from tkinter import *
-from tkinter import filedialog
+import sys
+import time
 
+__version__ = "1.1.0"
+_translator_version = None
 
-def translateVM(file_name, cw):
+# largest number of commands of a function inlined at -O2, see Inliner
+DEFAULT_INLINE_BUDGET = 10
+
+# in parallel mode a .vm file larger than this many bytes is split into chunks at function commands, which are
+# parsed and translated by different workers, see translate_chunk
+CHUNK_SIZE = 512 * 1024
+
+# extension of the output file of every output format, see translate
+OUTPUT_FORMATS = {"asm": ".asm", "hack": ".hack", "bin": ".hack"}
+
+
+def translateVM(file_name, cw, stream=False, stats=None):
     """
-    Initialize stack pointer and translates VM code to assembly based on teh command type.
+    Translates VM code to assembly, dispatching on the opcode of every parsed command.
+    The bootstrap code that initializes the stack pointer is written once per program by the caller, see write_init.
 
     Args: 
         file_name (string): the full path of file
         cw (Object): an instance of Codewriter class
+        stream (bool): parse the file lazily so commands are translated while the file is being read
+        stats (TranslationStats): record the parse and codegen time of the file and count its commands
 
     comments:
         Include Parser object in this function because mutiple instances represent mutiple .vm files
         Passing Codewriter object as argument because only need one instance to store asm code in Queue
     """
-    parser = Parser(file_name)
-    cw.write_init()
-
-    while parser.has_more_lines():
-        command = parser.advance()
-        cmd_type = parser.command_type(command)
-        arg1 = parser.cmd_arg1()
-        arg2 = parser.cmd_arg2()
-
-        if cmd_type == "C_ARITHMETIC":
-            cw.write_arithmetic(arg1)
-        elif cmd_type == "C_PUSH":
-            cw.push_operation(arg1, int(arg2))
-        elif cmd_type == "C_POP":
-            cw.pop_operation(arg1, int(arg2))
-        elif cmd_type == "C_LABEL":
-            cw.write_label_name(arg1)
-        elif cmd_type == "C_IF":
-            cw.write_if_goto(arg1)
-        elif cmd_type == "C_GOTO":
-            cw.write_goto(arg1)
-        elif cmd_type == "C_CALL":
-            cw.write_call(arg1, int(arg2))
-        elif cmd_type == "C_FUNCTION":
-            cw.write_function(arg1, arg2)
-        elif cmd_type == "C_RETURN":
-            cw.write_return()    
-        else:
-            raise ValueError("Invalid Commands!")     
+    if stats is not None:
+        _translate_vm_measured(file_name, cw, stream, stats)
+        return
+    parser = Parser(file_name, stream)
+
+    for command in parser.commands():
+        cw.write_command(command)
+
 
-def write_to_file(queue, file_destination):
+def _translate_vm_measured(file_name, cw, stream, stats):
+    """
+    translateVM with the time spent parsing, including the lazy parsing of stream mode, apart from the code
+    generation
+    """
+    name = os.path.basename(file_name)
+    clock = time.perf_counter
+    start = clock()
+    commands = Parser(file_name, stream).commands()
+    parse = clock() - start
+    codegen_start = clock()
+    while True:
+        parse_start = clock()
+        command = next(commands, None)
+        parse += clock() - parse_start
+        if command is None:
+            break
+        stats.count_command(command)
+        cw.write_command(command)
+    stats.add_time("codegen", clock() - codegen_start - (parse - (codegen_start - start)), name)
+    stats.add_time("parse", parse, name)
+
+
+def write_to_file(queue, file_destination, assembler=None):
     """
     Writes the contents of the queue to a file specified by the filepath.
 
     Args:
-        queue (Queue): A queue containing assembly instructions.
+        queue (Emitter): An emitter containing assembly instructions.
         file_destination (str): The path to the file where the instructions will be written.
+        assembler (Assembler): assemble the instructions instead, nothing is written, see open_output
+
+    """
+    with open_output(file_destination, assembler) as asm_file:
+        queue.flush(asm_file)
 
+
+def open_output(asm_path, assembler=None):
+    """
+    The .asm file opened for writing, or the in-process assembler that takes its place when the program is
+    assembled directly to .hack
     """
-    with open(file_destination, "w") as asm_file:
-        while not queue.empty():    
-            line = queue.get()
-            asm_file.write(line + '\n')   
+    if assembler is not None:
+        return nullcontext(assembler)
+    return open(asm_path, "w")
                   
 
-def run():
+def translate_chunk(chunk, options=None, stats=False):
     """
-    run the VM translator
+    Translates a chunk of a .vm file into an ObjectFile, see Parser.find_chunks and ObjectFile.join. Runs in the
+    worker processes of parallel mode and in watch mode.
+
+    The generated labels are namespaced with the file name, Foo for the first chunk of Foo.vm and Foo$k for chunk
+    k > 0, so the objects of different files and chunks never clash and the object of a file is the same
+    whichever worker translated it
+
+    Args:
+        chunk (Chunk): byte range of the file that starts at a function command
+        options (dict): translation options, see translate
+        stats (bool): record a TranslationStats of the chunk in the stats of the object
+    """
+    start = time.perf_counter() if stats else 0
+    module = parse_chunk(chunk)
+    seconds = time.perf_counter() - start
+    namespace = module.name + "$" + str(chunk.index) if chunk.index else module.name
+    obj = translate_module(module, options, stats, namespace)
+    if stats:
+        obj.stats.add_time("parse", seconds, module.name + ".vm")
+    return obj
+
+
+def translate_module(module, options=None, stats=False, label_namespace=None):
+    """
+    Translates the parsed Module of a .vm file into an ObjectFile, see translate_chunk
+
+    Args:
+        module (Module): the commands of the file, possibly rewritten by the whole program passes
+        options (dict): translation options, see translate
+        stats (bool): record a TranslationStats of the file in the stats of the object
+        label_namespace (str): namespace of the generated labels, the name of the module when None
+    """
+    options = options or {}
+    optimize = options.get("optimize", 0)
+    file_stats = TranslationStats() if stats else None
+    start = time.perf_counter() if stats else 0
+    cw = Codewriter(verbose=False, label_namespace=label_namespace or module.name, compact=options.get("compact", False),
+                    source_map=options.get("source_map", False), expressions=optimize >= 1,
+                    branches=optimize >= 1, tos=options.get("tos", False), tail_calls=optimize >= 1,
+                    stats=file_stats)
+    cw.set_file_name(module.name + ".vm")
+    cw.write_commands(fold_constants(module.commands) if optimize >= 1 else module.commands)
+    cw.flush_stack()
+    obj = ObjectFile.from_codewriter(module.name, cw)
+    if stats:
+        file_stats.add_time("codegen", time.perf_counter() - start, module.name + ".vm")
+        for cmd in module.commands:
+            file_stats.count_command(cmd)
+        start = time.perf_counter()
+    if optimize >= 1:
+        obj.unoptimized_size = count_instructions([obj.code])
+        obj.code = "\n".join(PeepholeOptimizer().optimize([obj.code]))
+        if stats:
+            file_stats.add_time("optimize", time.perf_counter() - start, module.name + ".vm")
+    obj.stats = file_stats
+    return obj
+
+
+def optimize_program(modules, bootstrap, options, verbose=True):
+    """
+    Runs the whole program passes of -O2 over the parsed modules: inlining of small leaf functions, then the
+    removal of the functions Sys.init no longer calls
+
+    Args:
+        modules (list): Module of every file of the program
+        bootstrap (bool): the program starts with the bootstrap code that calls Sys.init
+        options (dict): translation options, see translate
+        verbose (bool): print what every pass did
+
+    Returns:
+        list: the rewritten modules
+    """
+    compact = options.get("compact", False)
+    modules = Inliner(options.get("inline_budget", DEFAULT_INLINE_BUDGET), verbose, compact).run(modules)
+    return DeadFunctionEliminator(verbose, compact).run(modules, bootstrap)
+
+
+def needs_bootstrap(vm_files):
+    """
+    Programs with a Sys.vm start with the bootstrap code that calls Sys.init, single files such as test
+    programs are run from their first command
+    """
+    return any(os.path.basename(file_path) == "Sys.vm" for file_path in vm_files)
+
+
+def translator_version():
+    """
+    Version of the translator used in cache keys: __version__ plus a hash of the translator sources,
+    so a cached fragment is never reused after the code generation changed
+    """
+    global _translator_version
+    if _translator_version is None:
+        digest = hashlib.sha256(__version__.encode())
+        for module_name in ("Codewriter", "Parser", "IR", "Emitter", "Linker", "Peephole", "Templates", "SourceMap",
+                            "DeadCode", "Inliner", "Expressions", __name__):
+            with open(sys.modules[module_name].__file__, "rb") as source_file:
+                digest.update(source_file.read())
+        _translator_version = __version__ + "+" + digest.hexdigest()[:16]
+    return _translator_version
+
+
+def translate_parallel(vm_files, asm_path, jobs, verbose=True, cache=None, options=None, assembler=None,
+                       stats=None):
+    """
+    Translates every file into an ObjectFile in its own worker process, then links the objects
+    in the order of vm_files. Files larger than CHUNK_SIZE are split into chunks translated by different
+    workers, see translate_chunk, except at -O2 where the files are parsed before the whole program passes.
+
+    Args:
+        vm_files (list): full paths of the .vm files
+        asm_path (str): the .asm file to write
+        jobs (int): number of worker processes, 1 translates in this process
+        verbose (bool): print the name of every file when its translation begins
+        cache (TranslationCache): reuse the objects of files that did not change, only the others are translated
+        options (dict): translation options, see translate
+        assembler (Assembler): link into this assembler instead of writing asm_path, see open_output
+        stats (TranslationStats): record the time of every stage and the counts of every translated file
+    """
+    options = options or {}
+    if options.get("optimize", 0) >= 2:
+        # whole program passes: the code of a file depends on the other files, so the cache is keyed
+        # on the rewritten commands of the file instead of its source
+        start = time.perf_counter()
+        parsed = [Parser(file_path).module() for file_path in vm_files]
+        if stats is not None:
+            stats.add_time("parse", time.perf_counter() - start)
+            start = time.perf_counter()
+        modules = optimize_program(parsed, needs_bootstrap(vm_files), options, verbose)
+        if stats is not None:
+            stats.add_time("whole_program", time.perf_counter() - start)
+        sources = modules
+        worker = translate_module
+    else:
+        sources = vm_files
+        worker = translate_chunk
+
+    keys = [None] * len(vm_files)
+    objects = [None] * len(vm_files)
+    if cache is not None:
+        version = translator_version()
+        for i, file_path in enumerate(vm_files):
+            if sources is vm_files:
+                with open(file_path, "rb") as vm_file:
+                    content = vm_file.read()
+            else:
+                content = module_text(sources[i]).encode()
+            keys[i] = cache.make_key(os.path.basename(file_path), content, version, options)
+            cached = cache.get(keys[i])
+            if cached is not None:
+                objects[i] = ObjectFile.from_text(cached)
+    todo = [i for i, obj in enumerate(objects) if obj is None]
+    if verbose:
+        for i in todo:
+            print("Begun translating file: " + os.path.basename(vm_files[i]))
+        if cache is not None:
+            print("Reused {0} cached file(s)".format(len(vm_files) - len(todo)))
+
+    # (file index, source) of every task, a file can be several chunks
+    tasks = []
+    for i in todo:
+        if worker is translate_chunk:
+            tasks.extend((i, chunk) for chunk in find_chunks(vm_files[i], CHUNK_SIZE))
+        else:
+            tasks.append((i, sources[i]))
+    task_sources = [source for _, source in tasks]
+    collect = stats is not None
+    if jobs == 1 or len(tasks) <= 1:
+        results = [worker(source, options, collect) for source in task_sources]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(worker, task_sources, [options] * len(task_sources),
+                                        [collect] * len(task_sources)))
+    parts = {}
+    for (i, _), obj in zip(tasks, results):
+        parts.setdefault(i, []).append(obj)
+    translated = [ObjectFile.join(parts[i]) if len(parts[i]) > 1 else parts[i][0] for i in todo]
+    for i, obj in zip(todo, translated):
+        objects[i] = obj
+        if cache is not None:
+            cache.put(keys[i], obj.to_text())
+        if collect:
+            stats.merge(obj.stats)
+    if collect:
+        stats.cached_files.extend(os.path.basename(vm_files[i]) for i, obj in enumerate(objects) if obj.stats is None)
+
+    if verbose and options.get("optimize", 0) >= 1:
+        for obj in objects:
+            after = count_instructions([obj.code])
+            print("Optimized {0}.vm: {1} -> {2} instructions ({3:+.1f}%)".format(
+                obj.name, obj.unoptimized_size, after, 100.0 * (after - obj.unoptimized_size) / max(obj.unoptimized_size, 1)))
 
+    start = time.perf_counter()
+    with open_output(asm_path, assembler) as asm_file:
+        rom_size = Linker(verbose, options.get("source_map", False)).link(objects, asm_file,
+                                                                          needs_bootstrap(vm_files))
+    if stats is not None:
+        stats.add_time("link", time.perf_counter() - start)
+        # the bootstrap code and the shared routines are written by the link phase
+        generated = rom_size - sum(count_instructions([obj.code]) for obj in objects)
+        stats.instructions["generated"] = stats.instructions.get("generated", 0) + generated
+
+
+def list_vm_files(input_path):
+    """
+    Returns the .vm files to translate, sorted by name so the output does not depend on the file system order.
+
+    Args:
+        input_path (str): a .vm file or a folder that contains .vm files
+    """
+    if os.path.isdir(input_path):
+        return [os.path.join(input_path, file_name) for file_name in sorted(os.listdir(input_path))
+                if file_name.lower().endswith(".vm")]
+    return [input_path]
+
+
+def default_output_path(input_path, extension=".asm"):
+    """
+    Foo/ is translated into Foo/Foo.asm and Foo.vm into Foo.asm
+
+    Args:
+        input_path (str): a .vm file or a folder that contains .vm files
+        extension (str): extension of the output file, see OUTPUT_FORMATS
+    """
+    input_path = os.path.normpath(input_path)
+    if os.path.isdir(input_path):
+        return os.path.join(input_path, os.path.basename(os.path.abspath(input_path)) + extension)
+    return os.path.splitext(input_path)[0] + extension
+
+
+def source_map_path(asm_path):
+    """
+    Foo.asm has its source map in Foo.map
+    """
+    return os.path.splitext(asm_path)[0] + ".map"
+
+
+def take_symbols(cw, file_path):
+    """
+    The functions, calls and statics of the file cw translated last, as an ObjectFile without code, so the
+    sequential and streaming modes can check the program like the link phase does, see Linker.check. The
+    symbols of cw are reset for the next file
+
+    Args:
+        cw (Codewriter): the Codewriter that translates the files one after another
+        file_path (str): the .vm file it translated last
+    """
+    obj = ObjectFile(os.path.splitext(os.path.basename(file_path))[0], "", cw.functions, cw.calls, cw.statics)
+    cw.functions = []
+    cw.calls = set()
+    cw.statics = set()
+    return obj
+
+
+def translate(input_path, output_path=None, stream=False, verbose=True, jobs=None, cache_dir=None,
+              cache_size=64 * 1024 * 1024, optimize=0, compact=False, source_map=False,
+              inline_budget=DEFAULT_INLINE_BUDGET, tos=False, output_format="asm", stats=None):
+    """
+    Translates a .vm file, or every .vm file of a folder, into one .asm file, or straight into Hack machine code.
+
+    Args:
+        input_path (str): a .vm file or a folder that contains .vm files
+        output_path (str): the .asm file to write, see default_output_path when it is None
+        stream (bool): translate in streaming mode. Commands are parsed lazily and finished chunks of asm code
+                       are written to the output file right away, so memory use does not grow with the program.
+                       The parallel mode holds the whole program, so it cannot be combined with jobs, cache_dir
+                       or optimize
+        verbose (bool): print the name of every file when its translation begins
+        jobs (int): translate in parallel mode with this many worker processes, see translate_parallel.
+                    The output is the same for every number of jobs. None translates sequentially
+        cache_dir (str): folder of the incremental translation cache. Only the files whose content changed since
+                         the last build are translated again, it implies parallel mode with one job by default
+        cache_size (int): size limit of the cache folder in bytes
+        optimize (int): optimization level. 1 runs the peephole optimizer over the asm code of every file,
+                        2 also runs the whole program passes first, see optimize_program.
+                        It implies parallel mode with one job by default
+        compact (bool): compact mode, call, return and the comparisons jump to shared routines, see Codewriter
+        source_map (bool): mark the code of every command with its .vm file, line and function and write the
+                           source map of the program next to the .asm file, see source_map_path and Profiler
+        inline_budget (int): largest number of commands of a function inlined at -O2, 0 turns inlining off
+        tos (bool): keep the top of the VM stack in the D register across straight-line code, see Codewriter
+        output_format (str): "asm", or "hack" and "bin" to feed the code to an in-process Assembler instead of
+                             writing it as text and write the .hack file in text or binary form, see save_hack
+        stats (TranslationStats): filled with the time of every stage and the counts of commands and emitted
+                                  instructions, see --stats
+
+    Returns:
+        str: the path of the file that was written
     """
+    vm_files = list_vm_files(input_path)
+    if not vm_files:
+        raise ValueError("No .vm file found in " + input_path)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format " + output_format)
+    if source_map and output_format != "asm":
+        raise ValueError("Source maps are only written with the .asm output")
+    if stream and (cache_dir is not None or jobs is not None or optimize):
+        raise ValueError("Streaming mode cannot be combined with parallel mode, the cache or optimization")
+    asm_path = output_path or default_output_path(input_path, OUTPUT_FORMATS[output_format])
+    assembler = Assembler() if output_format != "asm" else None
+    options = {"optimize": optimize, "compact": compact, "source_map": source_map, "inline_budget": inline_budget,
+               "tos": tos}
+    if cache_dir is not None or jobs is not None or optimize:
+        cache = TranslationCache(cache_dir, cache_size) if cache_dir is not None else None
+        translate_parallel(vm_files, asm_path, jobs or 1, verbose, cache, options, assembler, stats)
+    elif stream:
+        with open_output(asm_path, assembler) as asm_file:
+            cw = Codewriter(sink=asm_file, verbose=verbose, compact=compact, source_map=source_map, tos=tos,
+                            stats=stats)
+            if needs_bootstrap(vm_files):
+                cw.write_init()
+            symbols = []
+            for file_path in vm_files:
+                cw.set_file_name(os.path.basename(file_path))
+                translateVM(file_path, cw, stream=True, stats=stats)
+                symbols.append(take_symbols(cw, file_path))
+            cw.write_shared_routines(cw.routine_calls, halt=not needs_bootstrap(vm_files))
+            cw.get_queue().flush(asm_file)
+        # the code is already written, a program that does not link is reported after it
+        Linker(False).check(symbols, needs_bootstrap(vm_files))
+        if verbose and cw.routine_calls:
+            print_compact_tradeoff(cw.routine_calls)
+    else:
+        cw = Codewriter(verbose=verbose, compact=compact, source_map=source_map, tos=tos, stats=stats)
+        if needs_bootstrap(vm_files):
+            cw.write_init()
+        symbols = []
+        for file_path in vm_files:
+            cw.set_file_name(os.path.basename(file_path))
+            translateVM(file_path, cw, stats=stats)
+            symbols.append(take_symbols(cw, file_path))
+        Linker(False).check(symbols, needs_bootstrap(vm_files))
+        cw.write_shared_routines(cw.routine_calls, halt=not needs_bootstrap(vm_files))
+        if verbose and cw.routine_calls:
+            print_compact_tradeoff(cw.routine_calls)
+        final_queue = cw.get_queue()
+        start = time.perf_counter()
+        write_to_file(final_queue, asm_path, assembler)
+        if stats is not None:
+            stats.add_time("output", time.perf_counter() - start)
+    start = time.perf_counter()
+    if assembler is not None:
+        save_hack(assembler.words(), asm_path, binary=output_format == "bin")
+    if source_map:
+        with open(asm_path) as asm_file:
+            SourceMap.from_asm(asm_file).save(source_map_path(asm_path))
+    if stats is not None:
+        stats.add_time("output", time.perf_counter() - start)
+    return asm_path
+
+
+def print_variant_report(vm_files):
+    """
+    Prints how many push and pop commands of the program use every instruction selection variant, see
+    Templates.select. With -O1 and --tos some of them are translated as part of an expression instead
+    """
+    counts = {}
+    for file_path in vm_files:
+        for key, count in variant_counts(Parser(file_path).module().commands).items():
+            counts[key] = counts.get(key, 0) + count
+    totals = {}
+    for (op, segment, _), count in counts.items():
+        totals[(op, segment)] = totals.get((op, segment), 0) + count
+    print("{0:20} {1:10} {2:>8} {3:>7}".format("command", "variant", "count", "%"))
+    for (op, segment, variant), count in sorted(counts.items()):
+        print("{0:20} {1:10} {2:8} {3:6.1f}%".format(OP_NAMES[op] + " " + SEGMENT_NAMES[segment], variant, count,
+                                                    100.0 * count / totals[(op, segment)]))
+
+
+def ask_directory():
+    """
+    Opens a folder dialog. tkinter is imported here so the command line never pays for it
+    """
+    from tkinter import Tk, filedialog
+
     root = Tk()
     root.withdraw()
-    file_dir =  filedialog.askdirectory(initialdir = "/", title = "Select a folder")
-    cw = Codewriter()
-    for file_name in os.listdir(file_dir):
-        if file_name.lower().endswith(".vm"):
-            cw.set_file_name(file_name)
-            translateVM(file_dir + "\\" + file_name, cw)
-    final_queue = cw.get_queue()
-    write_to_file(final_queue, file_dir + "\\" + os.path.basename(file_dir) + ".asm")
-    
-
-run()
\ No newline at end of file
+    return filedialog.askdirectory(initialdir = "/", title = "Select a folder")
+
+
+def run(argv=None):
+    """
+    run the VM translator
+
+    Args:
+        argv (list): command line arguments, sys.argv[1:] when None
+
+    Returns:
+        int: exit status
+    """
+    # imported here rather than at the top so that importing translateVM as a library stays cheap
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="VMTranslator",
+        description="Translates Hack VM code into Hack assembly code.")
+    arg_parser.add_argument("input", nargs="?",
+                            help="a .vm file or a folder of .vm files. Opens a folder dialog when omitted")
+    arg_parser.add_argument("-o", "--output", help="the .asm file to write (default: next to the input)")
+    arg_parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="asm",
+                            help="write Hack assembly, or assemble it in process into a .hack file of 0/1 text "
+                                 "lines (hack) or of big-endian 16-bit words (bin)")
+    arg_parser.add_argument("--gui", action="store_true", help="select the input folder with a dialog")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="write the output while reading the input, with bounded memory (cannot be "
+                                 "combined with --jobs, --cache-dir or -O1/-O2, which hold the whole program)")
+    arg_parser.add_argument("-j", "--jobs", type=int,
+                            help="translate the files in parallel with JOBS worker processes (0: one per CPU)")
+    arg_parser.add_argument("--cache-dir",
+                            help="reuse the translation of unchanged files from this folder (implies parallel mode)")
+    arg_parser.add_argument("--cache-size", type=int, default=64,
+                            help="size limit of the cache folder in MB (default: 64)")
+    arg_parser.add_argument("-O", dest="optimize", type=int, choices=[0, 1, 2], default=0,
+                            help="optimization level, -O1 runs the peephole optimizer, -O2 also the whole program "
+                                 "passes such as removing the functions Sys.init never calls (implies parallel mode)")
+    arg_parser.add_argument("--inline-budget", type=int, default=DEFAULT_INLINE_BUDGET,
+                            help="inline the leaf functions of at most this many commands at -O2, a larger budget "
+                                 "makes faster and usually bigger code, 0 turns inlining off (default: {0})".format(
+                                     DEFAULT_INLINE_BUDGET))
+    arg_parser.add_argument("--compact", action="store_true",
+                            help="share one call, return and comparison routine to make the program smaller")
+    arg_parser.add_argument("--tos", action="store_true",
+                            help="keep the top of the stack in the D register between commands, fewer memory accesses")
+    arg_parser.add_argument("--isel-report", action="store_true",
+                            help="print how many push and pop commands use every instruction selection variant")
+    arg_parser.add_argument("--source-map", action="store_true",
+                            help="write the .vm file, line and function of every instruction to a .map file")
+    arg_parser.add_argument("--stats", metavar="FILE",
+                            help="write the time of every stage and file and the counts of commands and emitted "
+                                 "instructions as JSON to FILE (- prints it)")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="keep running, translate again the files that change and replace the output after "
+                                 "every change (Ctrl+C stops)")
+    arg_parser.add_argument("-q", "--quiet", action="store_true", help="do not print the translated file names")
+    args = arg_parser.parse_args(argv)
+
+    input_path = args.input
+    if args.gui or input_path is None:
+        input_path = ask_directory()
+        if not input_path:
+            return 1
+    if not os.path.exists(input_path):
+        arg_parser.error("no such file or directory: " + input_path)
+    jobs = args.jobs
+    if jobs is not None and jobs < 0:
+        arg_parser.error("--jobs must be 0 or more")
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if args.stream and (jobs is not None or args.cache_dir or args.optimize):
+        arg_parser.error("--stream writes the output while reading the input, it cannot be combined with --jobs, "
+                         "--cache-dir or -O1/-O2")
+    if args.watch:
+        if args.stream or jobs is not None or args.cache_dir or args.stats or args.isel_report:
+            arg_parser.error("--watch keeps every file translated in memory, it cannot be combined with --stream, "
+                             "--jobs, --cache-dir, --stats or --isel-report")
+        if args.source_map and args.format != "asm":
+            arg_parser.error("Source maps are only written with the .asm output")
+        # imported here so that the other modes never load ctypes
+        from Watcher import Watcher
+
+        options = {"optimize": args.optimize, "compact": args.compact, "source_map": args.source_map,
+                   "inline_budget": args.inline_budget, "tos": args.tos}
+        try:
+            Watcher(input_path, args.output, options, args.format, verbose=not args.quiet).watch()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    stats = TranslationStats() if args.stats else None
+    try:
+        translate(input_path, args.output, stream=args.stream, verbose=not args.quiet, jobs=jobs,
+                  cache_dir=args.cache_dir, cache_size=args.cache_size * 1024 * 1024, optimize=args.optimize,
+                  compact=args.compact, source_map=args.source_map, inline_budget=args.inline_budget,
+                  tos=args.tos, output_format=args.format, stats=stats)
+    except ValueError as error:
+        print("VMTranslator: " + str(error), file=sys.stderr)
+        return 1
+    if stats is not None:
+        stats.save(args.stats)
+    if args.isel_report:
+        print_variant_report(list_vm_files(input_path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,258 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import tempfile
+import time
+
+from Assembler import Assembler, save_hack
+from IR import module_text
+from Linker import Linker, ObjectFile
+from Parser import Parser, find_chunks
+from SourceMap import SourceMap
+from VMTranslator import (CHUNK_SIZE, OUTPUT_FORMATS, default_output_path, list_vm_files, needs_bootstrap,
+                          optimize_program, source_map_path, translate_chunk, translate_module)
+
+# inotify events of a folder that can change its .vm files: written, created, removed, renamed in or out
+_IN_EVENTS = 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+# seconds waited after an inotify event for the other files written by the same compiler run
+_SETTLE = 0.01
+# wd, mask, cookie, len of struct inotify_event, followed by len bytes of name
+_IN_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher:
+    """
+    Watch mode (--watch): translates a program, then keeps the translation of every .vm file in memory and after
+    every change translates only the files that changed, links the program again and replaces the output file.
+
+    Changes are noticed with inotify on Linux, by polling the modification times of the files elsewhere. A file is
+    translated again when its modification time or size changed, e.g. after the Jack compiler wrote it. Below -O2
+    the translation of a file is its ObjectFile, the same as in parallel mode, so the output is that of -j. At -O2
+    the parsed Modules are kept, the whole program passes run again on every build and only the modules they
+    rewrote differently are translated again.
+
+    The output file is written under a temporary name and renamed, so the emulator or a build step reading it
+    never sees a partial program, and a program that does not translate leaves the last good output in place.
+    """
+
+    def __init__(self, input_path, output_path=None, options=None, output_format="asm", verbose=True,
+                 interval=0.05):
+        """
+        Args:
+            input_path (str): a .vm file or a folder that contains .vm files
+            output_path (str): the file to write, see default_output_path when it is None
+            options (dict): translation options, see translate
+            output_format (str): "asm", "hack" or "bin", see translate
+            verbose (bool): print the files translated by every build
+            interval (float): seconds between two checks of the files when polling
+        """
+        self.input_path = input_path
+        self.output_path = output_path or default_output_path(input_path, OUTPUT_FORMATS[output_format])
+        self.options = options or {}
+        self.output_format = output_format
+        self.verbose = verbose
+        self.interval = interval
+        # full path -> (modification time, size) of every file when it was last translated
+        self._signatures = {}
+        # full path -> ObjectFile of every file, its parsed Module at -O2
+        self._units = {}
+        # full path -> error of the files that do not translate
+        self._errors = {}
+        # (name, module text) -> ObjectFile of the modules rewritten by the whole program passes at -O2
+        self._rewritten = {}
+        self._built = False
+
+    def build(self):
+        """
+        Brings the output up to date: translates the files that were added or changed since the last build,
+        forgets the removed ones and writes the output
+
+        Returns:
+            list: the files translated again, None when no file changed and nothing was written
+
+        Raises:
+            ValueError: when a file does not translate or the program does not link, the output is not written
+        """
+        vm_files = list_vm_files(self.input_path)
+        if not vm_files:
+            raise ValueError("No .vm file found in " + self.input_path)
+        changed = []
+        for file_path in vm_files:
+            stat = os.stat(file_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._signatures.get(file_path) != signature:
+                self._signatures[file_path] = signature
+                changed.append(file_path)
+        present = set(vm_files)
+        removed = [file_path for file_path in self._signatures if file_path not in present]
+        if self._built and not changed and not removed:
+            return None
+        # a program that does not translate or link is built again after the next change, not on every check
+        self._built = True
+        for file_path in removed:
+            del self._signatures[file_path]
+            self._units.pop(file_path, None)
+            self._errors.pop(file_path, None)
+        for file_path in changed:
+            self._errors.pop(file_path, None)
+            try:
+                self._units[file_path] = self._translate(file_path)
+            except ValueError as error:
+                self._units.pop(file_path, None)
+                self._errors[file_path] = "{0}: {1}".format(os.path.basename(file_path), error)
+        if self._errors:
+            raise ValueError("\n".join(self._errors[file_path] for file_path in vm_files if file_path in self._errors))
+        self._write(vm_files)
+        return changed
+
+    def _translate(self, file_path):
+        if self.options.get("optimize", 0) >= 2:
+            return Parser(file_path).module()
+        parts = [translate_chunk(chunk, self.options) for chunk in find_chunks(file_path, CHUNK_SIZE)]
+        return ObjectFile.join(parts) if len(parts) > 1 else parts[0]
+
+    def _objects(self, vm_files, bootstrap):
+        units = [self._units[file_path] for file_path in vm_files]
+        if self.options.get("optimize", 0) < 2:
+            return units
+        rewritten = {}
+        for module in optimize_program(units, bootstrap, self.options, verbose=False):
+            key = (module.name, module_text(module))
+            rewritten[key] = self._rewritten.get(key) or translate_module(module, self.options)
+        # only the modules of the current program are kept
+        self._rewritten = rewritten
+        return list(rewritten.values())
+
+    def _write(self, vm_files):
+        bootstrap = needs_bootstrap(vm_files)
+        objects = self._objects(vm_files, bootstrap)
+        source_map = self.options.get("source_map", False)
+        linker = Linker(False, source_map)
+        if self.output_format == "asm":
+            def write_asm(tmp_path):
+                with open(tmp_path, "w") as asm_file:
+                    linker.link(objects, asm_file, bootstrap)
+            _replace_file(self.output_path, write_asm)
+            if source_map:
+                with open(self.output_path) as asm_file:
+                    source_map = SourceMap.from_asm(asm_file)
+                _replace_file(source_map_path(self.output_path), source_map.save)
+        else:
+            assembler = Assembler()
+            linker.link(objects, assembler, bootstrap)
+            words = assembler.words()
+            _replace_file(self.output_path, lambda tmp_path: save_hack(words, tmp_path, self.output_format == "bin"))
+
+    def watch(self, stop=None):
+        """
+        Builds the program, then builds it again after every change until interrupted. Errors are printed and
+        the files are watched on, the next change builds again
+
+        Args:
+            stop (threading.Event): stop watching when it is set, e.g. when running in a thread
+        """
+        self._build_and_report()
+        inotify = _Inotify.open(os.path.dirname(os.path.abspath(self.input_path))
+                                if os.path.isfile(self.input_path) else self.input_path)
+        if self.verbose:
+            print("Watching {0} ({1}), press Ctrl+C to stop".format(
+                self.input_path, "inotify" if inotify is not None else "polling"))
+        try:
+            while stop is None or not stop.is_set():
+                if inotify is not None:
+                    if not inotify.wait(self.interval if stop is not None else None):
+                        continue
+                    # the files of one compiler run are written one after another, wait for the rest
+                    while inotify.wait(_SETTLE):
+                        pass
+                else:
+                    time.sleep(self.interval)
+                self._build_and_report()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _build_and_report(self):
+        start = time.perf_counter()
+        try:
+            changed = self.build()
+        except (OSError, ValueError) as error:
+            print("VMTranslator: " + str(error), file=sys.stderr)
+            return
+        if self.verbose and changed is not None:
+            print("Translated {0} file(s) in {1:.0f} ms: {2}".format(
+                len(changed), 1000 * (time.perf_counter() - start),
+                ", ".join(os.path.basename(file_path) for file_path in changed) or "(files removed)"))
+
+
+def _replace_file(path, write):
+    """
+    Calls write with a temporary path in the folder of path, then renames the file written to path
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _Inotify:
+    """
+    inotify watch of a folder through ctypes, that only reports the events of .vm files
+    """
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self.fd = fd
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Returns:
+            _Inotify: a watch of directory, None when inotify is not available, e.g. on Windows and macOS
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), _IN_EVENTS) < 0:
+            os.close(fd)
+            return None
+        return cls(libc, fd)
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds, None for ever, for events
+
+        Returns:
+            bool: a .vm file of the folder changed
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _IN_EVENT_HEADER.unpack_from(data, offset)
+                offset += _IN_EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                changed = changed or name.endswith(b".vm")
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,55 @@
+"""
+Gain of the fused compare-and-branch on the loop-heavy programs of benchmarks/programs: every program is
+translated with the expressions of -O1, once with eq|gt|lt [not] if-goto making a boolean on the stack and once
+with the single conditional jump, then run on the emulator.
+
+usage: python benchmarks/bench_branches.py
+"""
+import io
+import os
+import sys
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from bench_emulator import MAX_CYCLES, PROGRAMS_DIR, RESULTS
+from Codewriter import Codewriter
+from Emulator import Emulator
+from Expressions import match_branch
+from Linker import Linker, ObjectFile
+from Parser import Parser
+from VMTranslator import list_vm_files, needs_bootstrap
+
+
+def measure(program, branches):
+    vm_files = list_vm_files(os.path.join(PROGRAMS_DIR, program))
+    objects = []
+    n_branches = 0
+    for file_path in vm_files:
+        module = Parser(file_path).module()
+        n_branches += sum(match_branch(module.commands, i) is not None for i in range(len(module.commands)))
+        cw = Codewriter(verbose=False, label_namespace=module.name, expressions=True, branches=branches)
+        cw.set_file_name(module.name + ".vm")
+        cw.write_commands(module.commands)
+        objects.append(ObjectFile.from_codewriter(module.name, cw))
+    asm_file = io.StringIO()
+    rom = Linker(verbose=False).link(objects, asm_file, needs_bootstrap(vm_files))
+    emulator = Emulator.from_asm(asm_file.getvalue().split("\n"))
+    emulator.run(MAX_CYCLES)
+    if emulator.ram[5] != RESULTS[program]:
+        raise SystemExit("{0} returned {1}, expected {2}".format(program, emulator.ram[5], RESULTS[program]))
+    return rom, emulator.cycles, n_branches
+
+
+def main():
+    print("{0:10} {1:>8} {2:>12} {3:>12} {4:>7} {5:>9} {6:>9}".format(
+        "program", "branches", "stack", "fused", "speedup", "stack ROM", "fused ROM"))
+    for program in sorted(RESULTS):
+        rom, cycles, n_branches = measure(program, False)
+        fused_rom, fused_cycles, _ = measure(program, True)
+        print("{0:10} {1:8} {2:12,} {3:12,} {4:6.2f}x {5:9} {6:9}".format(
+            program, n_branches, cycles, fused_cycles, cycles / fused_cycles, rom, fused_rom))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+End-to-end build time from .vm files to a .hack file: translating to .asm and then assembling the .asm file,
+against --format hack, where the Codewriter and the Linker feed the in-process Assembler and no asm text is
+written or parsed again. Both builds must produce the same machine code.
+
+usage: python benchmarks/bench_build.py [n_files] [lines_per_file] [repeat]
+"""
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Assembler import Assembler, save_hack
+from VMTranslator import translate
+from vmgen import generate_module
+
+MODES = {
+    "default": {},
+    "stream": {"stream": True},
+    "O1": {"optimize": 1},
+}
+
+
+def build_through_asm(program_dir, hack_path, options):
+    asm_path = translate(program_dir, os.path.splitext(hack_path)[0] + ".asm", verbose=False, **options)
+    with open(asm_path) as asm_file:
+        save_hack(Assembler().assemble(asm_file), hack_path)
+
+
+def build_direct(program_dir, hack_path, options):
+    translate(program_dir, hack_path, verbose=False, output_format="hack", **options)
+
+
+def best_time(build, program_dir, hack_path, options, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(program_dir, hack_path, options)
+        best = min(best, time.perf_counter() - start)
+    with open(hack_path) as hack_file:
+        return best, hack_file.read()
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    lines_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = os.path.join(tmp, "Program")
+        os.makedirs(program_dir)
+        for i in range(n_files):
+            with open(os.path.join(program_dir, "Class{0}.vm".format(i)), "w") as vm_file:
+                vm_file.write(generate_module("Class" + str(i), lines_per_file, seed=i))
+        print("{0} files x {1} lines, best of {2}".format(n_files, lines_per_file, repeat))
+        print("{0:8} {1:>10} {2:>10} {3:>8}".format("mode", "via asm", "direct", "speedup"))
+        for mode, options in MODES.items():
+            asm_seconds, expected = best_time(build_through_asm, program_dir, os.path.join(tmp, "asm.hack"),
+                                              options, repeat)
+            direct_seconds, actual = best_time(build_direct, program_dir, os.path.join(tmp, "direct.hack"),
+                                               options, repeat)
+            print("{0:8} {1:9.3f}s {2:9.3f}s {3:7.2f}x".format(mode, asm_seconds, direct_seconds,
+                                                               asm_seconds / direct_seconds))
+            if actual != expected:
+                print("MISMATCH {0}: the direct build differs from the assembled .asm file".format(mode))
+                failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Rebuild time with the incremental translation cache after editing one file of a large program.
+
+usage: python benchmarks/bench_cache.py [n_files] [lines_per_file]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VMTranslator import translate
+from vmgen import generate_module
+
+
+def timed_build(vm_dir, asm_path, cache_dir):
+    start = time.perf_counter()
+    translate(vm_dir, asm_path, verbose=False, cache_dir=cache_dir)
+    return time.perf_counter() - start
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    lines_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_dir = os.path.join(tmp, "Prog")
+        os.mkdir(vm_dir)
+        for i in range(n_files):
+            with open(os.path.join(vm_dir, "Class{0}.vm".format(i)), "w") as vm_file:
+                vm_file.write(generate_module("Class" + str(i), lines_per_file, seed=i))
+        asm_path = os.path.join(tmp, "Prog.asm")
+        cache_dir = os.path.join(tmp, "cache")
+
+        start = time.perf_counter()
+        translate(vm_dir, asm_path, verbose=False)
+        print("no cache          {0:8.3f}s".format(time.perf_counter() - start))
+        print("cold cache        {0:8.3f}s".format(timed_build(vm_dir, asm_path, cache_dir)))
+        print("warm, no change   {0:8.3f}s".format(timed_build(vm_dir, asm_path, cache_dir)))
+        with open(os.path.join(vm_dir, "Class0.vm"), "a") as vm_file:
+            vm_file.write("push constant 1\npop temp 0\n")
+        print("one file edited   {0:8.3f}s".format(timed_build(vm_dir, asm_path, cache_dir)))
+
+
+if __name__ == "__main__":
+    main()
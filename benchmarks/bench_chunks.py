@@ -0,0 +1,59 @@
+"""
+Translation time of a single large .vm file in parallel mode with 1 to max_jobs workers. The file is split into
+function-aligned chunks of VMTranslator.CHUNK_SIZE bytes, so the workers share it; every run must give the same
+output.
+
+usage: python benchmarks/bench_chunks.py [lines] [max_jobs] [repeat]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Parser import find_chunks
+from VMTranslator import CHUNK_SIZE, translate
+from vmgen import generate_module
+
+
+def best_time(program_dir, asm_path, jobs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        translate(program_dir, asm_path, verbose=False, jobs=jobs)
+        best = min(best, time.perf_counter() - start)
+    with open(asm_path, "rb") as asm_file:
+        return best, hashlib.sha256(asm_file.read()).hexdigest()
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    max_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = os.path.join(tmp, "Program")
+        os.makedirs(program_dir)
+        vm_path = os.path.join(program_dir, "Big.vm")
+        with open(vm_path, "w") as vm_file:
+            vm_file.write(generate_module("Big", lines))
+        print("{0} lines, {1:.1f} MB, {2} chunks, {3} CPU(s), best of {4}".format(
+            lines, os.path.getsize(vm_path) / 2 ** 20, len(find_chunks(vm_path, CHUNK_SIZE)), os.cpu_count(),
+            repeat))
+        print("{0:>4} {1:>10} {2:>8}  {3}".format("jobs", "time", "speedup", "sha256"))
+        base = expected = None
+        for jobs in range(1, max_jobs + 1):
+            seconds, digest = best_time(program_dir, os.path.join(tmp, "out.asm"), jobs, repeat)
+            base = base or seconds
+            expected = expected or digest
+            print("{0:>4} {1:9.3f}s {2:7.2f}x  {3}".format(jobs, seconds, base / seconds, digest[:16]))
+            if digest != expected:
+                print("MISMATCH: the output of -j {0} differs from -j 1".format(jobs))
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
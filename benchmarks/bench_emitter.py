@@ -0,0 +1,67 @@
+"""
+Compares lines per second of the old queue.Queue code buffer with the Emitter used by Codewriter.
+
+usage: python benchmarks/bench_emitter.py [n_lines]
+"""
+import os
+import sys
+import tempfile
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Codewriter import Codewriter
+from VMTranslator import translateVM
+from vmgen import generate_module
+
+
+class _LineQueue(Queue):
+    # Codewriter appends the expanded templates with extend, one put per line on a Queue
+    def extend(self, lines):
+        for line in lines:
+            self.put(line)
+
+
+def _translate(vm_path, cw):
+    cw.set_file_name(os.path.basename(vm_path))
+    translateVM(vm_path, cw)
+
+
+def _write_queue(queue, asm_path):
+    # the per line drain loop used before the Emitter
+    with open(asm_path, "w") as asm_file:
+        while not queue.empty():
+            asm_file.write(queue.get() + "\n")
+
+
+def bench(vm_path, asm_path, use_queue):
+    cw = Codewriter(verbose=False)
+    if use_queue:
+        cw.code_writer_queue = _LineQueue()
+    start = time.perf_counter()
+    _translate(vm_path, cw)
+    n_lines = cw.get_queue().qsize()
+    if use_queue:
+        _write_queue(cw.get_queue(), asm_path)
+    else:
+        with open(asm_path, "w") as asm_file:
+            cw.get_queue().flush(asm_file)
+    return n_lines, time.perf_counter() - start
+
+
+def main():
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_path = os.path.join(tmp, "Bench.vm")
+        with open(vm_path, "w") as vm_file:
+            vm_file.write(generate_module("Bench", n_lines))
+        asm_path = os.path.join(tmp, "Bench.asm")
+        for name, use_queue in (("queue.Queue", True), ("Emitter", False)):
+            asm_lines, seconds = bench(vm_path, asm_path, use_queue)
+            print("{0:12} {1:>9} asm lines {2:8.3f}s {3:>12,.0f} lines/s".format(
+                name, asm_lines, seconds, asm_lines / seconds))
+
+
+if __name__ == "__main__":
+    main()
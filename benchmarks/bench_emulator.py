@@ -0,0 +1,97 @@
+"""
+Speed of the generated code: translates every program of benchmarks/programs in every mode, runs it on the
+emulator and reports ROM size, executed instructions and stack high water mark.
+
+With --check the results are compared with benchmarks/baselines/emulator.json and the script exits with
+status 1 when a program returns a wrong result or got bigger, slower or uses more stack. Run it on every build.
+--update rewrites the baselines after an intended change.
+
+usage: python benchmarks/bench_emulator.py [--check | --update]
+"""
+import json
+import os
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Emulator import Emulator
+from Linker import count_instructions
+from VMTranslator import translate
+
+PROGRAMS_DIR = os.path.join(BENCHMARKS, "programs")
+BASELINES_PATH = os.path.join(BENCHMARKS, "baselines", "emulator.json")
+
+# expected value of RAM[5] (temp 0) when every program halts
+RESULTS = {"Fib": 1597, "Multiply": 6084, "Sort": 29, "Points": 6680}
+
+# options of translate for every mode
+MODES = {
+    "default": {},
+    "O1": {"optimize": 1},
+    "O2": {"optimize": 2},
+    "compact": {"compact": True},
+    "tos": {"tos": True},
+    "O2-tos": {"optimize": 2, "tos": True},
+}
+
+MAX_CYCLES = 50 * 1000 * 1000
+
+
+def measure(program, options, tmp):
+    asm_path = os.path.join(tmp, program + ".asm")
+    translate(os.path.join(PROGRAMS_DIR, program), asm_path, verbose=False, **options)
+    with open(asm_path) as asm_file:
+        asm_lines = asm_file.readlines()
+    emulator = Emulator.from_asm(asm_lines)
+    emulator.run(MAX_CYCLES)
+    return {"rom": count_instructions(asm_lines), "cycles": emulator.cycles,
+            "stack_high_water": emulator.stack_high_water, "result": emulator.ram[5],
+            "halted": emulator.halted, "wall_time": emulator.wall_time}
+
+
+def main():
+    check = "--check" in sys.argv[1:]
+    update = "--update" in sys.argv[1:]
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    failures = []
+    new_baselines = {}
+    print("{0:10} {1:8} {2:>7} {3:>12} {4:>6} {5:>9} {6:>12}".format(
+        "program", "mode", "ROM", "cycles", "stack", "wall", "instr/s"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for program in sorted(RESULTS):
+            for mode, options in MODES.items():
+                result = measure(program, options, tmp)
+                print("{0:10} {1:8} {2:7} {3:12,} {4:6} {5:8.3f}s {6:12,.0f}".format(
+                    program, mode, result["rom"], result["cycles"], result["stack_high_water"],
+                    result["wall_time"], result["cycles"] / max(result["wall_time"], 1e-9)))
+                name = program + "/" + mode
+                if not result["halted"] or result["result"] != RESULTS[program]:
+                    failures.append("{0}: returned {1}, expected {2}".format(name, result["result"],
+                                                                            RESULTS[program]))
+                new_baselines[name] = {key: result[key] for key in ("rom", "cycles", "stack_high_water")}
+                baseline = baselines.get(name)
+                if check and baseline is not None:
+                    for key, value in new_baselines[name].items():
+                        if value > baseline[key]:
+                            failures.append("{0}: {1} went up from {2} to {3}".format(
+                                name, key, baseline[key], value))
+
+    if update:
+        os.makedirs(os.path.dirname(BASELINES_PATH), exist_ok=True)
+        with open(BASELINES_PATH, "w") as baselines_file:
+            json.dump(new_baselines, baselines_file, indent=2, sort_keys=True)
+            baselines_file.write("\n")
+        print("Updated " + BASELINES_PATH)
+    for failure in failures:
+        print("REGRESSION " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
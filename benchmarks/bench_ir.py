@@ -0,0 +1,50 @@
+"""
+Parse throughput and memory per command of the IR produced by Parser.module().
+
+usage: python benchmarks/bench_ir.py [n_lines]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Codewriter import Codewriter
+from Parser import Parser
+from vmgen import generate_module
+
+
+def main():
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_path = os.path.join(tmp, "Bench.vm")
+        with open(vm_path, "w") as vm_file:
+            vm_file.write(generate_module("Bench", n_lines))
+
+        start = time.perf_counter()
+        module = Parser(vm_path).module()
+        parse_seconds = time.perf_counter() - start
+        n_commands = len(module.commands)
+
+        tracemalloc.start()
+        module = Parser(vm_path).module()
+        ir_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        cw = Codewriter(verbose=False)
+        cw.set_file_name("Bench.vm")
+        start = time.perf_counter()
+        for command in module.commands:
+            cw.write_command(command)
+        codegen_seconds = time.perf_counter() - start
+
+    print("commands          {0:>12,}".format(n_commands))
+    print("parse             {0:>12,.0f} commands/s".format(n_commands / parse_seconds))
+    print("IR memory         {0:>12.1f} bytes/command".format(ir_bytes / n_commands))
+    print("code generation   {0:>12,.0f} commands/s".format(n_commands / codegen_seconds))
+
+
+if __name__ == "__main__":
+    main()
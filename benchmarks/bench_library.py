@@ -0,0 +1,72 @@
+"""
+Request rate of the in-memory library API (Translator) on many small programs, the load of a build server,
+against writing every program to a temporary folder and translating it with VMTranslator.translate. The same
+Translator is then shared by a pool of threads; every result must be the same as the sequential one.
+
+usage: python benchmarks/bench_library.py [n_programs] [commands_per_program] [max_threads]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Translator import Translator
+from VMTranslator import translate
+from vmgen import generate_program
+
+
+def through_files(programs, tmp):
+    results = []
+    for i, program in enumerate(programs):
+        program_dir = os.path.join(tmp, "Program" + str(i))
+        os.makedirs(program_dir)
+        for name, source in program.items():
+            with open(os.path.join(program_dir, name + ".vm"), "w") as vm_file:
+                vm_file.write(source)
+        asm_path = translate(program_dir, os.path.join(tmp, "Program{0}.asm".format(i)), verbose=False, jobs=1)
+        with open(asm_path) as asm_file:
+            results.append(asm_file.read())
+    return results
+
+
+def main():
+    n_programs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    commands = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    max_threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    # sorted by name like the files of a folder, so both translations link the modules in the same order
+    programs = [{name[:-3]: source for name, source in sorted(generate_program(commands, seed=i).items())}
+                for i in range(n_programs)]
+    print("{0} programs of about {1} commands, {2} CPU(s)".format(n_programs, commands, os.cpu_count()))
+    print("{0:20} {1:>9} {2:>12} {3:>12}".format("mode", "time", "requests/s", "ms/request"))
+
+    def report(mode, seconds):
+        print("{0:20} {1:8.3f}s {2:12,.0f} {3:12.3f}".format(mode, seconds, n_programs / seconds,
+                                                             1000 * seconds / n_programs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        expected = through_files(programs, tmp)
+        report("files + translate", time.perf_counter() - start)
+
+    translator = Translator()
+    start = time.perf_counter()
+    results = [translator.translate(program) for program in programs]
+    report("Translator", time.perf_counter() - start)
+    failures = int(results != expected)
+    for threads in range(2, max_threads + 1):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            shared = list(executor.map(translator.translate, programs))
+            report("Translator {0} threads".format(threads), time.perf_counter() - start)
+        failures += shared != results
+    if failures:
+        print("MISMATCH: the in-memory translations differ from the translated files")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
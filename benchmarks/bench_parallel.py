@@ -0,0 +1,41 @@
+"""
+Scaling of parallel mode (VMTranslator -j) with the number of worker processes.
+
+usage: python benchmarks/bench_parallel.py [n_files] [lines_per_file] [max_workers]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VMTranslator import list_vm_files, translate_parallel
+from vmgen import generate_module
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    lines_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(n_files):
+            with open(os.path.join(tmp, "Class{0}.vm".format(i)), "w") as vm_file:
+                vm_file.write(generate_module("Class" + str(i), lines_per_file, seed=i))
+        vm_files = list_vm_files(tmp)
+        asm_path = os.path.join(tmp, "out.asm")
+        base = None
+        for workers in range(1, max_workers + 1):
+            start = time.perf_counter()
+            translate_parallel(vm_files, asm_path, workers, verbose=False)
+            seconds = time.perf_counter() - start
+            with open(asm_path, "rb") as asm_file:
+                digest = hashlib.sha256(asm_file.read()).hexdigest()[:12]
+            base = base or seconds
+            print("{0:3} workers {1:8.3f}s  speedup {2:5.2f}x  sha256 {3}".format(
+                workers, seconds, base / seconds, digest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Cold start timing of the command line translator.
+
+Every sample starts a fresh interpreter, so it includes interpreter startup and module imports.
+The tkinter line shows what the Tk import used to add to every call.
+
+usage: python benchmarks/bench_startup.py [repeat]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cold_start(args, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        vm_path = os.path.join(tmp, "Main.vm")
+        with open(vm_path, "w") as vm_file:
+            vm_file.write("function Main.main 0\npush constant 7\npush constant 8\nadd\nreturn\n")
+        cases = [
+            ("python -c pass", ["-c", "pass"]),
+            ("import tkinter", ["-c", "import tkinter"]),
+            ("import VMTranslator", ["-c", "import VMTranslator"]),
+            ("VMTranslator.py Main.vm", ["VMTranslator.py", "-q", vm_path]),
+        ]
+        for name, args in cases:
+            print("{0:28} {1:8.1f} ms".format(name, cold_start(args, repeat) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Tail calls: a tail recursive Main.sum(n, acc) (call Main.sum 2 / return) is run on the emulator at growing
+depths. Without -O1 every level pushes a frame, with -O1 the call reuses the frame of the caller, so the stack
+high water mark must stay the same at every depth. The script exits with status 1 when it does not or when
+a result is wrong.
+
+usage: python benchmarks/bench_tail_calls.py
+"""
+import os
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Emulator import Emulator
+from VMTranslator import translate
+
+DEPTHS = [10, 100, 1000, 4000]
+
+MODES = {
+    "default": {},
+    "O1": {"optimize": 1},
+    "O1-tos": {"optimize": 1, "tos": True},
+}
+
+# sum(n, acc) = sum(n - 1, acc + n), sum(0, acc) = acc
+MAIN = """function Main.sum 0
+push argument 0
+push constant 0
+eq
+if-goto BASE
+push argument 0
+push constant 1
+sub
+push argument 1
+push argument 0
+add
+call Main.sum 2
+return
+label BASE
+push argument 1
+return
+"""
+
+SYS = """function Sys.init 0
+push constant {0}
+push constant 0
+call Main.sum 2
+pop temp 0
+label HALT
+goto HALT
+"""
+
+
+def measure(depth, options, tmp):
+    program_dir = os.path.join(tmp, "Sum{0}".format(depth))
+    os.makedirs(program_dir, exist_ok=True)
+    with open(os.path.join(program_dir, "Main.vm"), "w") as vm_file:
+        vm_file.write(MAIN)
+    with open(os.path.join(program_dir, "Sys.vm"), "w") as vm_file:
+        vm_file.write(SYS.format(depth))
+    asm_path = translate(program_dir, os.path.join(tmp, "Sum.asm"), verbose=False, **options)
+    with open(asm_path) as asm_file:
+        emulator = Emulator.from_asm(asm_file)
+    emulator.run(10 * 1000 * 1000)
+    return emulator.ram[5], emulator.cycles, emulator.stack_high_water
+
+
+def main():
+    failures = []
+    print("{0:8} {1:>6} {2:>10} {3:>12} {4:>10}".format("mode", "depth", "result", "cycles", "stack"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, options in MODES.items():
+            high_waters = []
+            for depth in DEPTHS:
+                result, cycles, high_water = measure(depth, options, tmp)
+                expected = (depth * (depth + 1) // 2 + 32768) % 65536 - 32768
+                if result != expected:
+                    failures.append("{0}/{1}: returned {2}, expected {3}".format(mode, depth, result, expected))
+                high_waters.append(high_water)
+                print("{0:8} {1:6} {2:10} {3:12,} {4:10}".format(mode, depth, result, cycles, high_water))
+            if options.get("optimize") and len(set(high_waters)) > 1:
+                failures.append("{0}: the stack grows with the depth of the recursion".format(mode))
+    for failure in failures:
+        print("FAILURE " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Code generation time per command type, with the memoized templates of Templates.expand and with the cache
+bypassed (every command formats its template again).
+
+usage: python benchmarks/bench_templates.py [n_commands]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Codewriter as codewriter_module
+from Codewriter import Codewriter
+from IR import parse_command
+from Templates import expand
+
+# one representative command per command type. Offsets cycle through a few values like in real programs
+COMMANDS = [
+    "push constant {k}", "push local {k}", "push argument {k}", "push static {k}", "push temp {t}",
+    "push pointer {p}", "pop local {k}", "pop that {k}", "pop static {k}", "pop temp {t}",
+    "add", "sub", "neg", "not", "and", "or", "eq", "gt", "lt",
+    "label LOOP{k}", "goto LOOP{k}", "if-goto LOOP{k}", "function Main.f{k} 2", "call Main.f{k} 2", "return",
+]
+
+
+def time_command(text, n_commands):
+    commands = [parse_command(text.format(k=i % 8, t=i % 8, p=i % 2)) for i in range(n_commands)]
+    cw = Codewriter(verbose=False)
+    cw.set_file_name("Main.vm")
+    start = time.perf_counter()
+    for command in commands:
+        cw.write_command(command)
+    return (time.perf_counter() - start) / n_commands * 1e9
+
+
+def main():
+    n_commands = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print("{0:24} {1:>10} {2:>10} {3:>8}".format("command", "cached ns", "uncached", "speedup"))
+    for text in COMMANDS:
+        expand.cache_clear()
+        cached = time_command(text, n_commands)
+        codewriter_module.expand = expand.__wrapped__
+        try:
+            uncached = time_command(text, n_commands)
+        finally:
+            codewriter_module.expand = expand
+        name = " ".join(text.split()[:2]) if text.startswith(("push", "pop")) else text.split()[0]
+        print("{0:24} {1:10.0f} {2:10.0f} {3:7.2f}x".format(name, cached, uncached, uncached / cached))
+    print(expand.cache_info())
+
+
+if __name__ == "__main__":
+    main()
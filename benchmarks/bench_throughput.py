@@ -0,0 +1,145 @@
+"""
+Throughput and memory of the translator on realistic programs of 10K, 100K and 1M VM commands, see
+vmgen.generate_program, and on a program of 1M commands held in one large .vm file (1M-1file), where a cost per
+line that grows with the size of the file shows up. Three stages are measured apart:
+
+    parse      Parser, every file parsed into IR commands
+    codegen    Codewriter, the parsed commands translated into an Emitter
+    translate  the whole path of the command line: translateVM of every file and write_to_file of the .asm file
+
+For every stage and scale the script reports VM commands per second (best of repeat runs) and the peak memory
+allocated by Python during one run, measured with tracemalloc in a separate run so it does not slow the timed ones.
+
+With --check the results are compared with benchmarks/baselines/throughput.json and the script exits with
+status 1 when a stage got more than 25% slower or uses more than 10% more memory. Times depend on the machine:
+record the baselines with --update on the machine that runs the checks.
+
+usage: python benchmarks/bench_throughput.py [--check | --update] [--scales 10K,100K,1M,1M-1file] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Codewriter import Codewriter
+from Parser import Parser
+from VMTranslator import needs_bootstrap, translateVM, write_to_file
+from vmgen import write_program
+
+BASELINES_PATH = os.path.join(BENCHMARKS, "baselines", "throughput.json")
+
+# scale -> VM commands, classes besides Sys (None for one per 4000 commands)
+SCALES = {"10K": (10 * 1000, None), "100K": (100 * 1000, None), "1M": (1000 * 1000, None),
+          "1M-1file": (1000 * 1000, 1)}
+
+# largest slowdown and memory growth accepted by --check
+MAX_SLOWDOWN = 0.25
+MAX_MEMORY_GROWTH = 0.10
+
+
+def parse(vm_files, asm_path):
+    return [list(Parser(file_path).commands()) for file_path in vm_files]
+
+
+def codegen(vm_files, asm_path, parsed):
+    cw = Codewriter(verbose=False)
+    for file_path, commands in zip(vm_files, parsed):
+        cw.set_file_name(os.path.basename(file_path))
+        for cmd in commands:
+            cw.write_command(cmd)
+    return cw
+
+
+def translate(vm_files, asm_path):
+    cw = Codewriter(verbose=False)
+    if needs_bootstrap(vm_files):
+        cw.write_init()
+    for file_path in vm_files:
+        cw.set_file_name(os.path.basename(file_path))
+        translateVM(file_path, cw)
+    cw.write_shared_routines(cw.routine_calls, halt=not needs_bootstrap(vm_files))
+    write_to_file(cw.get_queue(), asm_path)
+
+
+def stage_runs(vm_files, asm_path):
+    """
+    (stage, function of no arguments) of every stage; codegen is given commands parsed beforehand
+    """
+    parsed = parse(vm_files, asm_path)
+    return [("parse", lambda: parse(vm_files, asm_path)),
+            ("codegen", lambda: codegen(vm_files, asm_path, parsed)),
+            ("translate", lambda: translate(vm_files, asm_path))]
+
+
+def measure(run, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Translator throughput and memory benchmark")
+    arg_parser.add_argument("--check", action="store_true", help="compare with the baselines")
+    arg_parser.add_argument("--update", action="store_true", help="record the results as the new baselines")
+    arg_parser.add_argument("--scales", default=",".join(SCALES), help="comma separated scales, e.g. 10K,1M-1file")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="timed runs of every stage, the best is kept")
+    args = arg_parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+    new_baselines = dict(baselines)
+    failures = []
+    print("{0:8} {1:10} {2:>9} {3:>10} {4:>14} {5:>10}".format(
+        "scale", "stage", "commands", "time", "commands/s", "peak MB"))
+    for scale in args.scales.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            vm_files = write_program(os.path.join(tmp, "Program"), *SCALES[scale])
+            asm_path = os.path.join(tmp, "Program.asm")
+            n_commands = 0
+            for file_path in vm_files:
+                with open(file_path) as vm_file:
+                    n_commands += sum(1 for _ in vm_file)
+            for stage, run in stage_runs(vm_files, asm_path):
+                seconds, peak = measure(run, args.repeat)
+                result = {"commands_per_second": round(n_commands / seconds), "peak_mb": round(peak / 2 ** 20, 2)}
+                print("{0:8} {1:10} {2:9,} {3:9.3f}s {4:14,} {5:10.2f}".format(
+                    scale, stage, n_commands, seconds, result["commands_per_second"], result["peak_mb"]))
+                name = stage + "/" + scale
+                new_baselines[name] = result
+                baseline = baselines.get(name)
+                if args.check and baseline is not None:
+                    if result["commands_per_second"] < baseline["commands_per_second"] * (1 - MAX_SLOWDOWN):
+                        failures.append("{0}: commands/s went down from {1:,} to {2:,}".format(
+                            name, baseline["commands_per_second"], result["commands_per_second"]))
+                    if result["peak_mb"] > baseline["peak_mb"] * (1 + MAX_MEMORY_GROWTH):
+                        failures.append("{0}: peak memory went up from {1} MB to {2} MB".format(
+                            name, baseline["peak_mb"], result["peak_mb"]))
+
+    if args.update:
+        os.makedirs(os.path.dirname(BASELINES_PATH), exist_ok=True)
+        with open(BASELINES_PATH, "w") as baselines_file:
+            json.dump(new_baselines, baselines_file, indent=2, sort_keys=True)
+            baselines_file.write("\n")
+        print("Updated " + BASELINES_PATH)
+    for failure in failures:
+        print("REGRESSION " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Turnaround of watch mode: the time from saving one .vm file of a large program to the new output file being in
+place, against running the command line again, which starts the interpreter and translates every file. The output
+of watch mode must be the same as that of a full translation.
+
+usage: python benchmarks/bench_watch.py [commands] [n_files] [n_saves]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+from VMTranslator import translate
+from Watcher import Watcher
+from vmgen import write_program
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    n_files = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    n_saves = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = os.path.join(tmp, "Program")
+        vm_files = write_program(program_dir, commands, n_files)
+        asm_path = os.path.join(tmp, "Program.asm")
+        print("{0} commands in {1} files".format(commands, len(vm_files)))
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "VMTranslator.py"), program_dir, "-q", "-j", "1",
+                        "-o", os.path.join(tmp, "cli.asm")], check=True)
+        print("command line run:    {0:8.0f} ms".format(1000 * (time.perf_counter() - start)))
+
+        watcher = Watcher(program_dir, asm_path, verbose=False)
+        stop = threading.Event()
+        thread = threading.Thread(target=watcher.watch, args=(stop,))
+        thread.start()
+        while not os.path.exists(asm_path):
+            time.sleep(0.01)
+        turnarounds = []
+        for i in range(n_saves):
+            vm_path = vm_files[i % len(vm_files)]
+            with open(vm_path) as vm_file:
+                source = vm_file.read()
+            before = os.stat(asm_path).st_mtime_ns
+            start = time.perf_counter()
+            with open(vm_path, "w") as vm_file:
+                vm_file.write(source + "push constant {0}\npop temp 0\n".format(i))
+            while os.stat(asm_path).st_mtime_ns == before:
+                time.sleep(0.001)
+            turnarounds.append(time.perf_counter() - start)
+            # let the next save be a separate change
+            time.sleep(0.2)
+        stop.set()
+        thread.join()
+        turnarounds.sort()
+        print("watch mode, save:    {0:8.0f} ms median, {1:.0f} ms worst".format(
+            1000 * turnarounds[len(turnarounds) // 2], 1000 * turnarounds[-1]))
+
+        translate(program_dir, os.path.join(tmp, "full.asm"), verbose=False, jobs=1)
+        with open(asm_path) as watched, open(os.path.join(tmp, "full.asm")) as full:
+            if watched.read() != full.read():
+                print("MISMATCH: the output of watch mode differs from a full translation")
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
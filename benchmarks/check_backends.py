@@ -0,0 +1,177 @@
+"""
+Equivalence check of the code generation backends: every program of benchmarks/programs and a set of random
+programs (functions, calls, loops, branches, every segment) are translated with the default backend and with
+--tos, in every optimization mode, and run on the emulator. The two runs must halt with the same RAM: SP,
+the segment pointers, temp, the static variables, the stack and the heap. R13-R15 are the scratch registers of
+the generated code and are not compared.
+
+Every mode must also end like the plain -O0 code of the default backend, so a miscompile of -O1, -O2 or --compact
+that --tos shares is found too. At -O2 the locals the inliner adds to Sys.init are not compared.
+
+usage: python benchmarks/check_backends.py [n_random_programs]
+"""
+import os
+import random
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from bench_emulator import PROGRAMS_DIR, RESULTS
+from Assembler import Assembler
+from Emulator import Emulator
+from VMTranslator import translate
+
+# (name, options of the default backend); the tos backend adds tos=True
+MODES = [
+    ("default", {}),
+    ("O1", {"optimize": 1}),
+    ("O2", {"optimize": 2}),
+    ("compact", {"compact": True}),
+]
+
+MAX_CYCLES = 10 * 1000 * 1000
+HEAP = (2048, 16384)
+# the stack of Sys.init starts above its frame, which the bootstrap code pushes at 256
+STACK_START = 261
+
+
+def _expression(rng, n_args, n_locals, depth=0):
+    segments = ["constant", "static", "temp", "this", "that"]
+    segments += ["argument"] * (n_args > 0) + ["local"] * (n_locals > 0)
+    if depth > 2 or rng.random() < 0.4:
+        segment = rng.choice(segments)
+        offset = {"constant": rng.choice([0, 1, 2, 7, 255, 20000, 32767]), "static": rng.randint(0, 3),
+                  "temp": rng.randint(1, 7), "this": rng.randint(0, 4), "that": rng.randint(0, 4),
+                  "argument": rng.randrange(max(n_args, 1)), "local": rng.randrange(max(n_locals, 1))}[segment]
+        return ["push {0} {1}".format(segment, offset)]
+    if rng.random() < 0.2:
+        return _expression(rng, n_args, n_locals, depth + 1) + [rng.choice(["neg", "not"])]
+    return (_expression(rng, n_args, n_locals, depth + 1) + _expression(rng, n_args, n_locals, depth + 1)
+            + [rng.choice(["add", "sub", "and", "or", "eq", "gt", "lt"])])
+
+
+def _statement(rng, n_args, n_locals, callees, label):
+    kind = rng.random()
+    if kind < 0.4:
+        segments = ["static", "temp", "this", "that"] + ["local"] * (n_locals > 0)
+        segment = rng.choice(segments)
+        offset = {"static": rng.randint(0, 3), "temp": rng.randint(1, 7), "this": rng.randint(0, 4),
+                  "that": rng.randint(0, 4), "local": rng.randrange(max(n_locals, 1))}[segment]
+        return _expression(rng, n_args, n_locals) + ["pop {0} {1}".format(segment, offset)]
+    if kind < 0.6 and callees:
+        name, callee_args = rng.choice(callees)
+        code = []
+        for _ in range(callee_args):
+            code += _expression(rng, n_args, n_locals)
+        return code + ["call {0} {1}".format(name, callee_args), "pop temp {0}".format(rng.randint(1, 7))]
+    if kind < 0.8:
+        # if: forward branch
+        condition = _expression(rng, n_args, n_locals) + (["not"] if rng.random() < 0.5 else [])
+        return (condition + ["if-goto SKIP" + label] + _expression(rng, n_args, n_locals)
+                + ["pop temp {0}".format(rng.randint(1, 7)), "label SKIP" + label])
+    # bounded loop on temp 0
+    return (["push constant {0}".format(rng.randint(1, 4)), "pop temp 0", "label LOOP" + label,
+             "push temp 0", "push constant 0", "eq", "if-goto END" + label]
+            + _expression(rng, n_args, n_locals) + ["push that 1", "add", "pop that 1",
+                                                    "push temp 0", "push constant 1", "sub", "pop temp 0",
+                                                    "goto LOOP" + label, "label END" + label])
+
+
+def random_program(seed):
+    """
+    .vm files of a random program that always halts: Sys.init calls the functions of two classes, every function
+    only calls the functions defined before it
+
+    Returns:
+        dict: file name -> VM code
+    """
+    rng = random.Random(seed)
+    files = {"Foo.vm": [], "Bar.vm": []}
+    callees = []
+    for i in range(6):
+        class_name = rng.choice(["Foo", "Bar"])
+        name = "{0}.f{1}".format(class_name, i)
+        n_args, n_locals = rng.randint(0, 3), rng.randint(0, 3)
+        code = ["function {0} {1}".format(name, n_locals)]
+        for k in range(rng.randint(1, 4)):
+            code += _statement(rng, n_args, n_locals, callees, str(k))
+        code += _expression(rng, n_args, n_locals) + ["return"]
+        files[class_name + ".vm"] += code
+        callees.append((name, n_args))
+    code = ["function Sys.init 2", "push constant 3000", "pop pointer 0", "push constant 3100", "pop pointer 1"]
+    for k in range(6):
+        code += _statement(rng, 0, 2, callees, str(k))
+    files["Sys.vm"] = code + ["label HALT", "goto HALT"]
+    return {name: "\n".join(lines) + "\n" for name, lines in files.items()}
+
+
+def final_state(program_dir, options, tmp):
+    """
+    Whether the program halted, its registers SP ... temp 7, its static variables by name, the stack of Sys.init
+    and the heap. Statics are compared by name since the modes can give them different addresses, e.g. when -O2
+    removes the functions that used some of them
+    """
+    asm_path = translate(program_dir, os.path.join(tmp, "out.asm"), verbose=False, **options)
+    assembler = Assembler()
+    with open(asm_path) as asm_file:
+        emulator = Emulator(assembler.assemble(asm_file))
+    emulator.run(MAX_CYCLES)
+    ram = emulator.ram
+    statics = {symbol: ram[address] for symbol, address in assembler.symbols.items()
+               if symbol.rsplit(".", 1)[-1].isdigit() and 16 <= address < 256 and ram[address]}
+    return (emulator.halted, list(ram[0:13]), statics, list(ram[STACK_START:ram[0]]),
+            list(ram[HEAP[0]:HEAP[1]]))
+
+
+def _without_inlined_locals(state, reference):
+    """
+    state of an -O2 run with the locals that the inliner added to Sys.init dropped: they come after the locals of
+    the reference, so SP and the stack are cut down to those of the reference
+    """
+    halted, registers, statics, stack, heap = state
+    if registers[0] < reference[1][0]:
+        return state
+    return halted, reference[1][:1] + registers[1:], statics, stack[:len(reference[3])], heap
+
+
+def check(name, program_dir, tmp):
+    failures = []
+    # plain -O0 code, the reference of every other mode
+    reference = final_state(program_dir, {}, tmp)
+    for mode, options in MODES:
+        expected = final_state(program_dir, options, tmp) if options else reference
+        actual = final_state(program_dir, dict(options, tos=True), tmp)
+        inlined = options.get("optimize", 0) >= 2
+        if not expected[0]:
+            failures.append("{0}/{1}: does not halt".format(name, mode))
+        elif (_without_inlined_locals(expected, reference) if inlined else expected) != reference:
+            failures.append("{0}/{1}: ends with a different RAM than -O0".format(name, mode))
+        elif actual != expected:
+            failures.append("{0}/{1}: the tos backend ends with a different RAM".format(name, mode))
+    return failures
+
+
+def main():
+    n_random = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for program in sorted(RESULTS):
+            failures += check(program, os.path.join(PROGRAMS_DIR, program), tmp)
+        for seed in range(n_random):
+            program_dir = os.path.join(tmp, "random{0}".format(seed))
+            os.makedirs(program_dir)
+            for file_name, code in random_program(seed).items():
+                with open(os.path.join(program_dir, file_name), "w") as vm_file:
+                    vm_file.write(code)
+            failures += check("random{0}".format(seed), program_dir, tmp)
+    for failure in failures:
+        print("MISMATCH " + failure)
+    print("{0} program(s) x {1} mode(s) checked, {2} mismatch(es)".format(
+        len(RESULTS) + n_random, len(MODES), len(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Error reporting of the library API: modules with an invalid command or bytes that are not valid UTF-8 are
+translated with Translator at every optimization level, and every one must raise a TranslationError that names
+the module and the line of the problem. The script exits with status 1 when one does not.
+
+usage: python benchmarks/check_errors.py
+"""
+import os
+import sys
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from Translator import TranslationError, Translator
+
+SYS = "function Sys.init 0\ncall Main.main 0\npop temp 0\nlabel HALT\ngoto HALT\n"
+
+# (case, source of Main.vm, line of the error)
+CASES = [
+    ("not UTF-8", b"function Main.main 0\npush constant 1\n// caf\xe9\nreturn\n", 3),
+    ("first byte not UTF-8", b"\xff\nfunction Main.main 0\npush constant 1\nreturn\n", 1),
+    ("unknown segment", "function Main.main 0\npush banana 3\nreturn\n", 2),
+    ("too many words", "function Main.main 0\npush constant 1 2\nreturn\n", 2),
+    ("pop constant", "function Main.main 0\npush constant 1\npop constant 0\npush constant 0\nreturn\n", 3),
+    ("temp offset", "function Main.main 0\n\npush temp 8\nreturn\n", 3),
+    ("pointer offset", "function Main.main 0\npush constant 1\npop pointer 2\npush constant 0\nreturn\n", 3),
+]
+
+
+def main():
+    failures = []
+    for optimize in (0, 1, 2):
+        translator = Translator(optimize=optimize)
+        for case, source, line in CASES:
+            try:
+                translator.translate({"Main": source, "Sys": SYS})
+            except TranslationError as error:
+                if (error.module, error.line) != ("Main", line):
+                    failures.append("-O{0} {1}: reported at {2}:{3}, expected Main:{4}".format(
+                        optimize, case, error.module, error.line, line))
+            except Exception as error:
+                failures.append("-O{0} {1}: raised {2}: {3}".format(optimize, case, type(error).__name__, error))
+            else:
+                failures.append("-O{0} {1}: no error".format(optimize, case))
+    for failure in failures:
+        print("FAILED " + failure)
+    print("{0} case(s) x 3 optimization levels checked, {1} failure(s)".format(len(CASES), len(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
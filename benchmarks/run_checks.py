@@ -0,0 +1,48 @@
+"""
+Runs every check script of benchmarks/ one after another, the single entry point of the gates of a build. A check
+passes when its script exits with status 0; the script exits with status 1 when one of them failed.
+
+usage: python benchmarks/run_checks.py [name ...]
+"""
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+# (name, script and arguments) of every check
+CHECKS = [
+    ("parallel", ["bench_parallel.py"]),
+    ("cache", ["bench_cache.py"]),
+    ("emulator", ["bench_emulator.py", "--check"]),
+    ("backends", ["check_backends.py"]),
+    ("tail-calls", ["bench_tail_calls.py"]),
+    ("errors", ["check_errors.py"]),
+]
+
+
+def main():
+    names = sys.argv[1:]
+    unknown = [name for name in names if name not in dict(CHECKS)]
+    if unknown:
+        print("Unknown check(s): {0}, expected {1}".format(", ".join(unknown), ", ".join(dict(CHECKS))))
+        return 2
+    failures = []
+    for name, command in CHECKS:
+        if names and name not in names:
+            continue
+        print("== {0}: {1}".format(name, " ".join(command)), flush=True)
+        start = time.perf_counter()
+        status = subprocess.run([sys.executable, os.path.join(BENCHMARKS, command[0])] + command[1:]).returncode
+        print("== {0}: {1} in {2:.1f}s".format(name, "ok" if status == 0 else "FAILED (status {0})".format(status),
+                                              time.perf_counter() - start), flush=True)
+        if status != 0:
+            failures.append(name)
+    if failures:
+        print("FAILED: " + ", ".join(failures))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
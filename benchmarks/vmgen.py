@@ -0,0 +1,184 @@
+"""
+Generators of synthetic VM programs used by the benchmarks: generate_module writes one file of straight-line
+functions, generate_program a whole program of many classes with branches, loops and calls
+"""
+import os
+import random
+
+_SEGMENTS = ["local", "argument", "this", "that", "temp", "pointer", "static"]
+_ARITHMETIC = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
+# static variables of every generate_module file: the 240 of a program (see Linker.MAX_STATICS) are enough for
+# the 100 files of bench_cache.py
+_MODULE_STATICS = 2
+
+
+def generate_module(class_name, n_lines, seed=0):
+    """
+    Generate the source of one .vm file with roughly n_lines commands
+
+    Args:
+        class_name (str): name of the class, used as prefix of the function names
+        n_lines (int): approximate number of VM commands to generate
+        seed (int): seed of the random generator so the output is reproducible
+
+    Returns:
+        str: VM source code
+    """
+    rng = random.Random(seed)
+    lines = []
+    n_function = 0
+    while len(lines) < n_lines:
+        lines.append("function {0}.f{1} 2".format(class_name, n_function))
+        for _ in range(40):
+            lines.append("push constant " + str(rng.randint(0, 100)))
+            segment = rng.choice(_SEGMENTS)
+            if segment == "pointer":
+                offset = rng.randint(0, 1)
+            elif segment == "static":
+                offset = rng.randrange(_MODULE_STATICS)
+            else:
+                offset = rng.randint(0, 7)
+            lines.append("push {0} {1}".format(segment, offset))
+            lines.append(rng.choice(_ARITHMETIC))
+            lines.append("pop temp " + str(rng.randint(0, 7)))
+        lines.append("push constant 0")
+        lines.append("return")
+        n_function += 1
+    return "\n".join(lines) + "\n"
+
+
+def _gen_expression(rng, n_args, n_locals, depth=0):
+    # a term, or an operator applied to terms, in postfix order like the Jack compiler writes it
+    if depth >= 2 or rng.random() < 0.45:
+        kind = rng.random()
+        if kind < 0.3 or not (n_args or n_locals):
+            return ["push constant " + str(rng.choice([0, 1, 2, 10, rng.randint(0, 32767)]))]
+        if kind < 0.55 and n_locals:
+            return ["push local " + str(rng.randrange(n_locals))]
+        if kind < 0.7 and n_args:
+            return ["push argument " + str(rng.randrange(n_args))]
+        if kind < 0.8:
+            return ["push static " + str(rng.randint(0, 7))]
+        if kind < 0.9:
+            return ["push this " + str(rng.randint(0, 5))]
+        # array element: base + index, that 0
+        return (["push local " + str(rng.randrange(n_locals)) if n_locals else "push static 0"]
+                + _gen_expression(rng, n_args, n_locals, depth + 1) + ["add", "pop pointer 1", "push that 0"])
+    if rng.random() < 0.15:
+        return _gen_expression(rng, n_args, n_locals, depth + 1) + [rng.choice(["neg", "not"])]
+    return (_gen_expression(rng, n_args, n_locals, depth + 1) + _gen_expression(rng, n_args, n_locals, depth + 1)
+            + [rng.choice(["add", "add", "sub", "and", "or", "eq", "gt", "lt"])])
+
+
+def _gen_statement(rng, n_args, n_locals, functions, labels):
+    kind = rng.random()
+    if kind < 0.45:
+        # let: store into a variable, a field, temp or an array element
+        target = rng.random()
+        if target < 0.5 and n_locals:
+            store = ["pop local " + str(rng.randrange(n_locals))]
+        elif target < 0.65:
+            store = ["pop static " + str(rng.randint(0, 7))]
+        elif target < 0.8:
+            store = ["pop this " + str(rng.randint(0, 5))]
+        elif target < 0.9:
+            store = ["pop temp " + str(rng.randint(0, 7))]
+        else:
+            return (["push static 1", "push constant " + str(rng.randint(0, 9)), "add"]
+                    + _gen_expression(rng, n_args, n_locals) + ["pop temp 0", "pop pointer 1", "push temp 0",
+                                                                 "pop that 0"])
+        return _gen_expression(rng, n_args, n_locals) + store
+    if kind < 0.7:
+        # do: call a function and drop its value
+        name, callee_args = rng.choice(functions)
+        code = []
+        for _ in range(callee_args):
+            code += _gen_expression(rng, n_args, n_locals)
+        return code + ["call {0} {1}".format(name, callee_args), "pop temp 0"]
+    label = labels[0]
+    labels[0] += 1
+    if kind < 0.88:
+        # if / else
+        return (_gen_expression(rng, n_args, n_locals) + ["if-goto IF_TRUE{0}".format(label),
+                                                          "goto IF_FALSE{0}".format(label),
+                                                          "label IF_TRUE{0}".format(label)]
+                + _gen_expression(rng, n_args, n_locals) + ["pop local 0" if n_locals else "pop temp 1",
+                                                            "goto IF_END{0}".format(label),
+                                                            "label IF_FALSE{0}".format(label)]
+                + _gen_expression(rng, n_args, n_locals) + ["pop temp 1", "label IF_END{0}".format(label)])
+    # while
+    return (["label WHILE_EXP{0}".format(label)] + _gen_expression(rng, n_args, n_locals)
+            + ["not", "if-goto WHILE_END{0}".format(label)] + _gen_expression(rng, n_args, n_locals)
+            + ["pop temp 2", "goto WHILE_EXP{0}".format(label), "label WHILE_END{0}".format(label)])
+
+
+def generate_program(n_lines, n_files=None, seed=0):
+    """
+    Generate a whole program in the style of the Jack compiler output: classes of functions, constructors and
+    methods with local variables, let/do/if/while statements, array accesses and calls between the classes. Every
+    segment, arithmetic command and branching command is used. The program is meant to be translated, not run:
+    the loops do not always terminate
+
+    Args:
+        n_lines (int): approximate number of VM commands of the program
+        n_files (int): number of classes besides Sys, by default one per 4000 commands
+        seed (int): seed of the random generator so the output is reproducible
+
+    Returns:
+        dict: file name -> VM source code, with a Sys.vm whose Sys.init calls Main.main
+    """
+    rng = random.Random(seed)
+    n_files = n_files or max(1, n_lines // 4000)
+    class_names = ["Main"] + ["Class" + str(i) for i in range(1, n_files)]
+    per_class = max(1, n_lines // n_files)
+    # (name, number of arguments) of every function, about 55 commands each, so calls can go anywhere
+    classes = {}
+    functions = []
+    for class_name in class_names:
+        classes[class_name] = [("{0}.{1}{2}".format(class_name, rng.choice(["get", "set", "run", "new"]), i),
+                                rng.randint(0, 3)) for i in range(max(1, per_class // 55))]
+        functions.extend(classes[class_name])
+    classes["Main"][0] = ("Main.main", 0)
+    functions[0] = ("Main.main", 0)
+
+    files = {"Sys.vm": "function Sys.init 0\ncall Main.main 0\npop temp 0\nlabel HALT\ngoto HALT\n"}
+    for class_name in class_names:
+        lines = []
+        for name, n_args in classes[class_name]:
+            n_locals = rng.randint(0, 4)
+            lines.append("function {0} {1}".format(name, n_locals))
+            if n_args and rng.random() < 0.6:
+                # method: this = argument 0
+                lines += ["push argument 0", "pop pointer 0"]
+            elif ".new" in name:
+                # constructor: allocate the object
+                lines += ["push constant " + str(rng.randint(1, 6)), "call Memory.alloc 1", "pop pointer 0"]
+            labels = [0]
+            body_end = len(lines) + rng.randint(20, 60)
+            while len(lines) < body_end:
+                lines += _gen_statement(rng, n_args, n_locals, functions, labels)
+            if ".new" in name:
+                lines += ["push pointer 0", "return"]
+            else:
+                lines += _gen_expression(rng, n_args, n_locals) + ["return"]
+        files[class_name + ".vm"] = "\n".join(lines) + "\n"
+    # the OS function the constructors call
+    files["Memory.vm"] = ("function Memory.alloc 0\npush static 0\npush argument 0\nadd\npop static 0\n"
+                          "push static 0\nreturn\n")
+    return files
+
+
+def write_program(directory, n_lines, n_files=None, seed=0):
+    """
+    Write the files of generate_program into directory
+
+    Returns:
+        list: full paths of the .vm files written, sorted
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for file_name, source in generate_program(n_lines, n_files, seed).items():
+        paths.append(os.path.join(directory, file_name))
+        with open(paths[-1], "w") as vm_file:
+            vm_file.write(source)
+    return sorted(paths)